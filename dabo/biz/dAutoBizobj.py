@@ -231,6 +231,8 @@ class dAutoBizobj(dBizobj):
 
 				if fld.DataType == "Stamp":
 					self.NonUpdateFields = self.NonUpdateFields + [fld.Name]
+			# The field types were changed in place.
+			self._CurrentCursor._fieldDescriptors = None
 
 		self.afterInit()
 
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 import types
 import re
+import sys
 import warnings
 import time
+import threading
+from collections import OrderedDict
 import dabo
 import dabo.dConstants as kons
 from dabo.db.dCursorMixin import dCursorMixin
@@ -16,6 +19,18 @@ from dabo.lib.RemoteConnector import RemoteConnector
 NO_RECORDS_PK = "75426755-2f32-4d3d-86b6-9e2a1ec47f2c"	## Can't use None
 # To filter logging noise in scan methods, identify the redundant exceptions.
 _scanExceptionId = None
+# Functions compiled from the expressions passed to replace(), keyed on the
+# expression and the field names.
+_maxCachedExpressions = 200
+_expressionCache = {}
+# Flags for the kinds of changes in a cursor and the child cursors of its
+# records: changed records, and new records in bizobjs that do or don't
+# have SaveNewUnchanged set.
+_DIRTY_CHANGED = 1
+_DIRTY_NEW_SAVED = 2
+_DIRTY_NEW = 4
+# Number of records whose size is measured to estimate the size of a cursor
+_cursorSizeSample = 20
 
 
 
@@ -32,8 +47,18 @@ class dBizobj(dObject):
 		self.__att_try_setFieldVal = False
 		self._visitedKeys = set()
 		self._cascadeDeleteFromParent = True
-		# Collection of cursor objects. MUST be defined first.
-		self.__cursors = {}
+		# Collection of cursor objects, from the least to the most recently
+		# used. MUST be defined first.
+		self.__cursors = OrderedDict()
+		# Keys of the cursors dropped to keep within CursorCacheSize and
+		# CursorCacheBytes, which are requeried when they are used again.
+		self.__evictedKeys = set()
+		# Estimated sizes of the cursors, as (id of records, row count, bytes)
+		# tuples keyed like __cursors.
+		self.__cursorSizes = {}
+		# The _DIRTY_* flags of the cursors that have changes, including those
+		# in the child cursors of their records, keyed like __cursors.
+		self.__dirtyCursors = {}
 		# PK of the currently-selected cursor
 		self.__currentCursorKey = None
 		# Description of the data represented by this bizobj
@@ -93,9 +118,23 @@ class dBizobj(dObject):
 		self._newRecordOnNewParent = False
 		self._newChildOnNew = False
 		self._fillLinkFromParent = False
+		# The pending requeryAsync() request, if any
+		self._asyncRequery = None
+		self._asyncRequeryLock = threading.Lock()
 		self.exitScan = False
 		self.dbapiCursorClass = None
 		self._childCacheInterval = None
+		self._prefetchSize = 0
+		self._pageSize = 0
+		self._cursorCacheSize = 0
+		self._cursorCacheBytes = 0
+		self._cursorEvictions = self._cursorRestores = 0
+		self._versionField = ""
+		self._useQueryCache = False
+		# Records fetched ahead for other parents by _prefetchRecords(), keyed
+		# by parent link value. Each value is a (cursor, sql, params, records)
+		# tuple.
+		self._prefetched = {}
 
 		##########################################
 		### referential integrity stuff ####
@@ -175,14 +214,21 @@ class dBizobj(dObject):
 
 		By default, only unchanged non-current cursors are flushed.
 		"""
-		cursors = {}
+		cursors = OrderedDict()
 		for key, cursor in self.__cursors.items():
 			if (not flush_current and cursor is self._CurrentCursor) \
 					or (not flush_changed and cursor.isChanged()):
 				cursors[key] = cursor
 		self.__cursors = cursors
+		for key in self.__cursorSizes.keys():
+			if key not in cursors:
+				del self.__cursorSizes[key]
 		if flush_current:
 			self.__currentCursorKey = None
+		for key in self.__dirtyCursors.keys():
+			if key not in cursors:
+				del self.__dirtyCursors[key]
+				self._dirtyStateChanged(key)
 		for child in self._children:
 			child._flushCursors(flush_changed, flush_current)
 
@@ -195,6 +241,68 @@ class dBizobj(dObject):
 		self._flushCursors()
 
 
+	def _evictCursors(self):
+		"""
+		Drop the least recently used cursors, other than the current cursor and
+		those with changes, until there are no more than CursorCacheSize of
+		them, taking up no more than about CursorCacheBytes. A dropped cursor
+		is requeried when its parent record becomes current again.
+		"""
+		maxCount = self._cursorCacheSize
+		maxBytes = self._cursorCacheBytes
+		cursors = self.__cursors
+		total = 0
+		if maxBytes:
+			total = sum([self._getCursorBytes(key, crs) for key, crs in cursors.iteritems()])
+		current = cursors.get(self.__currentCursorKey)
+		for key, crs in cursors.items():
+			if (not maxCount or len(cursors) <= maxCount) and (not maxBytes or total <= maxBytes):
+				break
+			if (crs is current) or (key in self.__dirtyCursors) \
+					or crs.isChanged(includeNewUnchanged=True):
+				continue
+			if maxBytes:
+				total -= self._getCursorBytes(key, crs)
+			del cursors[key]
+			self.__cursorSizes.pop(key, None)
+			self.__evictedKeys.add(key)
+			self._cursorEvictions += 1
+
+
+	def _getCursorBytes(self, key, crs):
+		"""
+		Return the approximate memory taken by the records of the passed cursor,
+		estimated from the size of a sample of them.
+		"""
+		records = crs._recordStore
+		count = len(records)
+		size = self.__cursorSizes.get(key)
+		if size is not None and size[:2] == (id(records), count):
+			return size[2]
+		sample = records[:_cursorSizeSample]
+		recBytes = 0
+		for rec in sample:
+			recBytes += sys.getsizeof(rec) + sum([sys.getsizeof(val) for val in rec.itervalues()])
+		ret = sys.getsizeof(records)
+		if sample:
+			ret += recBytes * count // len(sample)
+		self.__cursorSizes[key] = (id(records), count, ret)
+		return ret
+
+
+	def getCursorCacheStats(self):
+		"""
+		Return a dict with the number of 'cursors' this bizobj holds, the
+		approximate 'bytes' taken by their records, the number of 'evictions'
+		made to keep within CursorCacheSize and CursorCacheBytes, and the number
+		of evicted cursors that were requeried, or 'restores'.
+		"""
+		cursors = self.__cursors
+		return {"cursors": len(cursors),
+				"bytes": sum([self._getCursorBytes(key, crs) for key, crs in cursors.items()]),
+				"evictions": self._cursorEvictions, "restores": self._cursorRestores}
+
+
 	def getTempCursor(self, sql=None, params=None, requery=True):
 		"""Occasionally it is useful to be able to run ad-hoc queries against
 		the database. For these queries, where the results are not meant to
@@ -225,6 +333,7 @@ class dBizobj(dObject):
 		crs.setCursorFactory(cf.getCursor, cursorClass)
 
 		cur = crs.AuxCursor
+		cur.UseQueryCache = self.UseQueryCache
 
 		if sql:
 			cur.UserSQL = sql
@@ -271,11 +380,15 @@ class dBizobj(dObject):
 		crs.setCursorFactory(cf.getCursor, cursorClass)
 		if addToCursorCollection:
 			self.__cursors[key] = crs
+			crs._cursorKey = key
 			crs.sqlManager = self.SqlManager
 		if _dataStructure is not None:
 			crs._dataStructure = _dataStructure
 		crs.BackendObject = cf.getBackendObject()
 		crs._bizobj = self
+		if addToCursorCollection:
+			# It may have replaced a cursor with changes.
+			self._cursorDirtyStateChanged(crs)
 		self._syncCursorProps(crs)
 		if addToCursorCollection and self.RequeryOnLoad:
 			if self.__cursorsToRequery is None:
@@ -487,6 +600,10 @@ class dBizobj(dObject):
 
 		startTransaction = startTransaction and self.beginTransaction()
 
+		if self.BatchedSave and not self._children:
+			self._saveAllBatched(startTransaction)
+			return
+
 		# First save the rows we know we've visited:
 		try:
 			self.scanKeys(self.save, self._visitedKeys, startTransaction=False,
@@ -496,11 +613,9 @@ class dBizobj(dObject):
 				self.rollbackTransaction()
 			raise
 
-		# Finally, scan all rows only if there are still potentially unsaved rows.
-		# The isAnyChanged() call will be expensive if there are changes buried
-		# in some out-of-context child cursor, but that should be rare. In the
+		# Finally, scan all rows only if there are still unsaved rows. In the
 		# common case, all the changes would have already been made in the above
-		# block, and isAnyChanged() will return False very quickly in that case.
+		# block, and isAnyChanged() will return False.
 		if self.isAnyChanged():
 			try:
 				self.scan(self.save, startTransaction=False,
@@ -516,6 +631,46 @@ class dBizobj(dObject):
 		self.afterSaveAll()
 
 
+	def _saveAllBatched(self, startTransaction):
+		"""
+		Called by saveAll() when BatchedSave is True and there are no child
+		bizobjs. The per-row hooks and validation run as they do in save(), but
+		all the changed rows are then handed to the cursor in one save() call,
+		which sends them to the backend in batches.
+		"""
+		cursor = self._CurrentCursor
+		includeNewUnchanged = self.SaveNewUnchanged
+		savedRows = {}
+
+		def _checkRow():
+			errMsg = self.beforeSave()
+			if errMsg:
+				raise dException.BusinessRuleViolation(errMsg)
+			self._validate()
+			savedRows[self.RowNumber] = self.IsAdding
+
+		def _afterRow():
+			if savedRows[self.RowNumber]:
+				self._onSaveNew()
+			self.afterChange()
+			self.afterSave()
+
+		try:
+			self.scanChangedRows(_checkRow, includeNewUnchanged=includeNewUnchanged)
+			if savedRows:
+				cursor.save(allRows=True, includeNewUnchanged=includeNewUnchanged)
+		except (dException.DBQueryException, dException.dException):
+			if startTransaction:
+				self.rollbackTransaction()
+			raise
+
+		self.commitTransaction()
+		self.scanRows(_afterRow, sorted(savedRows), scanRequeryChildren=False)
+		self._visitedKeys.clear()
+		self._addVisitedKey()
+		self.afterSaveAll()
+
+
 	def save(self, startTransaction=True, saveTheChildren=True):
 		"""
 		Save any changes that have been made in the current row.
@@ -598,11 +753,9 @@ class dBizobj(dObject):
 		self.scanKeys(self.cancel, self._visitedKeys,
 				cancelTheChildren=cancelTheChildren,
 				ignoreNoRecords=ignoreNoRecords, scanRequeryChildren=False)
-		# Finally, scan all rows only if there are still potentially changed rows.
-		# The isAnyChanged() call will be expensive if there are changes buried
-		# in some out-of-context child cursor, but that should be rare. In the
+		# Finally, scan all rows only if there are still changed rows. In the
 		# common case, all the cancellations would have already happened in the
-		# above block, and isAnyChanged() will return False very quickly.
+		# above block, and isAnyChanged() will return False.
 		if self.isAnyChanged(includeNewUnchanged=True):
 			self.scanChangedRows(self.cancel, allCursors=False,
 					includeNewUnchanged=True, cancelTheChildren=cancelTheChildren,
@@ -885,6 +1038,35 @@ class dBizobj(dObject):
 				restorePointer=restorePointer, flushUnchangedCursors=flushUnchangedCursors)
 
 
+	def iterRecords(self, rows=None):
+		"""
+		Return an iterator of lightweight dRowView objects for the passed row
+		numbers, or for all the records. Unlike bizIterator(), this doesn't
+		move the record pointer, so no pointer move hooks run and the children
+		aren't touched; use it for work on this bizobj's own fields. Values
+		written to the views go through setFieldVal().
+
+		Don't add or remove records while iterating.
+		"""
+		return self._CurrentCursor.iterRecords(rows, _setter=self.setFieldVal)
+
+
+	def apply(self, func, fields=None, rows=None):
+		"""
+		Call func with a dRowView of each of the passed rows, or of all the
+		records, without moving the record pointer. See iterRecords().
+
+		If 'fields' is passed, what func returns is written to the record: the
+		value of that field if it is a field name, or the values of those
+		fields, in order, if it is a sequence of names. For example::
+
+			biz.apply(lambda rec: rec.qty * rec.price, fields="total")
+
+		Returns the number of records in which any value was changed.
+		"""
+		return self._CurrentCursor.apply(func, fields, rows, _setter=self.setFieldVal)
+
+
 	def scan(self, func, *args, **kwargs):
 		"""
 		Iterate over all records and apply the passed function to each.
@@ -1049,13 +1231,28 @@ class dBizobj(dObject):
 			self._fldReplace("price > 50")
 				=> returns "self.Record.price > 50"
 		"""
-		patTemplate = r"(.*\b)%s(\b.*)"
-		ret = expr
-		for fld in self.getFieldNames():
-			pat = patTemplate % fld
-			mtch = re.match(pat, ret)
-			if mtch:
-				ret = mtch.groups()[0] + "self.Record.%s" % fld + mtch.groups()[1]
+		flds = sorted(self.getFieldNames(), key=len, reverse=True)
+		if not flds:
+			return expr
+		pat = r"\b(?:%s)\b" % "|".join([re.escape(fld) for fld in flds])
+		return re.sub(pat, lambda mtch: "self.Record.%s" % mtch.group(0), expr)
+
+
+	def _compileExpression(self, expr):
+		"""
+		Returns a function that evaluates the expression for the current
+		record of the bizobj passed to it. The functions are cached, so each
+		expression is only rewritten and compiled once.
+		"""
+		key = (expr, tuple(self.getFieldNames()))
+		try:
+			return _expressionCache[key]
+		except KeyError:
+			pass
+		if len(_expressionCache) >= _maxCachedExpressions:
+			_expressionCache.clear()
+		code = "lambda self: (%s)" % self._fldReplace(expr)
+		ret = _expressionCache[key] = eval(compile(code, "<dBizobj expression>", "eval"))
 		return ret
 
 
@@ -1126,28 +1323,23 @@ class dBizobj(dObject):
 		with an equals sign. All expressions will therefore be a string
 		beginning with '='. Literals can be of any type.
 		"""
-		self.scan(self._replace, field, valOrExpr, scope)
+		scopeFunc = valFunc = None
+		if scope is not None:
+			scopeFunc = self._compileExpression(scope)
+		if isinstance(valOrExpr, basestring) and valOrExpr.startswith("="):
+			valFunc = self._compileExpression(valOrExpr.strip()[1:])
+		self.scan(self._replace, field, valOrExpr, scopeFunc, valFunc)
 
 
-	def _replace(self, field, valOrExpr, scope):
+	def _replace(self, field, valOrExpr, scopeFunc, valFunc):
 		"""
 		Called once for each record in the bizobj when the replace() method
 		is invoked.
 		"""
-		if scope is not None:
-			scope = self._fldReplace(scope)
-			if not eval(scope):
-				return
-		literal = True
-		try:
-			if valOrExpr.startswith("="):
-				literal = False
-				valOrExpr = valOrExpr.strip()[1:]
-				valOrExpr = self._fldReplace(valOrExpr)
-				valOrExpr = eval(valOrExpr)
-		except AttributeError:
-			# Not a string expression; no worries
-			pass
+		if scopeFunc is not None and not scopeFunc(self):
+			return
+		if valFunc is not None:
+			valOrExpr = valFunc(self)
 		self.setFieldVal(field, valOrExpr)
 
 
@@ -1212,34 +1404,23 @@ class dBizobj(dObject):
 		rp = self._RemoteProxy
 		if rp:
 			return rp.requery()
-		errMsg = self.beforeRequery()
-		if errMsg:
-			raise dException.BusinessRuleViolation(errMsg)
-		if self.KeyField is None:
-			errMsg = _("No Primary Key defined in the Bizobj for %s") % self.DataSource
-			raise dException.MissingPKException(errMsg)
-
-		# If this is a dependent (child) bizobj, this will enforce the relation
-		_childParamTuple = self.setChildLinkFilter()
-		# Hook method for creating the param tuple. Note that the child filter
-		# clause, if any, will always be the first clause in the WHERE expression.
-		params = _childParamTuple + self.getParams()
+		params = self._getRequeryParams()
+		# This supersedes any pending background requery.
+		self._cancelRequeryAsync()
 		uiException = None
 
-		# Since the FK value can't be None, we don't need to run non matching
-		# parameters requery in such situation.
-		if not (self.Parent and self.LinkField and _childParamTuple and \
-				max(_childParamTuple) is None):
+		if params is not None:
 			# Record this in case we need to restore the record position
-			try:
-				currPK = self.getPK()
-			except dException.NoRecordsException:
-				currPK = None
-			oldDataStructure = hash(self.DataStructure)
+			currPK, oldDataStructure = self._getRequeryState()
 			# run the requery
 			cursor = self._CurrentCursor
+			prefetched = self._prefetched.pop(self.__currentCursorKey, None)
 			try:
-				cursor.requery(params, convertQMarks=convertQMarks)
+				if prefetched is not None and prefetched[1:3] == (cursor.CurrentSQL, params):
+					# The records were already fetched along with other parents' records.
+					cursor._takeRequery(*prefetched)
+				else:
+					cursor.requery(params, convertQMarks=convertQMarks)
 			except dException.ConnectionLostException:
 				raise
 			except dException.DBQueryException:
@@ -1249,20 +1430,360 @@ class dBizobj(dObject):
 				uiException = dException.NoRecordsException
 			except dException.dException:
 				raise
-			self._visitedKeys.clear()
-			if self.RestorePositionOnRequery:
-				self._positionUsingPK(currPK, updateChildren=False)
-			if hash(self.DataStructure) != oldDataStructure:
-				self._clearCursorRecord()
+			self._restoreRequeryState(currPK, oldDataStructure)
+		self._requeryChildrenAfterRequery()
+		if uiException:
+			raise uiException
+
+
+	def requeryChanges(self, convertQMarks=False):
+		"""
+		Bring the data set up to date by fetching only the records that have
+		changed since the last requery, as told by their VersionField, along
+		with the PKs of all the records, which tell which ones were deleted.
+		The changes are merged into the records: pending changes, the current
+		sort and the record position are kept. The children are requeried as
+		with requery().
+
+		Runs a full requery() if VersionField isn't set, or the query's params
+		have changed. See dCursorMixin.requeryChanges() for the details.
+		"""
+		if self._RemoteProxy or not self.VersionField:
+			return self.requery(convertQMarks=convertQMarks)
+		params = self._getRequeryParams()
+		# This supersedes any pending background requery.
+		self._cancelRequeryAsync()
+		if params is not None:
+			self._CurrentCursor.requeryChanges(params, convertQMarks=convertQMarks)
+		self._requeryChildrenAfterRequery()
+
+
+	def requeryAsync(self, callback=None, convertQMarks=False):
+		"""
+		Requery the data set without blocking the calling thread.
+
+		The query is run, and all of its rows fetched, by a cursor of its own
+		on a worker thread. That cursor uses a connection of its own, too: one
+		from the pool if the connection is pooled and one is free, or else a
+		new connection that is closed afterwards. The thread that calls this
+		keeps its pooled connection, so a pool with a MaxPoolSize of 1 always
+		needs the extra connection. Databases that can't be reached from
+		another connection, such as in-memory SQLite ones, raise
+		DatabaseException. When the rows are in, they replace the
+		records of the current cursor in a single step, and then, as with
+		requery(), the record position is restored, the children are
+		requeried, and afterRequery() is called. If a UI is loaded, this last
+		part runs in the UI thread.
+
+		Starting another requery, with either method, supersedes a request
+		that hasn't finished yet: its results are thrown away.
+
+		Returns an object with these methods:
+
+			| wait(timeout=None): wait for the request to finish; returns True
+			|		if it has finished.
+			| result(timeout=None): wait for the request to finish, and raise
+			|		the error that made it fail, if any.
+			| cancel(): throw away the results when they come in.
+			| isDone(), isCancelled()
+
+		If 'callback' is passed, it is called with that object once the
+		results have been applied, or the query has failed.
+		"""
+		if self._RemoteProxy:
+			# The query is run by the server, so there is no cursor to run it on
+			# here; requery in this thread.
+			req = _requeryRequest(None, None, callback, convertQMarks)
+			try:
+				self.requery(convertQMarks=convertQMarks)
+			except Exception, e:
+				req.error = e
+			req._setDone()
+			if callback is not None:
+				callback(req)
+			return req
+		cf = self._cursorFactory
+		if cf.Pool is None and not cf.getBackendObject().sharesDatabase(cf.ConnectInfo):
+			raise dException.DatabaseException(
+					_("requeryAsync() can't open another connection to the database '%s'")
+					% cf.ConnectInfo.Database)
+		params = self._getRequeryParams()
+		req = _requeryRequest(self._CurrentCursor, params, callback, convertQMarks)
+		self._asyncRequeryLock.acquire()
+		try:
+			if self._asyncRequery is not None:
+				self._asyncRequery.cancel()
+			self._asyncRequery = req
+		finally:
+			self._asyncRequeryLock.release()
+		if params is None:
+			# No need to run the query
+			self._finishRequeryAsync(req)
+		else:
+			if self.PageSize:
+				req.sql = req.target._getPageSQL(params=params, convertQMarks=convertQMarks)[0]
+			else:
+				req.sql = req.target.CurrentSQL
+			thd = threading.Thread(target=self._runRequeryAsync, args=(req,))
+			thd.setDaemon(True)
+			thd.start()
+		return req
+
+
+	def nextPage(self):
+		"""
+		When PageSize is set, fetch the next page of records. Returns False if
+		the current page is the last one.
+		"""
+		return self._movePage("nextPage")
+
+
+	def prevPage(self):
+		"""
+		When PageSize is set, fetch the previous page of records. Returns False
+		if the current page is the first one.
+		"""
+		return self._movePage("prevPage")
+
+
+	def gotoPage(self, num):
+		"""
+		When PageSize is set, fetch page 'num' of the records, counting from 0.
+		Unlike nextPage() and prevPage(), this has the database skip over the
+		rows of the pages before it.
+		"""
+		return self._movePage("gotoPage", num)
+
 
+	def _movePage(self, methodName, *args):
+		if self._RemoteProxy:
+			raise dException.FeatureNotSupportedException(
+					_("Pages can't be fetched for remote bizobjs"))
+		if not self.PageSize:
+			raise dException.dException(_("PageSize must be set to use pages"))
+		params = self._getRequeryParams()
+		if params is None:
+			return False
+		self._cancelRequeryAsync()
+		ret = getattr(self._CurrentCursor, methodName)(*(args + (params,)))
+		if ret is False:
+			return ret
+		self._visitedKeys.clear()
+		try:
+			self._CurrentCursor.first()
+		except dException.NoRecordsException:
+			pass
+		self._requeryChildrenAfterRequery()
+		return True
+
+
+	def _getRequeryParams(self):
+		"""
+		Run the checks that come before a requery, and return the params for
+		the query, or None if the query doesn't need to be run.
+		"""
+		errMsg = self.beforeRequery()
+		if errMsg:
+			raise dException.BusinessRuleViolation(errMsg)
+		if self.KeyField is None:
+			errMsg = _("No Primary Key defined in the Bizobj for %s") % self.DataSource
+			raise dException.MissingPKException(errMsg)
+		if self.__currentCursorKey in self.__evictedKeys:
+			self.__evictedKeys.discard(self.__currentCursorKey)
+			self._cursorRestores += 1
+
+		# If this is a dependent (child) bizobj, this will enforce the relation
+		_childParamTuple = self.setChildLinkFilter()
+		# Hook method for creating the param tuple. Note that the child filter
+		# clause, if any, will always be the first clause in the WHERE expression.
+		params = _childParamTuple + self.getParams()
+		# Since the FK value can't be None, we don't need to run non matching
+		# parameters requery in such situation.
+		if self.Parent and self.LinkField and _childParamTuple and \
+				max(_childParamTuple) is None:
+			return None
+		return params
+
+
+	def _getRequeryState(self):
+		try:
+			currPK = self.getPK()
+		except dException.NoRecordsException:
+			currPK = None
+		return currPK, hash(self.DataStructure)
+
+
+	def _restoreRequeryState(self, currPK, oldDataStructure):
+		self._visitedKeys.clear()
+		if self.RestorePositionOnRequery:
+			self._positionUsingPK(currPK, updateChildren=False)
+		if hash(self.DataStructure) != oldDataStructure:
+			self._clearCursorRecord()
+
+
+	def _requeryChildrenAfterRequery(self):
+		for child in self._children:
+			# Records prefetched for the old parent records may be out of date.
+			child._prefetched.clear()
 		try:
 			self.requeryAllChildren()
 		except dException.NoRecordsException:
 			pass
 		self.afterRequery()
 		self._addVisitedKey()
-		if uiException:
-			raise uiException
+
+
+	def _runRequeryAsync(self, req):
+		"""Run the query for a requeryAsync() request. Called in a worker thread."""
+		cf = self._cursorFactory
+		conn = None
+		try:
+			try:
+				pool = cf.Pool
+				# The caller's connection can't be used from this thread. Don't
+				# wait for a pooled one, as the caller may hold the last one.
+				if pool is None or pool.checkout(block=False) is None:
+					conn = cf.openConnection()
+				crs = self._getQueryCursor(req.sql, conn)
+				crs.requery(req.params, convertQMarks=req.convertQMarks)
+				req.cursor = crs
+			except Exception, e:
+				req.error = e
+		finally:
+			if conn is not None:
+				conn.close()
+			else:
+				# Return the pooled connection.
+				cf.releaseConnection()
+		import dabo.ui
+		if dabo.ui.getUIType():
+			dabo.ui.callAfter(self._finishRequeryAsync, req)
+		else:
+			self._finishRequeryAsync(req)
+
+
+	def _getQueryCursor(self, sql, conn=None):
+		"""
+		Return a cursor, outside of the cursor collection, that runs the passed
+		SQL and fetches all of its rows at once. If 'conn' is passed, the cursor
+		runs on that DB-API connection.
+		"""
+		cf = self._cursorFactory
+		cursorClass = self._getCursorClass(self.dCursorMixinClass,
+				self.dbapiCursorClass)
+		if conn is None:
+			getCursor = cf.getCursor
+		else:
+			getCursor = lambda cls: cls(conn)
+		crs = getCursor(cursorClass)
+		crs.setCursorFactory(getCursor, cursorClass)
+		crs.BackendObject = cf.getBackendObject()
+		self._syncCursorProps(crs)
+		crs.FetchWindow = 0
+		crs.PageSize = 0
+		crs.UserSQL = sql
+		return crs
+
+
+	def _prefetchRecords(self):
+		"""
+		If PrefetchSize is set, fetch the records for the parent's current row,
+		and for the parent rows that follow it, with a single query. The
+		records for each parent are kept until requery() is called for it.
+		"""
+		size = self.PrefetchSize
+		parent = self.Parent
+		key = self.__currentCursorKey
+		if not size or not parent or key is None or key in self._prefetched \
+				or self.UserSQL or self.PageSize or self._RemoteProxy:
+			return
+		links = self.LinkField.replace(" ", "").split(",")
+		parentField = self.ParentLinkField.replace(" ", "") or None
+		if len(links) > 1 or (parentField and "," in parentField) \
+				or isinstance(parent._CurrentCursor.KeyField, tuple):
+			# Only single-field links can be fetched with an IN list.
+			return
+		linkField = links[0].split(".")[-1]
+		try:
+			keys = parent._CurrentCursor._getSavedRowValues(parentField,
+					parent.RowNumber, size)
+		except dException.NoRecordsException:
+			return
+		if key not in keys:
+			return
+		interval = self._childCacheInterval
+		now = time.time()
+		fetchKeys = []
+		for val in keys:
+			if val is None or val in fetchKeys or val in self._prefetched:
+				continue
+			crs = self.__cursors.get(val)
+			if crs is not None and val != key:
+				# Leave cursors with changes, or recently requeried ones, alone.
+				last = crs.lastRequeryTime
+				if crs.isChanged() or (interval and last and (now - last) <= interval):
+					continue
+			fetchKeys.append(val)
+
+		cursor = self._CurrentCursor
+		# The SQL and params that requery() will use for each parent.
+		cursor.setChildFilter(linkField)
+		singleSQL = cursor.CurrentSQL
+		params = self.getParams()
+		sql, limit = cursor.getPrefetchSQL(linkField, len(fetchKeys))
+		crs = self._getQueryCursor(sql)
+		crs.requery(tuple(fetchKeys) + params)
+		recordsByKey = dict([(val, []) for val in fetchKeys])
+		for rec in crs._records:
+			try:
+				recordsByKey[rec[linkField]].append(rec)
+			except KeyError:
+				pass
+		for val, records in recordsByKey.items():
+			if limit is not None:
+				del records[limit:]
+			self._prefetched[val] = (crs, singleSQL, (val,) + params, records)
+
+
+	def _finishRequeryAsync(self, req):
+		"""Apply the results of a requeryAsync() request, unless it has been superseded."""
+		self._asyncRequeryLock.acquire()
+		try:
+			current = (req is self._asyncRequery) and not req.isCancelled()
+			if current:
+				self._asyncRequery = None
+				isCurrentCursor = (req.target is self._CurrentCursor)
+				if isCurrentCursor:
+					currPK, oldDataStructure = self._getRequeryState()
+				if req.cursor is not None:
+					req.target._takeRequery(req.cursor)
+		finally:
+			self._asyncRequeryLock.release()
+		if not current:
+			req._setDone()
+			return
+		if req.error is None and isCurrentCursor:
+			# If the parent has moved on, the cursor is no longer current, and
+			# there is nothing more to do.
+			try:
+				if req.cursor is not None:
+					self._restoreRequeryState(currPK, oldDataStructure)
+				self._requeryChildrenAfterRequery()
+			except Exception, e:
+				req.error = e
+		req._setDone()
+		if req.callback is not None:
+			req.callback(req)
+
+
+	def _cancelRequeryAsync(self):
+		self._asyncRequeryLock.acquire()
+		try:
+			if self._asyncRequery is not None:
+				self._asyncRequery.cancel()
+				self._asyncRequery = None
+		finally:
+			self._asyncRequeryLock.release()
 
 
 	def _clearCursorRecord(self):
@@ -1339,6 +1860,9 @@ class dBizobj(dObject):
 		Called when the data is to be sorted on a particular column
 		in a particular order. All the checking on the parameters is done
 		in the cursor.
+
+		To sort on several columns, pass a list of column names and/or
+		(column, order[, caseSensitive]) tuples; see dCursorMixin.sort().
 		"""
 		cc = self._CurrentCursor
 		if cc is not None:
@@ -1588,6 +2112,10 @@ class dBizobj(dObject):
 				# and self.RowNumber = 0.
 				if updateChildren and child.RequeryWithParent and child.cacheExpired() \
 						and not child.isAnyChanged():
+					child._prefetchRecords()
+					child.requery()
+				elif child._CurrentCursorKey in child.__evictedKeys:
+					# Its records were dropped by _evictCursors(); fetch them again.
 					child.requery()
 				child.afterSetCurrentParent()
 
@@ -1683,32 +2211,11 @@ class dBizobj(dObject):
 		return False
 
 
-	def _isAnyChanged_fast(self, includeNewUnchanged=None):
-		"""
-		INTERNAL USE ONLY: This checks all the cursors including the ones
-		out of context, and needs to be combined with the precise function
-		like:
-				if self._isAnyChanged_fast() or self._isAnyChanged_precise()...
-
-		Which will at least be much faster (and still correct) in the case of
-		_isAnyChanged_fast() returning False, and not much slower otherwise.
-		"""
-		withNewUnchanged = includeNewUnchanged
-		if withNewUnchanged is None:
-			withNewUnchanged = self.SaveNewUnchanged
-		for cursor in self.__cursors.values():
-			if cursor.isChanged(allRows=True, includeNewUnchanged=withNewUnchanged):
-				return True
-		for child in self._children:
-			if child._isAnyChanged_fast(includeNewUnchanged=includeNewUnchanged):
-				return True
-		return False
-
-
 	def _isAnyChanged_precise(self, includeNewUnchanged=None, withChildren=True):
 		"""
 		Return True if at least one record in the current record set
-		has been changed.
+		has been changed, by visiting each of them. isAnyChanged() gives the
+		same answer from the dirty state that the cursors keep up to date.
 		"""
 		def _isThisChanged():
 			self.exitScan = self._isChanged(True, includeNewUnchanged, withChildren)
@@ -1722,11 +2229,99 @@ class dBizobj(dObject):
 		Return True if at least one record in the current record set
 		has been changed.
 		"""
-		if not self._isAnyChanged_fast(includeNewUnchanged):
-			## the fast function never gives false negatives
+		cursor = self._CurrentCursor
+		if cursor is None:
 			return False
-		## must use precise function because fast function can return false positives:
-		return self._isAnyChanged_precise(includeNewUnchanged, withChildren)
+		if withChildren:
+			state = self.__dirtyCursors.get(self.__currentCursorKey, 0)
+		else:
+			state = self._getCursorDirtyState(cursor, withChildren=False)
+		if includeNewUnchanged is None:
+			mask = _DIRTY_CHANGED | _DIRTY_NEW_SAVED
+		elif includeNewUnchanged:
+			mask = _DIRTY_CHANGED | _DIRTY_NEW_SAVED | _DIRTY_NEW
+		else:
+			mask = _DIRTY_CHANGED
+		return bool(state & mask)
+
+
+	def _getCursorDirtyState(self, crs, withChildren=True):
+		"""
+		Return the _DIRTY_* flags for the changes in the passed cursor and, if
+		withChildren is True, in the child cursors of its records.
+		"""
+		if not crs._recordStore and not crs._streamPending:
+			return 0
+		state = 0
+		if crs._mementos:
+			state = _DIRTY_CHANGED
+		if crs._newRecords:
+			state |= (_DIRTY_NEW_SAVED if self.SaveNewUnchanged else _DIRTY_NEW)
+		if withChildren:
+			for child in self._children:
+				for key, childState in child.__dirtyCursors.iteritems():
+					if (childState & ~state) and self._cursorHasLinkValue(crs, child, key):
+						state |= childState
+		return state
+
+
+	def _cursorHasLinkValue(self, crs, child, val):
+		"""
+		Return True if one of the records of the passed cursor is the parent
+		of the passed child's cursor for 'val'.
+		"""
+		fld = child.ParentLinkField
+		if not fld:
+			try:
+				return val in crs._getPkIndex()
+			except TypeError:
+				return False
+		flds = fld.replace(" ", "").split(",")
+		for rec in crs._recordStore:
+			if len(flds) == 1:
+				recVal = rec.get(flds[0])
+			else:
+				recVal = tuple([rec.get(f) for f in flds])
+			if recVal == val:
+				return True
+		return False
+
+
+	def _cursorDirtyStateChanged(self, crs):
+		"""
+		Called by the passed cursor when its changes, or its records, have
+		changed. Updates its dirty state, and passes any change on to the
+		parent bizobj.
+		"""
+		key = crs._cursorKey
+		if self.__cursors.get(key) is not crs:
+			# Not one of the cursors that hold this bizobj's data.
+			return
+		state = self._getCursorDirtyState(crs)
+		dirty = self.__dirtyCursors
+		if state == dirty.get(key, 0):
+			return
+		if state:
+			dirty[key] = state
+		else:
+			del dirty[key]
+		self._dirtyStateChanged(key)
+
+
+	def _dirtyStateChanged(self, key):
+		"""Tell the parent bizobj that the dirty state for the cursor key changed."""
+		parent = self.Parent
+		if parent is None:
+			return
+		for crs in parent.__cursors.values():
+			if parent._cursorHasLinkValue(crs, self, key):
+				parent._cursorDirtyStateChanged(crs)
+
+
+	def _refreshDirtyState(self):
+		"""Work out the dirty state of all the cursors again."""
+		for crs in self.__cursors.values():
+			self._cursorDirtyStateChanged(crs)
 
 
 	def isChanged(self, includeNewUnchanged=None, withChildren=True):
@@ -1862,6 +2457,7 @@ class dBizobj(dObject):
 		if child not in self._children:
 			self._children.append(child)
 			child.Parent = self
+			self._refreshDirtyState()
 		return child
 
 
@@ -1875,6 +2471,7 @@ class dBizobj(dObject):
 		children = self._children
 		child = children.pop(children.index(child))
 		child.Parent = None
+		self._refreshDirtyState()
 
 
 	def removeAllChildren(self):
@@ -1884,6 +2481,7 @@ class dBizobj(dObject):
 		while self._children:
 			child = self._children.pop()
 			child.Parent = None
+		self._refreshDirtyState()
 
 
 	def addMMBizobj(self, mmBizobj, assocTable, assocPKColThis, assocPKColOther,
@@ -2030,6 +2628,15 @@ class dBizobj(dObject):
 		return ret
 
 
+	def clearVirtualFieldCache(self, fld=None):
+		"""
+		Discard the cached values of the passed virtual field, or of all the
+		virtual fields if 'fld' is None, in all of this bizobj's cursors.
+		"""
+		for crs in self.__cursors.values():
+			crs.clearVirtualFieldCache(fld)
+
+
 	def getFieldVals(self, row=None):
 		"""Return a dict of the field/value pairs in the current or specified row."""
 		if row is None:
@@ -2042,12 +2649,25 @@ class dBizobj(dObject):
 
 	def setFieldVal(self, fld, val, row=None, pk=None):
 		"""Set the value of the specified field in the current or specified row."""
-		changed = self._CurrentCursor.setFieldVal(fld, val, row, pk)
+		cursor = self._CurrentCursor
+		changed = cursor.setFieldVal(fld, val, row, pk)
 		if changed:
+			if self._isChildLinkField(fld):
+				# The records that the child cursors belong to have changed.
+				self._cursorDirtyStateChanged(cursor)
 			self.afterSetFieldVal(fld, row)
 		return changed
 
 
+	def _isChildLinkField(self, fld):
+		"""Return True if any child bizobj links to this one on the passed non-PK field."""
+		for child in self._children:
+			linkFld = child.ParentLinkField
+			if linkFld and fld in linkFld.replace(" ", "").split(","):
+				return True
+		return False
+
+
 	def setFieldVals(self, valDict=None, row=None, pk=None, **kwargs):
 		"""
 		Allows you to set the value for multiple fields with one call by passing a dict
@@ -2574,7 +3194,10 @@ class dBizobj(dObject):
 		The _visitedKeys set is used for optimization of cancelAll()
 		and saveAll(), and only applies to bizobjs with no parent.
 		"""
-		if not self.Parent and self.RowCount:
+		# Use _hasRecords() rather than RowCount, so that a streaming cursor
+		# doesn't have to fetch all its rows.
+		cursor = self._CurrentCursor
+		if not self.Parent and cursor is not None and cursor._hasRecords():
 			self._visitedKeys.add(self.getPK())
 
 
@@ -2706,6 +3329,12 @@ afterDelete() which is only called after a delete().""")
 		crs.KeyField = self._keyField
 		crs.AutoPopulatePK = self._autoPopulatePK
 		crs.AutoQuoteNames = self._autoQuoteNames
+		crs.BatchedSave = self.BatchedSave
+		crs.CompactRecords = self.CompactRecords
+		crs.FetchWindow = self.FetchWindow
+		crs.PageSize = self._pageSize
+		crs.VersionField = self._versionField
+		crs.UseQueryCache = self._useQueryCache
 		if self._dataStructure is not None:
 			crs.DataStructure = self._dataStructure
 		if not self._RemoteProxy:
@@ -2735,8 +3364,15 @@ afterDelete() which is only called after a delete().""")
 		"""
 		oldKey = self.__currentCursorKey
 		if newKey <> oldKey:
-			self.__cursors[newKey] = self.__cursors.pop(oldKey)
+			crs = self.__cursors[newKey] = self.__cursors.pop(oldKey)
+			crs._cursorKey = newKey
+			self.__cursorSizes.pop(oldKey, None)
+			self.__cursorSizes.pop(newKey, None)
+			self.__evictedKeys.discard(newKey)
 			self.__currentCursorKey = newKey
+			if self.__dirtyCursors.pop(oldKey, None):
+				self._dirtyStateChanged(oldKey)
+			self._cursorDirtyStateChanged(crs)
 
 
 	## Property getter/setter methods ##
@@ -2766,6 +3402,17 @@ afterDelete() which is only called after a delete().""")
 			return None
 
 
+	def _getBatchedSave(self):
+		try:
+			return self._batchedSave
+		except AttributeError:
+			return False
+
+	def _setBatchedSave(self, val):
+		self._batchedSave = bool(val)
+		self._syncWithCursors()
+
+
 	def _getCaption(self):
 		try:
 			return self._caption
@@ -2790,6 +3437,35 @@ afterDelete() which is only called after a delete().""")
 		self._childCacheInterval = val
 
 
+	def _getCursorCacheBytes(self):
+		return self._cursorCacheBytes
+
+	def _setCursorCacheBytes(self, val):
+		self._cursorCacheBytes = max(0, int(val or 0))
+		if self._cursorCacheBytes:
+			self._evictCursors()
+
+
+	def _getCursorCacheSize(self):
+		return self._cursorCacheSize
+
+	def _setCursorCacheSize(self, val):
+		self._cursorCacheSize = max(0, int(val or 0))
+		if self._cursorCacheSize:
+			self._evictCursors()
+
+
+	def _getCompactRecords(self):
+		try:
+			return self._compactRecords
+		except AttributeError:
+			return False
+
+	def _setCompactRecords(self, val):
+		self._compactRecords = bool(val)
+		self._syncWithCursors()
+
+
 	def _getCurrentSQL(self):
 		return self._CurrentCursor.CurrentSQL
 
@@ -2810,8 +3486,15 @@ afterDelete() which is only called after a delete().""")
 		the current parent key. If not, creates one.
 		"""
 		self.__currentCursorKey = val
-		if val not in self.__cursors:
+		cursors = self.__cursors
+		limited = self._cursorCacheSize or self._cursorCacheBytes
+		if val not in cursors:
 			self.createCursor()
+			if limited:
+				self._evictCursors()
+		elif limited:
+			# Mark it as the most recently used one.
+			cursors[val] = cursors.pop(val)
 
 
 	def _getCurrentCursorKey(self):
@@ -2902,6 +3585,17 @@ afterDelete() which is only called after a delete().""")
 		self._syncWithCursors()
 
 
+	def _getFetchWindow(self):
+		try:
+			return self._fetchWindow
+		except AttributeError:
+			return 0
+
+	def _setFetchWindow(self, val):
+		self._fetchWindow = val
+		self._syncWithCursors()
+
+
 	def _getFillLinkFromParent(self):
 		try:
 			return self._fillLinkFromParent
@@ -2943,6 +3637,8 @@ afterDelete() which is only called after a delete().""")
 
 	def _setLinkField(self, val):
 		self._linkField = u"%s" % val
+		if self.Parent:
+			self.Parent._refreshDirtyState()
 
 
 	def _getNewChildOnNew(self):
@@ -2975,6 +3671,18 @@ afterDelete() which is only called after a delete().""")
 		self._syncWithCursors()
 
 
+	def _getPageNumber(self):
+		return self._CurrentCursor.PageNumber
+
+
+	def _getPageSize(self):
+		return self._pageSize
+
+	def _setPageSize(self, val):
+		self._pageSize = max(0, int(val or 0))
+		self._syncWithCursors()
+
+
 	def _getParent(self):
 		try:
 			return self._parent
@@ -2996,6 +3704,15 @@ afterDelete() which is only called after a delete().""")
 
 	def _setParentLinkField(self, val):
 		self._parentLinkField = u"%s" % val
+		if self.Parent:
+			self.Parent._refreshDirtyState()
+
+
+	def _getPrefetchSize(self):
+		return self._prefetchSize
+
+	def _setPrefetchSize(self, val):
+		self._prefetchSize = int(val or 0)
 
 
 	def _getRecord(self):
@@ -3104,6 +3821,7 @@ afterDelete() which is only called after a delete().""")
 
 	def _setSaveNewUnchanged(self, val):
 		self._saveNewUnchanged = val
+		self._refreshDirtyState()
 
 
 	def _getScanRestorePosition(self):
@@ -3149,6 +3867,22 @@ afterDelete() which is only called after a delete().""")
 		self._CurrentCursor.UserSQL = self._userSQL = val
 
 
+	def _getUseQueryCache(self):
+		return self._useQueryCache
+
+	def _setUseQueryCache(self, val):
+		self._useQueryCache = bool(val)
+		self._syncWithCursors()
+
+
+	def _getVersionField(self):
+		return self._versionField
+
+	def _setVersionField(self, val):
+		self._versionField = val or ""
+		self._syncWithCursors()
+
+
 
 	### -------------- Property Definitions ------------------	##
 	AutoPopulatePK = property(_getAutoPopulatePK, _setAutoPopulatePK, None,
@@ -3162,6 +3896,12 @@ afterDelete() which is only called after a delete().""")
 	AutoSQL = property(_getAutoSQL, None, None,
 			_("Returns the SQL statement automatically generated by the sql manager."))
 
+	BatchedSave = property(_getBatchedSave, _setBatchedSave, None,
+			_("""When True, saveAll() sends the changed rows to the backend in
+			batches, one statement per group of rows that change the same columns,
+			instead of one statement per row. Only used when the bizobj has no
+			child bizobjs. Default=False  (bool)"""))
+
 	Caption = property(_getCaption, _setCaption, None,
 			_("The friendly title of the cursor, used in messages to the end user. (str)"))
 
@@ -3174,12 +3914,31 @@ afterDelete() which is only called after a delete().""")
 			requery from parent.requeryAllChildren() will be ignored.  (int)
 			"""))
 
+	CompactRecords = property(_getCompactRecords, _setCompactRecords, None,
+			_("""When True, the cursors store their records as dCompactRecord objects
+			instead of dicts, which uses much less memory for large data sets. Takes
+			effect on the next requery. Default=False  (bool)"""))
+
 	Connection = property(_getConnection, None, None,
 			_("The dConnection object used to connect with the backend database."))
 
 	CurrentSQL = property(_getCurrentSQL, None, None,
 			_("Returns the current SQL that will be run, which is one of UserSQL or AutoSQL."))
 
+	CursorCacheBytes = property(_getCursorCacheBytes, _setCursorCacheBytes, None,
+			_("""If this is a child bizobj, the approximate memory in bytes that the
+			records of its cursors, one for each parent record visited, may take up.
+			Beyond that, the least recently used cursors without changes are dropped,
+			and requeried when their parent record becomes current again. See
+			getCursorCacheStats(). Default=0 (no limit)  (int)"""))
+
+	CursorCacheSize = property(_getCursorCacheSize, _setCursorCacheSize, None,
+			_("""If this is a child bizobj, the most cursors, one for each parent
+			record visited, that it keeps. Beyond that, the least recently used
+			cursors without changes are dropped, and requeried when their parent
+			record becomes current again. See getCursorCacheStats().
+			Default=0 (no limit)  (int)"""))
+
 	_CurrentCursor = property(_getCurrentCursor, _setCurrentCursor, None,
 			_("The cursor object for the currently selected key value. (dCursorMixin child)"))
 
@@ -3236,6 +3995,13 @@ afterDelete() which is only called after a delete().""")
 	Encoding = property(_getEncoding, _setEncoding, None,
 			_("Name of encoding to use for unicode	(str)"))
 
+	FetchWindow = property(_getFetchWindow, _setFetchWindow, None,
+			_("""When greater than zero, the cursors stream their records from the
+			backend in windows of this many rows, fetching them as the record
+			pointer reaches them; bizIterator() and bizDataIterator() then walk the
+			records without loading them all first. Only use this for read-only and
+			report bizobjs. Default=0 (fetch all rows)  (int)"""))
+
 	FillLinkFromParent = property(_getFillLinkFromParent, _setFillLinkFromParent, None,
 			_("""In the onNew() method, do we fill in the foreign key field specified by the
 			LinkField property with the value returned by calling the bizobj's	getParentPK()
@@ -3265,6 +4031,24 @@ afterDelete() which is only called after a delete().""")
 	NonUpdateFields = property(_getNonUpdateFields, _setNonUpdateFields, None,
 			_("Fields in the cursor to be ignored during updates"))
 
+	PageNumber = property(_getPageNumber, None, None,
+			_("When PageSize is set, the number of the current page, counting from 0. (int)"))
+
+	PageSize = property(_getPageSize, _setPageSize, None,
+			_("""When greater than zero, requery() fetches only the first this many
+			records, and nextPage(), prevPage() and gotoPage() fetch the other pages
+			of that size. (int)
+
+			The records are ordered by the order-by clause followed by the PK.
+			nextPage() and prevPage() find the pages next to the current one with
+			a WHERE condition on those columns' values in the page's last or first
+			record, so the database doesn't have to skip over the records of all
+			the pages before it. When the order-by clause holds anything besides
+			column names, or the key values are NULL, they fall back to the
+			backend's LIMIT/OFFSET syntax. Not available with UserSQL. Defaults to 0,
+			meaning all records are fetched.
+			"""))
+
 	Parent = property(_getParent, _setParent, None,
 			_("Reference to the parent bizobj to this one. (dBizobj)"))
 
@@ -3273,6 +4057,19 @@ afterDelete() which is only called after a delete().""")
 			records. If empty, it is assumed that the parent's PK is used  (str)
 			"""))
 
+	PrefetchSize = property(_getPrefetchSize, _setPrefetchSize, None,
+			_("""If this is a child bizobj, the number of parent records whose child
+			records are fetched with a single query.  (int)
+
+			Defaults to 0, meaning each parent record's children are fetched with a
+			query of their own when the parent moves to it. When set, the first such
+			requery also fetches the children of the parent records that follow,
+			using an IN list of their link values, and the records for each parent
+			are used when the parent moves to it. This avoids running one query per
+			parent record when scanning through the parent. Only used for children
+			linked on a single field, and without a UserSQL.
+			"""))
+
 	Record = property(_getRecord, None, None,
 			_("""Represents a record in the data set. You can address individual
 			columns by referring to 'self.Record.fieldName' (read-only) (no type)
@@ -3347,14 +4144,83 @@ afterDelete() which is only called after a delete().""")
 	UserSQL = property(_getUserSQL, _setUserSQL, None,
 			_("SQL statement to run. If set, the automatic SQL builder will not be used."))
 
+	UseQueryCache = property(_getUseQueryCache, _setUseQueryCache, None,
+			_("""When True, the results of this bizobj's queries, including those run
+			with getTempCursor(), executeSafe() and lookupPKWithAdd(), are taken
+			from the connection's query cache when they are there. Only has an effect
+			if the connect info has a QueryCacheSize. Meant for lookup tables and
+			other data that rarely changes. Default=False  (bool)
+			"""))
+
+	VersionField = property(_getVersionField, _setVersionField, None,
+			_("""Name of a field whose value increases whenever a record is changed,
+			such as a timestamp or a row version number. When set, requeryChanges()
+			fetches only the records changed since the last requery.  (str)
+			"""))
+
 	VirtualFields = property(_getVirtualFields, _setVirtualFields, None,
 			_("""A dictionary mapping virtual_field_name to function to call.
 
 			The specified function will be called when getFieldVal() is called on
 			the specified virtual field name.
+
+			See the cursor's VirtualFields property for the 'depends' and
+			'column_func' keys, which cache the values of a virtual field.
 			"""))
 
 
+class _requeryRequest(object):
+	"""A background requery started by dBizobj.requeryAsync()."""
+	def __init__(self, target, params, callback, convertQMarks):
+		# The cursor whose records are replaced
+		self.target = target
+		self.params = params
+		self.callback = callback
+		self.convertQMarks = convertQMarks
+		self.sql = None
+		# The cursor that ran the query
+		self.cursor = None
+		self.error = None
+		self._cancelled = False
+		self._done = threading.Event()
+
+
+	def cancel(self):
+		"""Throw away the results of the request when they come in."""
+		self._cancelled = True
+
+
+	def isCancelled(self):
+		return self._cancelled
+
+
+	def isDone(self):
+		return self._done.isSet()
+
+
+	def wait(self, timeout=None):
+		"""Wait for the request to finish. Returns True if it has."""
+		self._done.wait(timeout)
+		return self._done.isSet()
+
+
+	def result(self, timeout=None):
+		"""
+		Wait for the request to finish, and raise the error that made it
+		fail, if any. Returns True if the results were applied.
+		"""
+		if not self.wait(timeout):
+			raise dException.dException(_("The requery has not finished"))
+		if self.error is not None:
+			raise self.error
+		return not self._cancelled
+
+
+	def _setDone(self):
+		self._done.set()
+
+
+
 class _bizIterator(object):
 	def __init__(self, obj, returnRecords=False, reversed=False, restorePointer=False,
 			flushUnchangedCursors=False):
@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
+import os
+import tempfile
+import threading
 import unittest
 import dabo
 import dabo.db
@@ -103,6 +106,73 @@ insert into %s (cField, iField, nField) values (NULL, NULL, NULL)
 		biz.Record.combined_name = "shouldn't be able to set this"
 		self.assertEqual(biz.Record.combined_name, "PaulKeithMcNett:23")
 
+	def testVirtualFieldsCached(self):
+		biz = self.biz
+		calls = []
+		def double():
+			calls.append(biz.RowNumber)
+			return biz.Record.iField * 2
+		def upperColumn(recs, suffix):
+			calls.append(len(recs))
+			return [rec["cField"].upper() + suffix for rec in recs]
+		biz.VirtualFields = {"double": {"func": double, "depends": "iField"},
+				"upper": {"column_func": upperColumn, "args": ("!",), "depends": ("cField",)},
+				"quad": {"func": lambda: biz.Record.double * 2, "depends": "double"}}
+
+		self.assertEqual(biz.getFieldVal("double", 1), 84)
+		self.assertEqual(biz.getFieldVal("double", 1), 84)
+		self.assertEqual(calls, [1])
+		self.assertEqual(biz.RowNumber, 0)
+		# The whole column is computed by one call.
+		del calls[:]
+		self.assertEqual([rec["upper"] for rec in biz.getDataSet(flds=("upper",))],
+				["PAUL KEITH MCNETT!", "EDWARD LEAFE!", "CARL KARSTEN!"])
+		self.assertEqual(calls, [3])
+
+		# Only the values that depend on the changed field are computed again.
+		del calls[:]
+		self.assertEqual(biz.getFieldVal("quad", 1), 168)
+		biz.setFieldVal("iField", 50, row=1)
+		biz.setFieldVal("nField", biz.getFieldVal("nField", 1) + 1, row=1)
+		self.assertEqual(biz.getFieldVal("quad", 1), 200)
+		self.assertEqual(biz.getFieldVal("upper", 1), "EDWARD LEAFE!")
+		self.assertEqual(calls, [1])
+		biz.setFieldVal("cField", "Ed", row=1)
+		self.assertEqual(biz.getFieldVal("upper", 0), "PAUL KEITH MCNETT!")
+		self.assertEqual(biz.getFieldVal("upper", 1), "ED!")
+		self.assertEqual(calls, [1, 1])
+		biz.cancelAll()
+		self.assertEqual([biz.getFieldVal("double", row) for row in range(3)], [46, 84, 20446])
+		self.assertEqual(biz.getFieldVal("upper", 1), "EDWARD LEAFE!")
+
+		# Adding, removing and sorting rows leaves no stale values behind.
+		biz.new()
+		biz.Record.iField = 5
+		biz.Record.cField = "new"
+		self.assertEqual(biz.Record.double, 10)
+		self.assertEqual(biz.Record.upper, "NEW!")
+		biz.cancel()
+		biz.sort("iField", "DESC")
+		self.assertEqual([biz.getFieldVal("double", row) for row in range(3)], [20446, 84, 46])
+		self.assertEqual(biz.getFieldVal("upper", 0), "CARL KARSTEN!")
+
+		# A requery, or clearing the cache, computes the values again.
+		biz._CurrentCursor.execute("update parent set iField = 1")
+		biz.requery()
+		self.assertEqual([biz.getFieldVal("double", row) for row in range(3)], [2, 2, 2])
+		biz.VirtualFields["double"]["depends"] = ()
+		biz.clearVirtualFieldCache("double")
+		biz.setFieldVal("iField", 3)
+		self.assertEqual(biz.Record.double, 6)
+		biz.setFieldVal("iField", 4)
+		self.assertEqual(biz.Record.double, 6)
+		biz.clearVirtualFieldCache()
+		self.assertEqual(biz.Record.double, 8)
+
+		biz.VirtualFields["upper"]["column_func"] = lambda recs, suffix: []
+		biz.clearVirtualFieldCache()
+		self.assertRaises(dabo.dException.dException, biz.getFieldVal, "upper")
+
 	def test_Encoding(self):
 		biz = self.biz
 		self.assertEqual(biz.Encoding, dabo.getEncoding())
@@ -690,6 +760,518 @@ insert into %s (cField, iField, nField) values (NULL, NULL, NULL)
 		"""Do the same test as for save, but with cancelAll()."""
 		self.testChangesToTwoChildRecords("cancel")
 
+	def testDirtyState(self):
+		"""isAnyChanged() must match a scan of all the records at every step."""
+		bizMain = self.biz
+		bizChild = dabo.biz.dBizobj(self.con)
+		bizChild.KeyField = "pk"
+		bizChild.DataSource = self.temp_child_table_name
+		bizChild.LinkField = "parent_fk"
+		bizChild.FillLinkFromParent = True
+		bizChild2 = dabo.biz.dBizobj(self.con)
+		bizChild2.KeyField = "pk"
+		bizChild2.DataSource = self.temp_child2_table_name
+		bizChild2.LinkField = "parent_fk"
+		bizChild2.FillLinkFromParent = True
+		bizMain.addChild(bizChild)
+		bizChild.addChild(bizChild2)
+		bizMain.requery()
+
+		def check(expected, includeNewUnchanged=None):
+			for biz in (bizMain, bizChild, bizChild2):
+				for inc in (None, True, False):
+					for withChildren in (True, False):
+						self.assertEqual(biz.isAnyChanged(inc, withChildren),
+								biz._isAnyChanged_precise(inc, withChildren))
+			self.assertEqual(bizMain.isAnyChanged(includeNewUnchanged), expected)
+
+		check(False)
+		# A change in a grandchild
+		bizChild2.Record.cPart = "flim"
+		check(True)
+		# Switching to other parents' cursors, and back again
+		bizMain.moveToPK(2)
+		check(True)
+		self.assertEqual(bizChild.isAnyChanged(), False)
+		bizMain.moveToPK(1)
+		self.assertEqual(bizChild.isAnyChanged(), True)
+		bizMain.save()
+		check(False)
+
+		# New records only count if they are to be saved unchanged.
+		bizMain.moveToPK(3)
+		bizChild.new()
+		check(False)
+		check(True, includeNewUnchanged=True)
+		bizChild.SaveNewUnchanged = True
+		check(True)
+		bizChild.Record.cInvNum = "IN00099"
+		bizMain.moveToPK(2)
+		check(True)
+		bizMain.moveToPK(3)
+		bizMain.cancel()
+		check(False)
+		check(False, includeNewUnchanged=True)
+
+		# Changes in the child cursor of a deleted parent no longer count.
+		bizChild.CascadeDeleteFromParent = False
+		bizMain.moveToPK(3)
+		bizChild.Record.cInvNum = "IN00100"
+		check(True)
+		bizMain.delete()
+		check(False)
+		# Nor do those of a parent that is no longer in the data set.
+		bizMain.moveToPK(1)
+		bizChild.Record.cInvNum = "IN00101"
+		check(True)
+		bizMain.setWhereClause("pk > 1")
+		bizMain.requery()
+		check(False)
+		bizMain.setWhereClause("")
+		bizMain.requery()
+		check(True)
+		bizMain.cancelAll()
+		check(False)
+
+		# A new parent with a new child keeps the children's changes when its
+		# temporary PK is replaced on save.
+		bizMain.new()
+		bizChild.new()
+		bizChild.Record.cInvNum = "IN00102"
+		check(True)
+		bizMain.save()
+		check(False)
+
+	def testCursorCache(self):
+		bizMain = self.biz
+		bizChild = dabo.biz.dBizobj(self.con)
+		bizChild.KeyField = "pk"
+		bizChild.DataSource = self.temp_child_table_name
+		bizChild.LinkField = "parent_fk"
+		bizMain.addChild(bizChild)
+		bizChild.CursorCacheSize = 2
+		bizMain.requery()
+		cursors = bizChild._cursorDictReference()
+
+		bizMain.moveToPK(1)
+		bizChild.Record.cInvNum = "IN00999"
+		bizMain.moveToPK(2)
+		bizMain.moveToPK(3)
+		# The cursor with changes is kept, and the oldest clean ones dropped,
+		# starting with the one created before the parent had any records.
+		self.assertEqual(sorted(cursors), [1, 3])
+		stats = bizChild.getCursorCacheStats()
+		self.assertEqual((stats["cursors"], stats["evictions"], stats["restores"]), (2, 2, 0))
+		self.assertTrue(stats["bytes"] > 0)
+		bizMain.moveToPK(1)
+		self.assertEqual([rec["cInvNum"] for rec in bizChild.getDataSet()],
+				["IN00999", "IN00455"])
+		bizMain.cancelAll()
+		self.assertEqual(bizMain.isAnyChanged(), False)
+
+		# A dropped cursor is requeried when its parent becomes current again,
+		# even when the children aren't requeried along with the move.
+		bizChild.CursorCacheSize = 1
+		self.assertEqual(cursors.keys(), [1])
+		bizMain.moveToPK(2)
+		self.assertEqual(cursors.keys(), [2])
+		restores = bizChild.getCursorCacheStats()["restores"]
+		invNums = []
+		def getInvNums():
+			invNums.extend([rec["cInvNum"] for rec in bizChild.getDataSet()])
+		bizMain.scanRows(getInvNums, [0], scanRequeryChildren=False)
+		self.assertEqual(invNums, ["IN00023", "IN00455"])
+		# Returning to the starting record restored its cursor, too.
+		self.assertEqual(bizChild.getCursorCacheStats()["restores"], restores + 2)
+
+		bizChild.CursorCacheSize = 0
+		bizChild.CursorCacheBytes = 1
+		bizMain.moveToPK(3)
+		self.assertEqual(cursors.keys(), [3])
+		self.assertEqual(bizChild.RowCount, 1)
+
+	def testApply(self):
+		biz = self.biz
+		bizChild = dabo.biz.dBizobj(self.con)
+		bizChild.KeyField = "pk"
+		bizChild.DataSource = self.temp_child_table_name
+		bizChild.LinkField = "parent_fk"
+		biz.addChild(bizChild)
+		biz.VirtualFields = {"double": lambda: biz.Record.iField * 2}
+		biz.requery()
+		biz.RowNumber = 1
+		moves = []
+		biz.afterPointerMove = lambda: moves.append(biz.RowNumber)
+		childKey = bizChild._CurrentCursorKey
+
+		self.assertEqual([(rec.pk, rec["cField"], rec.double) for rec in biz.iterRecords()],
+				[(1, "Paul Keith McNett", 46), (2, "Edward Leafe", 84),
+				(3, "Carl Karsten", 20446)])
+		self.assertEqual([rec.RowNumber for rec in biz.iterRecords(rows=(2, 0))], [2, 0])
+		# Values written through the views are tracked by the mementos.
+		def bump(rec):
+			if rec.iField < 100:
+				rec.iField += 1
+		self.assertEqual(biz.apply(bump), 2)
+		self.assertEqual(biz.getChangedRows(), [0, 1])
+		self.assertEqual(biz._CurrentCursor._mementos, {1: {"iField": 23}, 2: {"iField": 42}})
+		self.assertEqual(biz.apply(lambda rec: rec.double, fields="nField"), 3)
+		self.assertEqual(biz.apply(lambda rec: (rec.cField.upper(), rec.iField),
+				fields=("cField", "iField")), 3)
+		self.assertEqual([(rec["cField"], rec["nField"]) for rec in biz.getDataSet()],
+				[("PAUL KEITH MCNETT", 48), ("EDWARD LEAFE", 86), ("CARL KARSTEN", 20446)])
+		self.assertRaises(KeyError, biz.apply, lambda rec: rec["bogus"])
+		self.assertRaises(KeyError, biz.apply, lambda rec: 1, fields="bogus")
+		# The pointer never moved, and the children weren't touched.
+		self.assertEqual(biz.RowNumber, 1)
+		self.assertEqual(moves, [])
+		self.assertEqual(bizChild._CurrentCursorKey, childKey)
+		biz.saveAll()
+		biz.requery()
+		self.assertEqual([rec["iField"] for rec in biz.getDataSet()], [24, 43, 10223])
+
+	def testFetchWindow(self):
+		biz = self.biz
+		biz.FetchWindow = 1
+		biz.requery()
+		cur = biz._CurrentCursor
+		names = []
+		for row in biz.bizIterator():
+			names.append(biz.Record.cField)
+			if row < 2:
+				# The rows after the current one haven't been fetched yet.
+				self.assertEqual(len(cur._recordStore), row + 1)
+		self.assertEqual(names, ["Paul Keith McNett", "Edward Leafe", "Carl Karsten"])
+		self.assertEqual(biz.RowCount, 3)
+
+	def testBatchedSave(self):
+		biz = self.biz
+		biz.BatchedSave = True
+		cur = biz._CurrentCursor
+		self.assertEqual(cur.BatchedSave, True)
+		calls = []
+		bo = cur.BackendObject
+		origExecuteMany = bo.executeMany
+		def executeMany(cursor, sql, paramList):
+			calls.append(len(paramList))
+			return origExecuteMany(cursor, sql, paramList)
+		bo.executeMany = executeMany
+
+		biz.scan(biz.setFieldVal, "cField", "batched")
+		biz.new()
+		biz.Record.cField = "new one"
+		biz.new()
+		biz.Record.cField = "new two"
+		biz.saveAll()
+		# The three updates go out together; sqlite can't pregenerate PKs, so
+		# the inserts are sent one at a time to get their new PKs.
+		self.assertEqual(calls, [3])
+		self.assertEqual(biz.isAnyChanged(), False)
+		self.assertEqual(sorted(biz.getDataSet(flds=("pk",))), [{"pk": 1}, {"pk": 2},
+				{"pk": 3}, {"pk": 4}, {"pk": 5}])
+		biz.requery()
+		self.assertEqual(biz.RowCount, 5)
+		self.assertEqual([rec["cField"] for rec in biz.getDataSet()],
+				["batched", "batched", "batched", "new one", "new two"])
+
+	def testReplace(self):
+		biz = self.biz
+		biz.replace("iField", "=iField * 2", scope="iField < 100 and cField != 'Paul'")
+		self.assertEqual([rec["iField"] for rec in biz.getDataSet()], [46, 84, 10223])
+		self.assertEqual(biz.getChangedRows(), [0, 1])
+		# The expressions are compiled once, and reused.
+		func = biz._compileExpression("iField * 2")
+		biz.replace("iField", "=iField * 2", scope="iField < 100 and cField != 'Paul'")
+		self.assertTrue(biz._compileExpression("iField * 2") is func)
+		self.assertEqual([rec["iField"] for rec in biz.getDataSet()], [92, 168, 10223])
+		biz.replace("cField", "same")
+		self.assertEqual(set([rec["cField"] for rec in biz.getDataSet()]), set(["same"]))
+
+	def testPages(self):
+		biz = self.biz
+		cur = biz._CurrentCursor
+		cur.AuxCursor.execute("""
+insert into %s (cField, iField) select 'A', 42 union all select 'B', 5
+		union all select 'C', 42 union all select 'D', 7""" % self.temp_table_name)
+		executed = []
+		origExecute = cur.execute
+		def execute(sql, *args, **kwargs):
+			executed.append(sql)
+			return origExecute(sql, *args, **kwargs)
+		cur.execute = execute
+		def pks():
+			return [rec["pk"] for rec in biz.getDataSet(flds=("pk",))]
+
+		biz.PageSize = 3
+		biz.setOrderByClause("iField desc")
+		biz.requery()
+		self.assertEqual((biz.PageNumber, pks()), (0, [3, 2, 4]))
+		self.assertEqual(biz.RowNumber, 0)
+		self.assertEqual(biz.nextPage(), True)
+		self.assertEqual((biz.PageNumber, pks()), (1, [6, 1, 7]))
+		self.assertEqual(biz.nextPage(), True)
+		self.assertEqual((biz.PageNumber, pks()), (2, [5]))
+		self.assertEqual(biz.nextPage(), False)
+		self.assertEqual(biz.prevPage(), True)
+		self.assertEqual((biz.PageNumber, pks()), (1, [6, 1, 7]))
+		# The neighboring pages are found by the key values, not by skipping rows.
+		self.assertFalse([sql for sql in executed if " offset " in sql])
+		biz.gotoPage(2)
+		self.assertEqual((biz.PageNumber, pks()), (2, [5]))
+		self.assertTrue(" offset 6" in executed[-1])
+		biz.prevPage()
+		biz.prevPage()
+		self.assertEqual((biz.PageNumber, pks()), (0, [3, 2, 4]))
+		self.assertEqual(biz.prevPage(), False)
+
+		# Ordering by an expression can't be done with key values.
+		biz.setOrderByClause("iField * -1, pk")
+		biz.requery()
+		biz.nextPage()
+		self.assertEqual((biz.PageNumber, pks()), (1, [6, 1, 7]))
+		self.assertTrue(" offset 3" in executed[-1])
+		biz.PageSize = 0
+		biz.requery()
+		self.assertEqual(biz.RowCount, 7)
+
+		# Rows with NULLs in the order-by columns aren't skipped.
+		cur.AuxCursor.execute("update %s set nField = NULL where pk in (2, 5)"
+				% self.temp_table_name)
+		for order in ("nField desc", "nField asc", "nField desc, iField asc"):
+			biz.PageSize = 0
+			biz.setOrderByClause(order + ", pk")
+			biz.requery()
+			allPks = pks()
+			biz.PageSize = 2
+			biz.setOrderByClause(order)
+			del executed[:]
+			biz.requery()
+			paged = pks()
+			while biz.nextPage():
+				paged += pks()
+			self.assertEqual(paged, allPks)
+			backward = pks()
+			while biz.prevPage():
+				backward = pks() + backward
+			self.assertEqual(backward, allPks)
+			self.assertFalse([sql for sql in executed if " offset " in sql])
+
+	def testRequeryChanges(self):
+		biz = self.biz
+		cur = biz._CurrentCursor
+		aux = cur.AuxCursor
+		# A name that only works when quoted.
+		aux.execute('alter table %s add column "row ver" INT' % self.temp_table_name)
+		aux.execute('update %s set "row ver" = 1' % self.temp_table_name)
+		biz.VersionField = "row ver"
+		biz.requery()
+		biz.sort("cField")
+		biz.moveToPK(2)
+		biz.setFieldVal("iField", 99)
+
+		aux.execute("""update %s set cField = 'Zeke', "row ver" = 2 where pk = 1""" % self.temp_table_name)
+		aux.execute("""update %s set iField = 77, nField = 1.5, "row ver" = 2 where pk = 2""" % self.temp_table_name)
+		aux.execute("delete from %s where pk = 3" % self.temp_table_name)
+		# Neither a newer version, nor fetched before, this row must be found by PK.
+		aux.execute("""insert into %s (cField, "row ver") values ('Abe', 1)""" % self.temp_table_name)
+		executed = []
+		origExecute = cur.execute
+		def execute(sql, *args, **kwargs):
+			executed.append(sql)
+			return origExecute(sql, *args, **kwargs)
+		cur.execute = execute
+
+		self.assertEqual(biz.requeryChanges(), None)
+		# Only the changed and missing rows were fetched.
+		self.assertEqual(len(executed), 1)
+		self.assertTrue('"row ver" >= ' in executed[0])
+		self.assertTrue('"pk" in (' in executed[0])
+		self.assertEqual(len(cur.AuxCursor._records), 3)
+		self.assertEqual([rec["cField"] for rec in biz.getDataSet()],
+				["Abe", "Edward Leafe", "Zeke"])
+		# The pointer and the pending change stay, and the other fields are updated.
+		self.assertEqual(biz.getPK(), 2)
+		self.assertEqual(biz.Record.iField, 99)
+		self.assertEqual(biz.Record.nField, 1.5)
+		self.assertEqual(biz.getChangedRows(), [1])
+		biz.save()
+		cur.execute = origExecute
+		biz.requery()
+		records = list(cur._records)
+		self.assertEqual([rec["iField"] for rec in records], [None, 99, 23])
+
+		self.assertEqual(cur.requeryChanges(cur.lastParams), True)
+		self.assertEqual(cur._records, records)
+		# A change stamped with the greatest version already fetched is found, too.
+		aux.execute("""update %s set cField = 'Zed', "row ver" = 2 where pk = 1"""
+				% self.temp_table_name)
+		self.assertEqual(cur.requeryChanges(cur.lastParams), True)
+		self.assertEqual([rec["cField"] for rec in cur._records if rec["pk"] == 1], ["Zed"])
+		# Queries that changed since the last requery are run in full.
+		biz.setWhereClause("pk > 1")
+		self.assertEqual(cur.requeryChanges(biz.getParams()), False)
+		self.assertEqual(biz.RowCount, 2)
+
+	def testPrefetchChildren(self):
+		bizMain = self.biz
+		executed = []
+		class CountingCursor(dabo.db.dCursorMixin):
+			def execute(self, sql, *args, **kwargs):
+				if "child.parent_fk" in sql:
+					# A query for child records
+					executed.append(sql)
+				return super(CountingCursor, self).execute(sql, *args, **kwargs)
+		class ChildBizobj(dabo.biz.dBizobj):
+			def setConnection(self, conn):
+				super(ChildBizobj, self).setConnection(conn)
+				self.dCursorMixinClass = CountingCursor
+		cur = bizMain._CurrentCursor
+		for num in range(20):
+			cur.execute("insert into parent (cField) values ('more')")
+			cur.execute("insert into child (parent_fk, cInvNum) values (%s, 'x')" % (num + 4))
+		bizChild = ChildBizobj(self.con, DataSource="child", KeyField="pk",
+				LinkField="parent_fk", PrefetchSize=10)
+		bizMain.addChild(bizChild)
+		bizMain.requery()
+		self.assertEqual(len(executed), 1)
+		self.assertTrue(" in (" in executed[0])
+		counts = []
+		for row in bizMain.bizIterator():
+			counts.append(bizChild.RowCount)
+		# The records for the first row were used by the requery, so moving to it
+		# fetches them again; the other 22 parents are fetched in blocks of 10.
+		self.assertEqual(len(executed), 4)
+		self.assertEqual(counts, [2, 0, 1] + [1] * 20)
+		self.assertEqual(bizChild.Record.cInvNum, "x")
+		bizMain.first()
+		self.assertEqual(len(executed), 5)
+		self.assertEqual(bizChild.RowCount, 2)
+		# Requerying the parent discards the prefetched records.
+		cur.execute("insert into child (parent_fk, cInvNum) values (2, 'new')")
+		bizMain.requery()
+		bizMain.next()
+		self.assertEqual(len(executed), 6)
+		self.assertEqual(bizChild.Record.cInvNum, "new")
+		# ChildCacheInterval still keeps recently requeried children.
+		bizChild.ChildCacheInterval = 60
+		bizMain.prior()
+		self.assertEqual(len(executed), 6)
+		# Without prefetching, every parent record has its own query.
+		bizChild.PrefetchSize = 0
+		bizChild.ChildCacheInterval = None
+		bizMain.requery()
+		del executed[:]
+		for row in bizMain.bizIterator():
+			pass
+		self.assertEqual(len(executed), 23)
+
+	def testRequeryAsync(self):
+		# The worker thread needs a connection of its own, so pool them.
+		fd, dbFile = tempfile.mkstemp(suffix=".db")
+		os.close(fd)
+		con = dabo.db.dConnection(DbType="SQLite", Database=dbFile, MaxPoolSize=3)
+		try:
+			con.getDaboCursor().executescript("""
+create table parent (pk INTEGER PRIMARY KEY AUTOINCREMENT, cField CHAR);
+insert into parent (cField) values ("one");
+insert into parent (cField) values ("two");
+create table child (pk INTEGER PRIMARY KEY AUTOINCREMENT, parent_fk INT, cInvNum CHAR);
+insert into child (parent_fk, cInvNum) values (2, "IN00023");
+""")
+			biz = dabo.biz.dBizobj(con, DataSource="parent", KeyField="pk")
+			child = dabo.biz.dBizobj(con, DataSource="child", KeyField="pk",
+					LinkField="parent_fk")
+			biz.addChild(child)
+			requeried = []
+			biz.afterRequery = lambda: requeried.append(biz.RowCount)
+			biz.requery()
+			biz.RowNumber = 1
+			con.getDaboCursor().execute("insert into parent (cField) values ('three')")
+			finished = []
+			req = biz.requeryAsync(callback=finished.append)
+			self.assertTrue(req.result(5))
+			self.assertEqual(finished, [req])
+			self.assertEqual(requeried, [2, 3])
+			self.assertEqual([rec["cField"] for rec in biz.getDataSet()], ["one", "two", "three"])
+			# The position is restored, and the children follow it.
+			self.assertEqual(biz.Record.cField, "two")
+			self.assertEqual(child.RowCount, 1)
+			# A newer requery supersedes one that hasn't finished.
+			gate = threading.Event()
+			run = biz._runRequeryAsync
+			def slowRun(req):
+				gate.wait(5)
+				run(req)
+			biz._runRequeryAsync = slowRun
+			first = biz.requeryAsync()
+			del biz._runRequeryAsync
+			biz.UserSQL = "select * from parent where pk = 1"
+			second = biz.requeryAsync()
+			self.assertTrue(second.result(5))
+			gate.set()
+			self.assertFalse(first.result(5))
+			self.assertTrue(first.isCancelled())
+			self.assertEqual(biz.RowCount, 1)
+			# Errors are reported by result().
+			biz.UserSQL = "select * from nowhere"
+			req = biz.requeryAsync()
+			self.assertRaises(dabo.dException.DBQueryException, req.result, 5)
+			self.assertEqual(biz.RowCount, 1)
+		finally:
+			con.close()
+			os.remove(dbFile)
+
+	def testRequeryAsyncNotPooled(self):
+		# The worker thread opens a connection of its own.
+		fd, dbFile = tempfile.mkstemp(suffix=".db")
+		os.close(fd)
+		con = dabo.db.dConnection(DbType="SQLite", Database=dbFile)
+		try:
+			con.getDaboCursor().executescript("""
+create table parent (pk INTEGER PRIMARY KEY AUTOINCREMENT, cField CHAR);
+insert into parent (cField) values ("one");
+""")
+			biz = dabo.biz.dBizobj(con, DataSource="parent", KeyField="pk")
+			biz.requery()
+			con.getDaboCursor().execute("insert into parent (cField) values ('two')")
+			req = biz.requeryAsync()
+			self.assertTrue(req.result(5))
+			self.assertEqual([rec["cField"] for rec in biz.getDataSet()], ["one", "two"])
+			# The connection used in this thread is still the same one.
+			self.assertTrue(biz._CurrentCursor.connection is con._connection)
+			biz.new()
+			biz.Record.cField = "three"
+			biz.save()
+			self.assertEqual(biz.RowCount, 3)
+		finally:
+			con.close()
+			os.remove(dbFile)
+		# Another connection to an in-memory database would find it empty.
+		self.assertRaises(dabo.dException.DatabaseException, self.biz.requeryAsync)
+
+	def testRequeryAsyncPoolFull(self):
+		# This thread holds the only pooled connection; the worker opens another.
+		fd, dbFile = tempfile.mkstemp(suffix=".db")
+		os.close(fd)
+		con = dabo.db.dConnection(DbType="SQLite", Database=dbFile, MaxPoolSize=1,
+				PoolTimeout=2)
+		try:
+			con.getDaboCursor().executescript("""
+create table parent (pk INTEGER PRIMARY KEY AUTOINCREMENT, cField CHAR);
+insert into parent (cField) values ("one");
+""")
+			biz = dabo.biz.dBizobj(con, DataSource="parent", KeyField="pk")
+			biz.requery()
+			con.getDaboCursor().execute("insert into parent (cField) values ('two')")
+			req = biz.requeryAsync()
+			self.assertTrue(req.result(5))
+			self.assertEqual([rec["cField"] for rec in biz.getDataSet()], ["one", "two"])
+			self.assertEqual(con.Pool.Size, 1)
+			self.assertTrue(biz._CurrentCursor.connection is con.getConnection())
+		finally:
+			con.close()
+			os.remove(dbFile)
+
 if __name__ == "__main__":
 	suite = unittest.TestLoader().loadTestsFromTestCase(Test_dBizobj)
 	unittest.TextTestRunner(verbosity=2).run(suite)
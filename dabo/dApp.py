@@ -1013,6 +1013,10 @@ try again when it is running.
 		for the same named connection will not open multiple
 		connections. If the name doesn't exist in self.dbConnectionDefs,
 		then an exception is raised.
+
+		If the connection definition has a MaxPoolSize, the returned
+		dConnection hands each thread a connection of its own from a pool;
+		threads should call its releaseConnection() method when done.
 		"""
 		if not connName in self.dbConnections:
 			if connName in self.dbConnectionDefs:
@@ -25,7 +25,6 @@ REFINTEG_CASCADE = 3
 CURSOR_MEMENTO = "dabo-memento"
 CURSOR_NEWFLAG = "dabo-newrec"
 CURSOR_TMPKEY_FIELD = "dabo-tmpKeyField"
-CURSOR_FIELD_TYPES_CORRECTED = "dabo-fieldTypesCorrected"
 
 DLG_OK = 0
 DLG_CANCEL = -1
@@ -35,6 +35,9 @@ from dCursorMixin import dCursorMixin
 from dConnectInfo import dConnectInfo
 from dTable import dTable
 from dDataSet import dDataSet
+from dCompactRecord import dCompactRecord
+from dRecordList import dRecordList
+from dRowView import dRowView
 import dabo
 from dabo.dException import FieldNotFoundException
 
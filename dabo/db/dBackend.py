@@ -5,6 +5,7 @@ import re
 import datetime
 import threading
 import decimal
+from collections import OrderedDict
 import dabo
 from dabo.dLocalize import _
 import dabo.dException as dException
@@ -13,6 +14,7 @@ from dabo.db import dTable
 from dNoEscQuoteStr import dNoEscQuoteStr
 from dabo.lib.utils import ustr
 from dCursorMixin import dCursorMixin
+from dStatementTimings import dStatementTimings
 
 
 class dBackend(dObject):
@@ -24,6 +26,10 @@ class dBackend(dObject):
 	nameEnclosureChar = '"'
 	# The character used in sql to represent parameters to be substituted
 	paramPlaceholder = "%s"
+	# Default for the most statements kept by getStatement()
+	statementCacheMaxSize = 500
+	# Do NULLs come before the other values in an ascending sort?
+	nullsSortFirst = True
 
 	def __init__(self):
 		self._baseClass = dBackend
@@ -33,6 +39,22 @@ class dBackend(dObject):
 		# Reference to the cursor that is using this object
 		self._cursor = None
 		self.lastExecuteTime = time.time() # For keep alive interval
+		# Schema information for this connection, keyed by (kind, key), with
+		# each value stored as a (timestamp, info) tuple.
+		self._schemaCache = {}
+		# Finished SQL for the statements cursors use to save and delete
+		# records, from the least to the most recently used, along with the
+		# counters for getStatement() lookups.
+		self._statementCache = OrderedDict()
+		self._statementCacheLock = threading.Lock()
+		self._statementCacheMaxSize = self.statementCacheMaxSize
+		self._statementCacheHits = 0
+		self._statementCacheMisses = 0
+		# Cache of SELECT results, set up by dConnection when the connect info
+		# has a QueryCacheSize.
+		self._queryCache = None
+		# Timings of the statements run by cursors, when they are being collected
+		self._statementTimings = None
 
 
 	def isValidModule(self):
@@ -63,6 +85,14 @@ class dBackend(dObject):
 		return cursorClass(self._connection)
 
 
+	def sharesDatabase(self, connectInfo):
+		"""
+		Return True if each connection opened from the connect info reaches the
+		same database. Override in subclasses where that isn't so.
+		"""
+		return True
+
+
 	def formatForQuery(self, val, fieldType=None):
 		if isinstance(val, (datetime.date, datetime.datetime)):
 			# Some databases have specific rules for formatting date values.
@@ -130,6 +160,15 @@ class dBackend(dObject):
 		return
 
 
+	def executeMany(self, cursor, sql, paramList):
+		"""
+		Run the passed statement once for each parameter sequence in paramList.
+		By default this is handed to the dbapi cursor's executemany(); override
+		for backends that don't support it, or that have a faster bulk method.
+		"""
+		return cursor.superCursor.executemany(cursor, sql, paramList)
+
+
 	def processFields(self, txt):
 		"""
 		Default is to return the string unchanged. Override
@@ -212,27 +251,45 @@ class dBackend(dObject):
 		return tuple([(d[0], self.getDaboFieldType(d[1]), None) for d in cursorDescription])
 
 
+	def _getCursorConnection(self, cursor):
+		"""
+		Return the connection that the cursor runs on. Pooled connections
+		don't share the connection stored in this object.
+		"""
+		return getattr(cursor, "connection", None) or self._connection
+
+
 	def beginTransaction(self, cursor):
 		"""Begin a SQL transaction. Override in subclasses if needed."""
-		self._connection.begin()
+		self._getCursorConnection(cursor).begin()
 		dabo.dbActivityLog.info("SQL: begin")
 		return True
 
 
 	def commitTransaction(self, cursor):
 		"""Commit a SQL transaction."""
-		self._connection.commit()
+		self._getCursorConnection(cursor).commit()
 		dabo.dbActivityLog.info("SQL: commit")
 		return True
 
 
 	def rollbackTransaction(self, cursor):
 		"""Roll back (revert) a SQL transaction."""
-		self._connection.rollback()
+		self._getCursorConnection(cursor).rollback()
 		dabo.dbActivityLog.info("SQL: rollback")
 		return True
 
 
+	def inTransaction(self, cursor):
+		"""
+		Return True if the cursor's connection may be in a transaction, whose
+		changes other connections can't see until it ends. DB-API connections
+		begin one implicitly, so this returns True unless overridden by
+		backends that can tell, or that run in autocommit mode.
+		"""
+		return True
+
+
 	@staticmethod
 	def addWithSep(base, new, sep=",\n\t"):
 		"""
@@ -365,6 +422,24 @@ class dBackend(dObject):
 		return "limit"
 
 
+	def getLimitPosition(self):
+		"""
+		Return where the limit clause goes: 'bottom' (at the end of the
+		statement), or 'top' (before the field list). Override for backends
+		that put it at the top.
+		"""
+		return "bottom"
+
+
+	def getLimitOffset(self, limit, offset):
+		"""
+		Return what follows the limit word in a limit clause that skips
+		'offset' rows and returns up to 'limit' rows. Override for backends
+		that use a different syntax.
+		"""
+		return "%s offset %s" % (limit, offset)
+
+
 	def formSQL(self, fieldClause, fromClause, joinClause,
 				whereClause, groupByClause, orderByClause, limitClause):
 		"""
@@ -562,6 +637,101 @@ class dBackend(dObject):
 		return tuple(ret)
 
 
+	def getSchemaInfo(self, kind, key, func, *args, **kwargs):
+		"""
+		Return cached schema information for this connection. The 'kind' is the
+		type of information, such as 'fields' or 'structure', and 'key' is the
+		table name, or a tuple starting with the table name. When nothing is
+		cached, or the cached entry is older than SchemaCacheTTL, func(*args,
+		**kwargs) is called to get the information, and the result is cached.
+		"""
+		ttl = self.SchemaCacheTTL
+		if ttl == 0:
+			# Caching is turned off.
+			return func(*args, **kwargs)
+		cacheKey = (kind, key)
+		try:
+			stamp, info = self._schemaCache[cacheKey]
+			if ttl is None or (time.time() - stamp) < ttl:
+				return info
+		except KeyError:
+			pass
+		info = func(*args, **kwargs)
+		self._schemaCache[cacheKey] = (time.time(), info)
+		return info
+
+
+	def clearSchemaCache(self, tableName=None):
+		"""
+		Discard the cached schema information for the passed table, or for all
+		tables if tableName is None. Call this after altering a table outside
+		of Dabo; DDL run through a Dabo cursor clears the cache automatically.
+		"""
+		if tableName is None:
+			self._schemaCache.clear()
+			return
+		for cacheKey in self._schemaCache.keys():
+			key = cacheKey[1]
+			if isinstance(key, tuple):
+				key = key[0]
+			if key == tableName:
+				del self._schemaCache[cacheKey]
+
+
+	def getStatement(self, key, func, *args, **kwargs):
+		"""
+		Return the SQL statement cached under 'key', calling func(*args, **kwargs)
+		to build it the first time it is requested. Cursors use this for the
+		parameterised statements that save and delete records, keyed on the
+		table, operation, columns and key fields. Since the same text is sent
+		each time, drivers that keep their own prepared statement caches (such
+		as sqlite3, cx_Oracle and kinterbasdb) can reuse those, too.
+
+		At most StatementCacheMaxSize statements are kept; the least recently
+		used one is dropped to make room for a new one.
+		"""
+		cache = self._statementCache
+		self._statementCacheLock.acquire()
+		try:
+			sql = cache.pop(key, None)
+			if sql is not None:
+				# Mark it as the most recently used one.
+				cache[key] = sql
+				self._statementCacheHits += 1
+				return sql
+			self._statementCacheMisses += 1
+		finally:
+			self._statementCacheLock.release()
+		sql = func(*args, **kwargs)
+		self._statementCacheLock.acquire()
+		try:
+			cache[key] = sql
+			self._trimStatementCache()
+		finally:
+			self._statementCacheLock.release()
+		return sql
+
+
+	def clearStatementCache(self):
+		"""Discard all the cached statements, and reset the hit and miss counters."""
+		self._statementCacheLock.acquire()
+		try:
+			self._statementCache.clear()
+			self._statementCacheHits = self._statementCacheMisses = 0
+		finally:
+			self._statementCacheLock.release()
+
+
+	def _trimStatementCache(self):
+		"""Drop the least recently used statements over the limit. Call with the lock held."""
+		cache = self._statementCache
+		maxSize = self._statementCacheMaxSize
+		if maxSize is None:
+			return
+		while len(cache) > maxSize:
+			cache.popitem(last=False)
+
+
 	##########		Created by Echo 	##############
 	def isExistingTable(self, table):
 		"""Returns whether or not the table exists."""
@@ -654,6 +824,16 @@ class dBackend(dObject):
 			wt = self._keepAliveThread = WorkerThread(self)
 			wt.start()
 
+	def _getCollectStatementTimings(self):
+		return self._statementTimings is not None
+
+	def _setCollectStatementTimings(self, val):
+		if not val:
+			self._statementTimings = None
+		elif self._statementTimings is None:
+			self._statementTimings = dStatementTimings()
+
+
 	def _getEncoding(self):
 		"""Get backend encoding."""
 		try:
@@ -682,6 +862,58 @@ class dBackend(dObject):
 		self._applyKeepAlive()
 
 
+	def _getQueryCache(self):
+		return self._queryCache
+
+	def _setQueryCache(self, val):
+		self._queryCache = val
+
+
+	def _getSchemaCacheTTL(self):
+		try:
+			ret = self._schemaCacheTTL
+		except AttributeError:
+			ret = self._schemaCacheTTL = dabo.schemaCacheTTL
+		return ret
+
+	def _setSchemaCacheTTL(self, val):
+		self._schemaCacheTTL = val
+
+
+	def _getStatementTimings(self):
+		return self._statementTimings
+
+
+	def _getStatementCacheHits(self):
+		return self._statementCacheHits
+
+
+	def _getStatementCacheMaxSize(self):
+		return self._statementCacheMaxSize
+
+	def _setStatementCacheMaxSize(self, val):
+		self._statementCacheLock.acquire()
+		try:
+			self._statementCacheMaxSize = val
+			self._trimStatementCache()
+		finally:
+			self._statementCacheLock.release()
+
+
+	def _getStatementCacheMisses(self):
+		return self._statementCacheMisses
+
+
+	def _getStatementCacheSize(self):
+		return len(self._statementCache)
+
+
+	CollectStatementTimings = property(_getCollectStatementTimings,
+			_setCollectStatementTimings, None,
+			_("""When True, the time taken by each statement that the cursors on this
+			connection run is recorded in StatementTimings. Setting it to False
+			discards the timings. Default=False  (bool)"""))
+
 	Encoding = property(_getEncoding, _setEncoding, None,
 			_("Backend encoding  (str)"))
 
@@ -691,3 +923,33 @@ class dBackend(dObject):
 			Defaults to None, meaning we never send a KeepAlive query. The interval
 			is expressed in seconds.
 			"""))
+
+	QueryCache = property(_getQueryCache, _setQueryCache, None,
+			_("""Cache of the results of SELECT statements run by cursors that have
+			UseQueryCache set, or None if there is no cache.  (dQueryCache)"""))
+
+	SchemaCacheTTL = property(_getSchemaCacheTTL, _setSchemaCacheTTL, None,
+			_("""Number of seconds that table field lists, structure descriptions
+			and non-update field lists are cached for this connection. None means
+			they are kept until clearSchemaCache() is called, or DDL is run through
+			a Dabo cursor; 0 turns off the cache. Defaults to dabo.schemaCacheTTL.
+			(int or None)"""))
+
+	StatementCacheHits = property(_getStatementCacheHits, None, None,
+			_("Number of times a statement was found in the statement cache. (read-only) (int)"))
+
+	StatementCacheMaxSize = property(_getStatementCacheMaxSize, _setStatementCacheMaxSize, None,
+			_("""Most statements kept in the statement cache; the least recently used
+			ones are dropped to make room. None means no limit. Default=500  (int)"""))
+
+	StatementCacheMisses = property(_getStatementCacheMisses, None, None,
+			_("""Number of times a statement had to be built because it wasn't in the
+			statement cache. (read-only) (int)"""))
+
+	StatementCacheSize = property(_getStatementCacheSize, None, None,
+			_("Number of statements in the statement cache. (read-only) (int)"))
+
+	StatementTimings = property(_getStatementTimings, None, None,
+			_("""The timings collected while CollectStatementTimings is True, grouped by
+			statement shape, or None. Use its getStats() or toCSV() methods to
+			read them. (read-only) (dStatementTimings)"""))
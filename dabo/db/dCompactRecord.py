@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+from dabo.dLocalize import _
+
+
+
+class dCompactRecord(object):
+	"""
+	Memory-light replacement for the dict that normally holds each record in
+	a cursor's data set. It is used when the cursor's CompactRecords property
+	is True.
+
+	The field values are kept in a plain list, and the mapping of field names
+	to list positions is shared by all the records of a result set. Any key
+	that isn't one of those fields, such as the cursor's internal 'dabo-'
+	flags on new records, goes into a small dict that is only created for
+	the records that need it.
+
+	It supports the parts of the dict API that Dabo uses on its records, so
+	code that works with the records of a cursor doesn't need to know which
+	kind it is dealing with.
+	"""
+	__slots__ = ("_fields", "_fieldIndex", "_values", "_extra")
+
+	def __init__(self, fields, fieldIndex, values):
+		# 'fields' is the tuple of field names, and 'fieldIndex' the dict that
+		# maps each name to its position. Both are shared, not copied.
+		self._fields = fields
+		self._fieldIndex = fieldIndex
+		self._values = values
+		self._extra = None
+
+
+	@classmethod
+	def fromDict(cls, fields, fieldIndex, rec):
+		"""Create a compact record holding the contents of the passed dict."""
+		ret = cls(fields, fieldIndex, [rec.get(fld) for fld in fields])
+		extra = [(key, val) for key, val in rec.iteritems() if key not in fieldIndex]
+		if extra:
+			ret._extra = dict(extra)
+		return ret
+
+
+	def __getitem__(self, key):
+		try:
+			return self._values[self._fieldIndex[key]]
+		except KeyError:
+			if self._extra is None:
+				raise
+			return self._extra[key]
+
+
+	def __setitem__(self, key, val):
+		try:
+			self._values[self._fieldIndex[key]] = val
+		except KeyError:
+			if self._extra is None:
+				self._extra = {}
+			self._extra[key] = val
+
+
+	def __delitem__(self, key):
+		if key in self._fieldIndex:
+			raise TypeError(_("Field '%s' can't be removed from a compact record.") % key)
+		if self._extra is None:
+			raise KeyError(key)
+		del self._extra[key]
+		if not self._extra:
+			self._extra = None
+
+
+	def __contains__(self, key):
+		return (key in self._fieldIndex) or (self._extra is not None and key in self._extra)
+
+	has_key = __contains__
+
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	iterkeys = __iter__
+
+
+	def __len__(self):
+		return len(self._fields) + len(self._extra or ())
+
+
+	def __eq__(self, other):
+		try:
+			return dict(self.items()) == dict(other.items())
+		except AttributeError:
+			return False
+
+
+	def __ne__(self, other):
+		return not self.__eq__(other)
+
+
+	def __repr__(self):
+		return repr(dict(self.items()))
+
+
+	def keys(self):
+		ret = list(self._fields)
+		if self._extra:
+			ret.extend(self._extra.keys())
+		return ret
+
+
+	def values(self):
+		ret = list(self._values)
+		if self._extra:
+			ret.extend(self._extra.values())
+		return ret
+
+
+	def items(self):
+		ret = zip(self._fields, self._values)
+		if self._extra:
+			ret.extend(self._extra.items())
+		return ret
+
+
+	def itervalues(self):
+		return iter(self.values())
+
+
+	def iteritems(self):
+		return iter(self.items())
+
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+
+	def pop(self, key, *args):
+		if key in self._fieldIndex:
+			raise TypeError(_("Field '%s' can't be removed from a compact record.") % key)
+		try:
+			val = self._extra[key]
+		except (KeyError, TypeError):
+			if args:
+				return args[0]
+			raise KeyError(key)
+		del self[key]
+		return val
+
+
+	def setdefault(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			self[key] = default
+			return default
+
+
+	def update(self, other=None, **kwargs):
+		if other is not None:
+			if hasattr(other, "keys"):
+				for key in other.keys():
+					self[key] = other[key]
+			else:
+				for key, val in other:
+					self[key] = val
+		for key, val in kwargs.iteritems():
+			self[key] = val
+
+
+	def copy(self):
+		ret = self.__class__(self._fields, self._fieldIndex, list(self._values))
+		if self._extra:
+			ret._extra = self._extra.copy()
+		return ret
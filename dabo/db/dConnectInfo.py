@@ -51,6 +51,10 @@ class dConnectInfo(dObject):
 		self._backendObject = None
 		self._host = self._user = self._password = self._dbType = self._database = self._port = self._name = self._remoteHost = ""
 		self._keepAliveInterval = None
+		self._minPoolSize = 0
+		self._maxPoolSize = self._poolTimeout = None
+		self._queryCacheSize = 0
+		self._queryCacheTTL = None
 		super(dConnectInfo, self).__init__(**kwargs)
 		if connInfo:
 			self.setConnInfo(connInfo)
@@ -61,7 +65,9 @@ class dConnectInfo(dObject):
 		# a valid property name, raise TypeError.
 		self._customParameters = {}
 		props = ["Name", "DbType", "Host", "User", "Password", "Database",
-				"PlainTextPassword", "Port", "RemoteHost", "KeepAliveInterval"]
+				"PlainTextPassword", "Port", "RemoteHost", "KeepAliveInterval",
+				"MinPoolSize", "MaxPoolSize", "PoolTimeout", "QueryCacheSize",
+				"QueryCacheTTL"]
 		lprops = [p.lower() for p in props]
 		for k, v in connInfo.items():
 			try:
@@ -216,6 +222,24 @@ class dConnectInfo(dObject):
 		self._keepAliveInterval = val
 
 
+	def _getMaxPoolSize(self):
+		return self._maxPoolSize
+
+	def _setMaxPoolSize(self, val):
+		if not val:
+			val = None
+		else:
+			val = int(val)
+		self._maxPoolSize = val
+
+
+	def _getMinPoolSize(self):
+		return self._minPoolSize
+
+	def _setMinPoolSize(self, val):
+		self._minPoolSize = int(val or 0)
+
+
 	def _getName(self):
 		return self._name
 
@@ -234,6 +258,17 @@ class dConnectInfo(dObject):
 		self._password = self.encrypt(val)
 
 
+	def _getPoolTimeout(self):
+		return self._poolTimeout
+
+	def _setPoolTimeout(self, val):
+		if val in (None, ""):
+			val = None
+		else:
+			val = float(val)
+		self._poolTimeout = val
+
+
 	def _getPort(self):
 		return self._port
 
@@ -244,6 +279,24 @@ class dConnectInfo(dObject):
 			self._port = None
 
 
+	def _getQueryCacheSize(self):
+		return self._queryCacheSize
+
+	def _setQueryCacheSize(self, val):
+		self._queryCacheSize = int(val or 0)
+
+
+	def _getQueryCacheTTL(self):
+		return self._queryCacheTTL
+
+	def _setQueryCacheTTL(self, val):
+		if val in (None, ""):
+			val = None
+		else:
+			val = float(val)
+		self._queryCacheTTL = val
+
+
 	def _getRemoteHost(self):
 		return self._remoteHost
 
@@ -282,6 +335,18 @@ class dConnectInfo(dObject):
 			is expressed in seconds.
 			"""))
 
+	MaxPoolSize = property(_getMaxPoolSize, _setMaxPoolSize, None,
+			_("""Maximum number of connections to open. (int)
+
+			Defaults to None, meaning that a single connection is opened and shared
+			by everything that uses it. When set, connections are pooled, and each
+			thread checks out a connection of its own; see dConnectionPool.
+			"""))
+
+	MinPoolSize = property(_getMinPoolSize, _setMinPoolSize, None,
+			_("""Number of connections opened when the pool is created. Only used
+			when MaxPoolSize is set.  (int)"""))
+
 	Name = property(_getName, _setName, None,
 			_("The name used to reference this connection. (str)"))
 
@@ -292,9 +357,24 @@ class dConnectInfo(dObject):
 			_("""Write-only property that encrypts the value and stores that
 				in the Password property. (str)"""))
 
+	PoolTimeout = property(_getPoolTimeout, _setPoolTimeout, None,
+			_("""Seconds to wait for a pooled connection when all of them are in use,
+			before raising ConnectionPoolExhaustedException. None (the default) means
+			wait until one is checked in.  (float)"""))
+
 	Port = property(_getPort, _setPort, None,
 			_("The port to connect on (may not be applicable for all databases). (int)"))
 
+	QueryCacheSize = property(_getQueryCacheSize, _setQueryCacheSize, None,
+			_("""Number of SELECT results to cache for the cursors that have
+			UseQueryCache set. Defaults to 0, meaning no results are cached; see
+			dQueryCache.  (int)"""))
+
+	QueryCacheTTL = property(_getQueryCacheTTL, _setQueryCacheTTL, None,
+			_("""Seconds that cached SELECT results are used for. None (the default)
+			means they are used until a Dabo cursor changes one of their tables.
+			(float)"""))
+
 	RemoteHost = property(_getRemoteHost, _setRemoteHost, None,
 			_("When running as a web app, this holds the host URL. (str)"))
 
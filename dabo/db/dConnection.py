@@ -1,15 +1,28 @@
 # -*- coding: utf-8 -*-
 from dabo.dLocalize import _
+import dabo.dException as dException
 from dabo.dObject import dObject
 from dConnectInfo import dConnectInfo
+from dConnectionPool import dConnectionPool
+from dQueryCache import dQueryCache
 from dCursorMixin import dCursorMixin
 
 
 class dConnection(dObject):
-	"""Hold a connection to a backend database."""
+	"""
+	Hold a connection to a backend database.
+
+	If the connect info has a MaxPoolSize, the connection is pooled: each
+	thread that asks for a connection or a cursor gets a connection of its
+	own from the pool, and keeps it until it calls releaseConnection().
+
+	If the connect info has a QueryCacheSize, the results of SELECTs run by
+	cursors with UseQueryCache set are cached; see dQueryCache.
+	"""
 	def __init__(self, connectInfo=None, parent=None, forceCreate=False, **kwargs):
 		self._baseClass = dConnection
 		self._forceCreate = forceCreate
+		self._connectKwargs = kwargs
 		super(dConnection, self).__init__()
 		# Store a reference to the parent object (bizobj maybe; app
 		# object connection collection most likely)
@@ -29,15 +42,79 @@ class dConnection(dObject):
 			self._connectInfo = dConnectInfo(connInfo=connectInfo)
 		else:
 			raise TypeError("dConnectInfo instance or kwargs not sent.")
-		self._connection = self._openConnection(**kwargs)
+		ci = self._connectInfo
+		if ci.MaxPoolSize:
+			if not self.getBackendObject().sharesDatabase(ci):
+				# Each pooled connection would get a database of its own.
+				raise dException.DatabaseException(
+						_("The connections to the database '%s' can't be pooled") % ci.Database)
+			self._pool = dConnectionPool(ci, minSize=ci.MinPoolSize,
+					maxSize=ci.MaxPoolSize, timeout=ci.PoolTimeout,
+					forceCreate=forceCreate, **kwargs)
+			self._connection = None
+			if not self._pool.Size:
+				# Open one connection now, so that the backend is set up, and
+				# any problem connecting shows up here as it does when not pooled.
+				self._pool.checkout()
+				self._pool.checkin()
+		else:
+			self._pool = None
+			self._connection = self._openConnection(**kwargs)
+		bo = self.getBackendObject()
+		if ci.QueryCacheSize and bo.QueryCache is None:
+			bo.QueryCache = dQueryCache(ci.QueryCacheSize, ci.QueryCacheTTL)
 
 
 	def getConnection(self):
-		return self._connection
+		"""
+		Return the DB-API connection. When pooled, this is the connection held
+		by the calling thread, which is checked out of the pool the first time
+		the thread asks for it.
+		"""
+		pool = self._pool
+		if pool is None:
+			return self._connection
+		conn = pool.getHeldConnection()
+		if conn is None:
+			conn = pool.checkout()
+		return conn
+
+
+	def releaseConnection(self):
+		"""
+		Check the calling thread's connection back in to the pool, so that
+		other threads can use it. Cursors created in this thread must not be
+		used after this. Does nothing if the connection isn't pooled.
+		"""
+		if self._pool is not None:
+			self._pool.checkin(force=True)
+
+
+	def openConnection(self):
+		"""
+		Open a new DB-API connection to the database, outside of the pool, for
+		a thread that can't use this object's connection. The caller must close
+		it. Raises DatabaseException if a new connection wouldn't reach the same
+		database, as with in-memory SQLite databases.
+		"""
+		ci = self._connectInfo
+		bo = self.getBackendObject()
+		if not bo.sharesDatabase(ci):
+			raise dException.DatabaseException(
+					_("Another connection can't be opened to the database '%s'") % ci.Database)
+		held = bo._connection
+		try:
+			return ci.getConnection(forceCreate=self._forceCreate, **self._connectKwargs)
+		finally:
+			# The backend stores the connection it opened last; keep it on ours.
+			bo._connection = held
 
 
 	def close(self):
-		self._connection.close()
+		if self._pool is None:
+			self._connection.close()
+		else:
+			self._pool.close()
 
 
 	def getDictCursorClass(self):
@@ -49,7 +126,9 @@ class dConnection(dObject):
 
 
 	def getCursor(self, cursorClass):
-		return self.getBackendObject().getCursor(cursorClass)
+		if self._pool is None:
+			return cursorClass(self._connection)
+		return cursorClass(self.getConnection())
 
 
 	def getDaboCursor(self, cursorClass=None):
@@ -70,8 +149,11 @@ class dConnection(dObject):
 						pass
 
 		bo = self.getBackendObject()
-		crs = bo.getCursor(DaboCursor)
+		crs = self.getCursor(DaboCursor)
 		crs.BackendObject = bo
+		# Have the AuxCursor created here, too, so that a pooled one uses
+		# this thread's connection.
+		crs.setCursorFactory(self.getCursor, DaboCursor)
 		# Return the AuxCursor, as it skips some of the unnecessary
 		# configuration and housekeeping
 		return crs.AuxCursor
@@ -105,6 +187,14 @@ class dConnection(dObject):
 		return self._connectInfo
 
 
+	def _getPool(self):
+		return self._pool
+
+
+	def _getQueryCache(self):
+		return self.getBackendObject().QueryCache
+
+
 	def _getName(self):
 		try:
 			return self.ConnectInfo.Name
@@ -118,6 +208,14 @@ class dConnection(dObject):
 	Name = property(_getName, None, None,
 			_("The name of the connection.  (str)"))
 
+	Pool = property(_getPool, None, None,
+			_("The pool of connections, or None if the connection isn't pooled.  (dConnectionPool)"))
+
+	QueryCache = property(_getQueryCache, None, None,
+			_("""The cache of SELECT results, or None if the connect info has no
+			QueryCacheSize. Its getStats() method returns the hit and miss counts.
+			(dQueryCache)"""))
+
 
 
 if __name__ == "__main__":
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import dabo
+from dabo.dLocalize import _
+import dabo.dException as dException
+
+
+
+class dConnectionPool(object):
+	"""
+	Pool of DB-API connections that are all opened from the same dConnectInfo.
+
+	A thread checks a connection out, and keeps it until it checks it back in.
+	If a thread that already holds a connection checks out again, it gets the
+	same connection back, so all the cursors created in a thread share one
+	connection, and one transaction. Each checkout() must be matched by a
+	checkin(); the connection goes back to the pool after the last one.
+
+	When all MaxSize connections are in use, checkout() waits up to Timeout
+	seconds for one to be checked in. Connections held by threads that have
+	exited are closed to make room for new ones.
+
+	An idle connection that hasn't been used for CheckInterval seconds is
+	tested with the same 'select 1' query that the KeepAlive thread sends
+	before it is handed out again. Connections that fail the test are closed
+	and replaced with new ones.
+	"""
+	# Query used to check that an idle connection still works.
+	checkSQL = "select 1"
+	# Seconds that a connection can be idle before it is checked, when the
+	# connect info doesn't specify a KeepAliveInterval.
+	defaultCheckInterval = 30
+
+	def __init__(self, connectInfo, minSize=0, maxSize=None, timeout=None,
+			checkInterval=None, **kwargs):
+		self._connectInfo = connectInfo
+		# Passed to connectInfo.getConnection() for each new connection.
+		self._connectKwargs = kwargs
+		self.MinSize = minSize or 0
+		self.MaxSize = maxSize
+		self.Timeout = timeout
+		if checkInterval is None:
+			checkInterval = connectInfo.KeepAliveInterval
+			if checkInterval is None:
+				checkInterval = self.defaultCheckInterval
+		self.CheckInterval = checkInterval
+		self._lock = threading.Condition()
+		# Checked-in connections, as (connection, lastUsed) tuples.
+		self._idle = []
+		# Checked-out connections, as [connection, checkoutCount] lists keyed
+		# by the thread holding them.
+		self._held = {}
+		# Number of open connections, including ones that are being opened.
+		self._size = 0
+		self._closed = False
+		for num in range(self.MinSize):
+			self._size += 1
+			try:
+				conn = self._open()
+			except StandardError:
+				self._size -= 1
+				raise
+			self._idle.append((conn, time.time()))
+
+
+	def checkout(self, block=True):
+		"""
+		Return a connection for the calling thread. See the class docs. If
+		'block' is False, return None instead of waiting when all the
+		connections are in use.
+		"""
+		thd = threading.currentThread()
+		deadline = None
+		while True:
+			self._lock.acquire()
+			try:
+				held = self._held.get(thd)
+				if held is not None:
+					held[1] += 1
+					return held[0]
+				if self._closed:
+					raise dException.DatabaseException(_("The connection pool has been closed"))
+				if not self._idle and not self._hasRoom():
+					self._reclaim()
+				if self._idle:
+					conn, lastUsed = self._idle.pop()
+				elif self._hasRoom():
+					conn = lastUsed = None
+					self._size += 1
+				else:
+					if not block:
+						return None
+					if self.Timeout is None:
+						self._lock.wait()
+					else:
+						if deadline is None:
+							deadline = time.time() + self.Timeout
+						remaining = deadline - time.time()
+						if remaining <= 0:
+							raise dException.ConnectionPoolExhaustedException(
+									_("All %s pooled connections are in use") % self.MaxSize)
+						self._lock.wait(remaining)
+					continue
+			finally:
+				self._lock.release()
+
+			# Open or check the connection outside of the lock, so that other
+			# threads aren't held up by the round trip to the server.
+			if conn is None:
+				try:
+					conn = self._open()
+				except StandardError:
+					self._discard(None)
+					raise
+			elif not self._isAlive(conn, lastUsed):
+				self._discard(conn)
+				continue
+			self._lock.acquire()
+			try:
+				self._held[thd] = [conn, 1]
+			finally:
+				self._lock.release()
+			return conn
+
+
+	def checkin(self, force=False):
+		"""
+		Check in the connection held by the calling thread. Returns True if
+		it went back to the pool, or False if the thread still holds it from
+		an earlier checkout(), or didn't hold a connection. Pass force=True
+		to return it regardless of how many times it was checked out.
+		"""
+		thd = threading.currentThread()
+		self._lock.acquire()
+		try:
+			held = self._held.get(thd)
+			if held is None:
+				return False
+			held[1] -= 1
+			if held[1] > 0 and not force:
+				return False
+			del self._held[thd]
+			closed = self._closed
+		finally:
+			self._lock.release()
+
+		conn = held[0]
+		if closed:
+			self._discard(conn)
+			return True
+		try:
+			# Don't pass on any uncommitted work to the next thread.
+			conn.rollback()
+		except StandardError, e:
+			dabo.dbActivityLog.info(_("Discarding pooled connection: %s") % e)
+			self._discard(conn)
+			return True
+		self._lock.acquire()
+		try:
+			self._idle.append((conn, time.time()))
+			self._lock.notify()
+		finally:
+			self._lock.release()
+		return True
+
+
+	def getHeldConnection(self):
+		"""Return the connection held by the calling thread, or None."""
+		held = self._held.get(threading.currentThread())
+		if held is None:
+			return None
+		return held[0]
+
+
+	def close(self):
+		"""
+		Close the idle connections. Connections that are checked out are
+		closed when they are checked in.
+		"""
+		self._lock.acquire()
+		try:
+			self._closed = True
+			idle = self._idle
+			self._idle = []
+			self._lock.notifyAll()
+		finally:
+			self._lock.release()
+		for conn, lastUsed in idle:
+			self._discard(conn)
+
+
+	def _hasRoom(self):
+		return self.MaxSize is None or self._size < self.MaxSize
+
+
+	def _open(self):
+		"""
+		Open a new connection. The backend stores the connection it opened
+		last; it keeps the first one, which the pool opened for the thread that
+		created it.
+		"""
+		bo = self._connectInfo.getBackendObject()
+		held = bo._connection
+		try:
+			return self._connectInfo.getConnection(**self._connectKwargs)
+		finally:
+			if held is not None:
+				bo._connection = held
+
+
+	def _discard(self, conn):
+		"""Close the connection, and make room in the pool for a new one."""
+		if conn is not None:
+			try:
+				conn.close()
+			except StandardError:
+				pass
+		self._lock.acquire()
+		try:
+			self._size -= 1
+			self._lock.notify()
+		finally:
+			self._lock.release()
+
+
+	def _reclaim(self):
+		"""
+		Close the connections held by threads that have exited. Must be
+		called with the lock held.
+		"""
+		for thd, held in self._held.items():
+			if not thd.isAlive():
+				del self._held[thd]
+				try:
+					held[0].close()
+				except StandardError:
+					pass
+				self._size -= 1
+
+
+	def _isAlive(self, conn, lastUsed):
+		"""Return True if the connection has been used recently, or still works."""
+		if time.time() - lastUsed < self.CheckInterval:
+			return True
+		try:
+			crs = conn.cursor()
+			crs.execute(self.checkSQL)
+			crs.close()
+		except StandardError, e:
+			dabo.dbActivityLog.info(_("Discarding pooled connection: %s") % e)
+			return False
+		return True
+
+
+	def _getIdleCount(self):
+		return len(self._idle)
+
+
+	def _getSize(self):
+		return self._size
+
+
+	IdleCount = property(_getIdleCount, None, None,
+			_("Number of connections that are checked in.  (int)"))
+
+	Size = property(_getSize, None, None,
+			_("Number of open connections, both checked in and checked out.  (int)"))
@@ -2,6 +2,8 @@
 # dabo/db/dCursorMixin
 
 import datetime
+import logging
+import sys
 import time
 import re
 from decimal import Decimal
@@ -13,19 +15,55 @@ import dabo.dException as dException
 from dabo.dObject import dObject
 from dNoEscQuoteStr import dNoEscQuoteStr
 from dabo.db.dDataSet import dDataSet
+from dabo.db.dCompactRecord import dCompactRecord
+from dabo.db.dRecordList import dRecordList
+from dabo.db.dRowView import dRowView
+from dabo.db.dSeekIndex import dSeekIndex
 from dabo.lib import dates
-from dabo.lib.utils import noneSortKey, caseInsensitiveSortKey
 from dabo.lib.utils import ustr
 
+# Types of the values that are converted to a string when set in a string field
+_strConvTypes = (str, unicode, int, float, long, complex)
+# Date and DateTime types are handled as character, even if the native field
+# type is not. NOTE: we have to deal with the string representation of these
+# classes, as there is no primitive for either 'DateTime' or 'Date'.
+_dateTypeStrings = ("<type 'DateTime'>", "<type 'Date'>", "<type 'datetime.datetime'>",
+		"<type 'datetime.date'>")
+
 cursor_flags = (kons.CURSOR_MEMENTO, kons.CURSOR_NEWFLAG,
-		kons.CURSOR_TMPKEY_FIELD, kons.CURSOR_FIELD_TYPES_CORRECTED)
+		kons.CURSOR_TMPKEY_FIELD)
+# Order-by items that pages can be found by key values for: a column name,
+# optionally qualified and quoted, and optionally followed by asc or desc.
+_keysetOrderPattern = re.compile(r"""^\s*([\w"`\[\]]+(?:\.[\w"`\[\]]+)?)(?:\s+(asc|desc))?\s*$""",
+		re.IGNORECASE)
+
+
+def _dbLogEnabled(level=logging.INFO):
+	"""
+	Return True if a message of the passed level sent to dabo.dbActivityLog
+	would be written by any of its handlers. By default, the log accepts
+	every message, but only passes errors to the console, so checking the
+	log's level alone isn't enough to skip building messages.
+	"""
+	logger = dabo.dbActivityLog
+	if not logger.isEnabledFor(level):
+		return False
+	while logger is not None:
+		for handler in logger.handlers:
+			if level >= handler.level:
+				return True
+		if not logger.propagate:
+			break
+		logger = logger.parent
+	return False
 
 
 class dCursorMixin(dObject):
 	"""Dabo's cursor class, representing the lowest tier."""
 	_call_initProperties = False
-	# Make these class attributes, so that they are shared among all instances
-	_fieldStructure = {}
+	# Most rows that requeryChanges() will fetch by PK; if more rows than this
+	# are missing, it runs a full requery instead.
+	maxChangedKeys = 500
 
 	def __init__(self, sql="", *args, **kwargs):
 		self._convertStrToUnicode = True
@@ -60,6 +98,10 @@ class dCursorMixin(dObject):
 	def _initProperties(self):
 		# Holds the dict used for adding new blank records
 		self._blank = {}
+		# Cached (key, converters) pair used to correct the types of fetched values
+		self._converterPlan = None
+		# Cached per-field details used by setFieldVal(); see _getFieldDescriptors()
+		self._fieldDescriptors = None
 		# Flag for indicating NULL default values were set
 		self._nullDefaults = False
 		# Writable version of the dbapi 'description' attribute
@@ -82,8 +124,9 @@ class dCursorMixin(dObject):
 		self.__lastFieldList = ""
 		self._whitespacePat = re.compile(r"(\s+)")
 		self._selectStatementPat = re.compile(r"\bselect\b(.+)\bfrom\b", re.I | re.M | re.S)
-		# Holds the keys in the original, unsorted order for unsorting the dataset
-		self.__unsortedRows = []
+		# Maps the keys to their positions in the original, unsorted order, for
+		# unsorting the dataset
+		self.__unsortedRows = {}
 		# Holds the name of fields to be skipped when updating the backend, such
 		# as calculated or derived fields, or fields that are otherwise not to be updated.
 		self.__nonUpdateFields = None
@@ -95,8 +138,32 @@ class dCursorMixin(dObject):
 		# in some cases, such as a single bizobj managing several cursors,
 		# it will be a separate object.
 		self.sqlManager = self
+		# Number of rows to fetch at a time in streaming mode; 0 fetches all rows.
+		self._fetchWindow = 0
+		# True while a streamed result set still has rows waiting in the backend.
+		self._streamPending = False
+		# Number of rows in each page in pagination mode; 0 fetches all rows.
+		self._pageSize = 0
+		self._pageNumber = 0
+		self._pageHasNext = False
+		# Key values of the first and last rows of the page, used to find the
+		# pages on either side of it.
+		self._pageFirstKey = self._pageLastKey = None
+		self._pageConvertQMarks = False
+		# Field whose value increases whenever a row is changed, used by
+		# requeryChanges().
+		self._versionField = ""
+		# Should SELECT results come from the connection's query cache?
+		self._useQueryCache = False
+		# Reference to the bizobj that 'owns' this cursor, if any,
+		self._bizobj = None
+		# Key of this cursor in that bizobj's collection of cursors
+		self._cursorKey = None
+		# Whether there were any (changed, new) records when the bizobj was
+		# last told about them.
+		self._dirtyState = (False, False)
 		# Attribute that holds the data of the cursor
-		self._records = dDataSet()
+		self._records = dRecordList()
 		# Attribute that holds the current row number
 		self.__rownumber = -1
 		# Data structure info
@@ -108,6 +175,11 @@ class dCursorMixin(dObject):
 
 		self._autoPopulatePK = True
 		self._autoQuoteNames = True
+		self._batchedSave = False
+		# When True, records are stored as dCompactRecord objects instead of dicts.
+		self._compactRecords = False
+		# The (fields, fieldIndex) pair shared by the compact records.
+		self._compactLayout = None
 
 		self.__tmpPK = -1		# temp PK value for new records.
 		# Holds the data types for each field
@@ -122,9 +194,6 @@ class dCursorMixin(dObject):
 		# Reference to the object with backend-specific behaviors
 		self.__backend = None
 
-		# Reference to the bizobj that 'owns' this cursor, if any,
-		self._bizobj = None
-
 		# set properties for the SQL Builder functions
 		self.clearSQL()
 		self.hasSqlBuilder = True
@@ -136,6 +205,22 @@ class dCursorMixin(dObject):
 		# mementos and new records, keyed on record object ids:
 		self._mementos = {}
 		self._newRecords = {}
+		# Maps each PK value to its row position. It is rebuilt lazily whenever
+		# the _records object it was built from has been replaced.
+		self._pkIndex = {}
+		self._pkIndexSource = None
+		self._pkIndexHasDupes = False
+		# Sorted indexes used by seek(), keyed on (fields, caseInsensitive). Like
+		# the PK index, they are discarded when the _records object is replaced.
+		self._seekIndexes = {}
+		self._seekIndexSource = None
+		# Cached values of the virtual fields that declare their dependencies,
+		# as (definition, {row: value}) pairs keyed on the field name, and the
+		# virtual fields that depend on each field. They are discarded when the
+		# _records object is replaced.
+		self._virtualCache = {}
+		self._virtualDependents = {}
+		self._virtualCacheSource = None
 
 		# Flag preference cursors so that they don't fill up the logs
 		self._isPrefCursor = False
@@ -184,12 +269,9 @@ class dCursorMixin(dObject):
 		"""Returns the PK expression for the passed record."""
 		if rec is None:
 			try:
-				rec = self._records[self.RowNumber]
+				rec = self._recordStore[self.RowNumber]
 			except IndexError:
 				rec = {}
-		# Prevent correction of empty rows.
-		if rec:
-			self._correctFieldTypesIfNeeded(rec)
 		if isinstance(self.KeyField, tuple):
 			if rec:
 				pk = tuple([rec[kk] for kk in self.KeyField])
@@ -200,6 +282,23 @@ class dCursorMixin(dObject):
 		return pk
 
 
+	def _getSavedRowValues(self, fld, start, count):
+		"""
+		Return the values of 'fld', or of the PK if fld is None, in up to 'count'
+		rows from row 'start', skipping new, unsaved rows.
+		"""
+		self._fetchTo(start + count - 1)
+		ret = []
+		for rec in self._recordStore[start:start + count]:
+			if kons.CURSOR_TMPKEY_FIELD in rec:
+				continue
+			if fld is None:
+				ret.append(self.pkExpression(rec))
+			else:
+				ret.append(rec[fld])
+		return ret
+
+
 	def pkFieldExpression(self):
 		"""
 		Returns the field or comma-separated list of field names
@@ -212,20 +311,148 @@ class dCursorMixin(dObject):
 		return pkField
 
 
-	def _correctFieldTypesIfNeeded(self, rec):
-		if not rec.get(kons.CURSOR_FIELD_TYPES_CORRECTED, False):
-			_correctFieldType = self._correctFieldType
-			for fld_name in (i for i in rec if i not in cursor_flags):
-				rec[fld_name] = _correctFieldType(rec[fld_name], fld_name)
-			rec[kons.CURSOR_FIELD_TYPES_CORRECTED] = True
+	def _getConverterPlan(self, fields):
+		"""
+		Return the list of (field, converter) pairs that correct the types of the
+		values fetched for the passed fields. The plan is only rebuilt when the
+		fields or their types change; fields whose values never need converting
+		are left out of it.
+		"""
+		types = self._types
+		key = (tuple(fields), tuple([types.get(fld) for fld in fields]),
+				self.Encoding, self._convertStrToUnicode, dabo.convertFloatToDecimal)
+		plan = self._converterPlan
+		if plan is not None and plan[0] == key:
+			return plan[1]
+		converters = []
+		for fld in fields:
+			if fld in cursor_flags:
+				continue
+			conv = self._makeConverter(fld, types.get(fld))
+			if conv is not None:
+				converters.append((fld, conv))
+		self._converterPlan = (key, converters)
+		return converters
+
+
+	def _makeConverter(self, field_name, pythonType):
+		"""
+		Return a function that corrects a single non-None value of the passed
+		field, or None if no correction is ever needed. The common cases are
+		handled directly; anything else goes through _correctFieldType().
+		"""
+		correct = self._correctFieldType
+		def fallback(val):
+			return correct(val, field_name)
+
+		if not pythonType:
+			# The target type depends on each value: only floats may need to be
+			# converted, when they are to be treated as Decimals.
+			if not dabo.convertFloatToDecimal:
+				return None
+			toDecimal = self._makeConverter(field_name, Decimal)
+			def fromFloat(val):
+				if isinstance(val, float):
+					return toDecimal(val)
+				return val
+			return fromFloat
+		if pythonType is unicode:
+			if not self._convertStrToUnicode:
+				return None
+			encoding = self.Encoding
+			def toUnicode(val):
+				if isinstance(val, str):
+					try:
+						return val.decode(encoding)
+					except UnicodeDecodeError:
+						return fallback(val)
+				return val
+			return toUnicode
+		if pythonType in (datetime.date, datetime.datetime):
+			if pythonType is datetime.datetime:
+				parse = dates.getDateTimeFromString
+			else:
+				parse = dates.getDateFromString
+			def toDate(val):
+				if isinstance(val, pythonType):
+					return val
+				if isinstance(val, basestring):
+					try:
+						return parse(val)
+					except Exception:
+						pass
+				# Let the general routine handle and log anything else.
+				return fallback(val)
+			return toDate
+		if pythonType is Decimal:
+			# The quantize exponent is looked up on first use, since getting the
+			# DataStructure may itself run queries.
+			exponent = []
+			def getExponent():
+				if not exponent:
+					scale = None
+					for fld in self.DataStructure:
+						if fld[0] == field_name:
+							scale = fld[5]
+							break
+					if scale is not None:
+						scale = Decimal("0.%s" % (scale * "0",))
+					exponent.append(scale)
+				return exponent[0]
+			# Exponents for scales worked out from the values, keyed by scale.
+			valueExponents = {}
+			def toDecimal(val):
+				if isinstance(val, Decimal):
+					return val
+				_val = val
+				if isinstance(val, float):
+					# Can't convert to decimal directly from float
+					_val = ustr(val)
+				exp = getExponent()
+				try:
+					if exp is None:
+						# No scale is reported, so use that of the value.
+						try:
+							scale = len(_val.split(".")[1])
+						except (IndexError, AttributeError):
+							scale = 2
+						try:
+							exp = valueExponents[scale]
+						except KeyError:
+							exp = valueExponents[scale] = Decimal("0.%s" % (scale * "0",))
+					return Decimal(_val).quantize(exp)
+				except Exception:
+					return fallback(val)
+			return toDecimal
+
+		def toType(val):
+			if isinstance(val, pythonType):
+				return val
+			return fallback(val)
+		return toType
+
+
+	def _convertRecords(self, records, fields):
+		"""
+		Correct the field types of the passed dict records in place, applying
+		the converter plan one column at a time.
+		"""
+		if not records:
+			return
+		for fld, conv in self._getConverterPlan(fields):
+			for rec in records:
+				val = rec.get(fld)
+				if val is not None:
+					rec[fld] = conv(val)
 
 
 	def _correctFieldType(self, field_val, field_name):
 		"""
 		Correct the type of the passed field_val, based on self.DataStructure.
 
-		This is called by self.execute(), and contains code to convert all strings
-		to unicode, as well as to correct any datatypes that don't match what
+		This is the general-purpose routine behind the converters built by
+		_makeConverter(), and contains code to convert all strings to unicode,
+		as well as to correct any datatypes that don't match what
 		self.DataStructure reports. The latter can happen with SQLite, for example,
 		which only knows about a quite limited number of types.
 		"""
@@ -317,6 +544,9 @@ class dCursorMixin(dObject):
 
 
 	def _dblogExecute(self, msg, sql="", params=None, log=dabo.dbActivityLog.info):
+		if not _dbLogEnabled():
+			# Don't spend time on a message that won't be written.
+			return
 		if params is None:
 			params = tuple()
 		if sql:
@@ -345,6 +575,15 @@ class dCursorMixin(dObject):
 			sql = self._qMarkToParamPlaceholder(sql)
 		# Some backends, notably Firebird, require that fields be specially marked.
 		sql = self.processFields(sql)
+		queryCache = self._getActiveQueryCache()
+		if queryCache is not None:
+			cached = queryCache.get(sql, params, self.CompactRecords)
+			if cached is not None:
+				self.__useCachedResult(sql, *cached)
+				return None
+		timings = self.BackendObject.StatementTimings
+		if timings is not None:
+			started = time.time()
 		try:
 			if params:
 				res = self.superCursor.execute(self, sql, params)
@@ -389,15 +628,73 @@ class dCursorMixin(dObject):
 		if self._newStructure(sql):
 			self._storeFieldTypes()
 
-		if sql.split(None, 1)[0].lower() not in ("select", "pragma"):
+		command = sql.split(None, 1)[0].lower()
+		if command in ("create", "alter", "drop"):
+			# The cached schema information may no longer be valid.
+			self.BackendObject.clearSchemaCache()
+		if command not in ("select", "pragma"):
+			if timings is not None:
+				timings.record(sql, time.time() - started, getattr(self, "rowcount", 0))
+			self._invalidateQueryCache(sql)
 			# No need to massage the data for DML commands
-			self._records = dDataSet(tuple())
+			self._records = dRecordList()
 			return res
 
+		fetchWindow = self.FetchWindow
+		_records = self._fetchRecords(fetchWindow)
+		self._records = dRecordList(_records)
+		# In streaming mode, the rest of the rows are fetched as they are reached.
+		self._streamPending = bool(fetchWindow) and (len(_records) == fetchWindow)
+		if timings is not None:
+			timings.record(sql, time.time() - started, len(_records))
+		if queryCache is not None and not self._streamPending:
+			queryCache.put(sql, params, _records, self.FieldDescription, self.CompactRecords)
+		# This will handle bounds issues
+		self.RowNumber = self.RowNumber
+		return res
+
+
+	def _getActiveQueryCache(self):
+		"""Return the connection's query cache if this cursor uses it, or None."""
+		if not self._useQueryCache:
+			return None
+		bo = self.BackendObject
+		if bo is None:
+			return None
+		return bo.QueryCache
+
+
+	def __useCachedResult(self, sql, records, description):
+		"""Make the cached records of the statement the result of execute()."""
+		self.descriptionClean = description
+		if self._newStructure(sql):
+			self._storeFieldTypes()
+		self._records = dRecordList(records)
+		# This will handle bounds issues
+		self.RowNumber = self.RowNumber
+
+
+	def _invalidateQueryCache(self, sql):
+		"""Drop the cached results that the statement, which isn't a SELECT, may change."""
+		bo = self.BackendObject
+		queryCache = bo.QueryCache
+		if queryCache is not None:
+			queryCache.statementExecuted(sql, bo._getCursorConnection(self),
+					bo.inTransaction(self))
+
+
+	def _fetchRecords(self, count=0):
+		"""
+		Fetch the next 'count' rows of the result set, or all of them if count
+		is 0, and return them as a list of records.
+		"""
 		try:
-			_records = self.fetchall()
+			if count:
+				_records = self.fetchmany(count)
+			else:
+				_records = self.fetchall()
 		except Exception, e:
-			_records = dabo.db.dDataSet()
+			_records = []
 			# Database errors need to be decoded from database encoding.
 			try:
 				errMsg = ustr(e).decode(self.Encoding)
@@ -405,7 +702,11 @@ class dCursorMixin(dObject):
 				errMsg = ustr(e)
 			dabo.log.error("Error fetching records: (%s, %s)" % (type(e), errMsg))
 
-		if _records and isinstance(_records[0], (tuple, list)):
+		if not _records:
+			return _records
+		if self.CompactRecords:
+			return self._makeCompactRecords(_records)
+		if isinstance(_records[0], (tuple, list)):
 			# Need to convert each row to a Dict, since the backend didn't do it.
 			tmpRows = []
 			fldNames = [f[0] for f in self.FieldDescription]
@@ -415,10 +716,115 @@ class dCursorMixin(dObject):
 					dic[fldName] = row[idx]
 				tmpRows.append(dic)
 			_records = tmpRows
+		else:
+			fldNames = _records[0].keys()
+		self._convertRecords(_records, fldNames)
+		return _records
 
-		self._records = dDataSet(_records)
-		# This will handle bounds issues
-		self.RowNumber = self.RowNumber
+
+	def _fetchTo(self, row):
+		"""
+		In streaming mode, fetch windows of rows from the backend until the
+		passed row number has been reached, or there are no more rows. Returns
+		the number of records that are available.
+		"""
+		store = self._recordStore
+		if self._streamPending and row >= len(store):
+			fetchWindow = self.FetchWindow
+			newRows = []
+			while self._streamPending and row >= len(store) + len(newRows):
+				window = self._fetchRecords(fetchWindow)
+				newRows.extend(window)
+				self._streamPending = (len(window) == fetchWindow)
+			pos = len(store)
+			store.extend(newRows)
+			self._clearSeekIndexes()
+			if self._pkIndexSource is store:
+				# Extend the PK index with the new rows instead of rebuilding it.
+				for rec in newRows:
+					self._pkIndexAdd(pos, self._pkIndexKey(rec))
+					pos += 1
+			self._notifyDirtyState(True)
+		return len(store)
+
+
+	def _hasRecords(self):
+		"""Return True if there are any records, without fetching all pending rows."""
+		return self._fetchTo(0) > 0
+
+
+	def _getCompactLayout(self, fields):
+		"""Return the (fields, fieldIndex) pair shared by compact records with these fields."""
+		fields = tuple(fields)
+		layout = self._compactLayout
+		if layout is None or layout[0] != fields:
+			layout = self._compactLayout = (fields,
+					dict([(fld, idx) for idx, fld in enumerate(fields)]))
+		return layout
+
+
+	def _makeCompactRecords(self, rows):
+		"""
+		Convert the fetched rows, which may be sequences or dicts, into
+		compact records, correcting the field types along the way.
+		"""
+		fields, fieldIndex = self._getCompactLayout([f[0] for f in self.FieldDescription])
+		if not isinstance(rows, list):
+			rows = list(rows)
+		for pos, row in enumerate(rows):
+			if isinstance(row, dict):
+				rows[pos] = [row.get(fld) for fld in fields]
+			else:
+				rows[pos] = list(row)
+		for fld, conv in self._getConverterPlan(fields):
+			idx = fieldIndex[fld]
+			for vals in rows:
+				val = vals[idx]
+				if val is not None:
+					vals[idx] = conv(val)
+		for pos, vals in enumerate(rows):
+			# Replace as we go, so the value lists are all that's kept.
+			rows[pos] = dCompactRecord(fields, fieldIndex, vals)
+		return rows
+
+
+	def executemany(self, sql, paramList, errorClass=None, convertQMarks=False):
+		"""
+		Execute the sql once for each sequence of parameters in paramList. This
+		is meant for DML statements; the DataSet is not affected.
+		"""
+		if isinstance(sql, unicode):
+			sql = sql.encode(self.Encoding)
+		if convertQMarks:
+			sql = self._qMarkToParamPlaceholder(sql)
+		sql = self.processFields(sql)
+		timings = self.BackendObject.StatementTimings
+		if timings is not None:
+			started = time.time()
+		try:
+			res = self.BackendObject.executeMany(self, sql, paramList)
+			if not self.IsPrefCursor:
+				self._dblogExecute("executemany() (%s rows)" % len(paramList), sql)
+		except Exception, e:
+			if errorClass is not None and isinstance(e, errorClass):
+				raise e
+			self._dblogExecute("executemany() FAILED", sql)
+			try:
+				errMsg = unicode(str(e), self.Encoding)
+			except UnicodeError:
+				errMsg = ustr(e)
+			if "connect" in errMsg.lower():
+				raise dException.ConnectionLostException(errMsg)
+			elif "access" in errMsg.lower():
+				raise dException.DBNoAccessException(errMsg)
+			else:
+				errMsg = _("DBQueryException encountered in executemany(): %s") % errMsg
+				self._dblogExecute(errMsg, sql)
+				raise dException.DBQueryException(errMsg)
+		self.BackendObject.lastExecuteTime = time.time()
+		if timings is not None:
+			timings.record(sql, time.time() - started, getattr(self, "rowcount", 0))
+		self._invalidateQueryCache(sql)
 		return res
 
 
@@ -468,6 +874,7 @@ class dCursorMixin(dObject):
 		ac = self.AuxCursor
 		ac.AutoPopulatePK = self.AutoPopulatePK
 		ac.AutoQuoteNames = self.AutoQuoteNames
+		ac.UseQueryCache = self.UseQueryCache
 		ac.DataStructure = self.DataStructure
 		ac.IsPrefCursor = self.IsPrefCursor
 		ac.KeyField = self.KeyField
@@ -486,11 +893,392 @@ class dCursorMixin(dObject):
 		self.lastParams = params
 		self._savedStructureDescription = []
 
-		self.execute(currSQL, params, convertQMarks=convertQMarks)
+		if self.PageSize:
+			self._pageConvertQMarks = convertQMarks
+			self.__executePage(0, None, False, params)
+		else:
+			self.execute(currSQL, params, convertQMarks=convertQMarks)
+		self.__afterRequery(newQuery)
+		return True
+
+
+	def nextPage(self, params=None):
+		"""
+		In pagination mode, fetch the page after the current one. Returns False
+		if the current page is the last one. 'params' default to those of the
+		last requery.
+		"""
+		if not self._pageHasNext:
+			return False
+		self.__movePage(self._pageNumber + 1, self._pageLastKey, False, params)
+		return True
+
+
+	def prevPage(self, params=None):
+		"""
+		In pagination mode, fetch the page before the current one. Returns
+		False if the current page is the first one.
+		"""
+		if self._pageNumber <= 0:
+			return False
+		self.__movePage(self._pageNumber - 1, self._pageFirstKey, True, params)
+		return True
+
+
+	def gotoPage(self, num, params=None):
+		"""
+		In pagination mode, fetch page 'num', counting from 0. There are no
+		key values to find an arbitrary page by, so this skips the rows before
+		it with the backend's LIMIT/OFFSET syntax.
+		"""
+		self.__movePage(max(0, int(num)), None, False, params)
+
+
+	def __movePage(self, num, key, reverse, params):
+		if not self.PageSize:
+			raise dException.dException(_("PageSize must be set to use pages"))
+		if params is None:
+			params = self.lastParams
+		else:
+			self.lastParams = params
+		self.__executePage(num, key, reverse, params)
+		self.__afterRequery(False)
+
+
+	def __executePage(self, num, key, reverse, params):
+		"""
+		Fetch page 'num'. When the key values of the row on the near side of
+		the page are passed, the page is found with a predicate on the order-by
+		columns and the PK (a keyset), which is as fast for the last page as for
+		the first. Otherwise the rows before the page are skipped with OFFSET.
+		If 'reverse' is True, 'key' is that of the first row of the page after.
+		"""
+		if not num or key is None:
+			# The first page, and pages found by OFFSET, are fetched in page order.
+			reverse = False
+		sql, params = self._getPageSQL(num, key, reverse, params)
+		self.execute(sql, params, convertQMarks=self._pageConvertQMarks)
+		self._setPage(self._records, num, reverse)
+
+
+	def _getPageSQL(self, num=0, key=None, reverse=False, params=None,
+			convertQMarks=None):
+		"""
+		Return the SQL for page 'num', along with its params. See
+		__executePage(). Used by dBizobj.requeryAsync() to fetch the first page
+		on a cursor of its own.
+		"""
+		if self.UserSQL:
+			raise dException.FeatureNotSupportedException(
+					_("Pages can't be fetched for UserSQL queries"))
+		if convertQMarks is not None:
+			self._pageConvertQMarks = convertQMarks
+		size = self.PageSize
+		cols = self._getKeysetColumns()
+		sm = self.sqlManager
+		holdWhere, holdOrder, holdLimit = sm._whereClause, sm._orderByClause, sm._limitClause
+		keyParams = ()
+		if cols is not None:
+			# Order by the PK, too, so that each row has a fixed place.
+			sm._orderByClause = ", ".join(["%s %s" % (expr, ("asc", "desc")[desc != reverse])
+					for expr, fld, desc in cols])
+		# Fetch one more row than the page holds, to find out if there are more.
+		if not num:
+			sm._limitClause = size + 1
+		elif key is not None and cols is not None:
+			keyWhere, keyParams = self.__keysetWhere(cols, key, reverse)
+			if holdWhere:
+				keyWhere = "(%s) and %s" % (holdWhere, keyWhere)
+			sm._whereClause = keyWhere
+			sm._limitClause = size + 1
+		else:
+			sm._limitClause = sm.BackendObject.getLimitOffset(size + 1, num * size)
+		try:
+			sql = self.getSQL()
+		finally:
+			sm._whereClause, sm._orderByClause, sm._limitClause = holdWhere, holdOrder, holdLimit
+		if keyParams:
+			params = tuple(params or ()) + keyParams
+		return sql, params
+
+
+	def _setPage(self, records, num=0, reverse=False):
+		"""
+		Make the passed records, fetched by the query from _getPageSQL(), the
+		records of page 'num'.
+		"""
+		size = self.PageSize
+		recs = list(records)
+		hasMore = len(recs) > size
+		del recs[size:]
+		if reverse:
+			recs.reverse()
+			# We came from the next page.
+			hasMore = True
+		self._records = recs
+		self._pageNumber = num
+		self._pageHasNext = hasMore
+		cols = self._getKeysetColumns()
+		if recs:
+			self._pageFirstKey = self.__pageKey(recs[0], cols)
+			self._pageLastKey = self.__pageKey(recs[-1], cols)
+		else:
+			self._pageFirstKey = self._pageLastKey = None
+		# This will handle bounds issues
+		self.RowNumber = self.RowNumber
+
+
+	def _getKeysetColumns(self):
+		"""
+		Return the (expression, field, descending) tuples that pages are
+		ordered by: the items in the order-by clause, followed by the PK
+		fields. Returns None if the order-by clause holds anything besides
+		column names, or there is no KeyField; pages are then found by OFFSET.
+		"""
+		kf = self.KeyField
+		if not kf:
+			return None
+		ret = []
+		order = self.sqlManager._orderByClause or ""
+		if order.strip():
+			for item in order.split(","):
+				mtch = _keysetOrderPattern.match(item)
+				if not mtch:
+					return None
+				expr, direction = mtch.groups()
+				fld = expr.split(".")[-1].strip("\"`[]")
+				ret.append((expr, fld, (direction or "").lower() == "desc"))
+		if not isinstance(kf, tuple):
+			kf = (kf,)
+		flds = [col[1] for col in ret]
+		for pk in kf:
+			if pk not in flds:
+				ret.append((pk, pk, False))
+		return ret
+
+
+	def __pageKey(self, rec, cols):
+		"""
+		Return the values of the keyset columns in the record, or None if the
+		page can't be found from them.
+		"""
+		if cols is None:
+			return None
+		try:
+			return tuple([rec[col[1]] for col in cols])
+		except KeyError:
+			return None
+
+
+	def __keysetWhere(self, cols, key, reverse):
+		"""
+		Return the predicate that selects the rows after the row with the
+		passed key values in the page order (before it, if 'reverse' is True),
+		along with its params. NULLs don't compare, so they are matched with
+		'is null', in the place where the backend sorts them.
+		"""
+		ph = self.ParamPlaceholder
+		nullsFirst = self.BackendObject.nullsSortFirst
+		clause = None
+		params = ()
+		for (expr, fld, desc), val in reversed(zip(cols, key)):
+			descending = (desc != reverse)
+			nullsBefore = (nullsFirst != descending)
+			# The values of the column that come after 'val', and that equal it.
+			if val is None:
+				after = "%s is not null" % expr if nullsBefore else None
+				afterParams = ()
+				same = "%s is null" % expr
+				sameParams = ()
+			else:
+				after = "%s %s %s" % (expr, (">", "<")[descending], ph)
+				afterParams = (val,)
+				if not nullsBefore:
+					after = "(%s or %s is null)" % (after, expr)
+				same = "%s = %s" % (expr, ph)
+				sameParams = (val,)
+			if clause is None:
+				clause = after or "1 = 0"
+				params = afterParams
+			elif after is None:
+				clause = "(%s and %s)" % (same, clause)
+				params = sameParams + params
+			else:
+				clause = "(%s or (%s and %s))" % (after, same, clause)
+				params = afterParams + sameParams + params
+		return "(%s)" % clause, params
+
+
+	def requeryChanges(self, params=None, convertQMarks=False):
+		"""
+		Bring the records up to date without fetching them all again.
+
+		Rows whose VersionField is at least the greatest value among the
+		current records, along with rows that the query now returns but that
+		aren't in the records yet, are fetched and merged into the records.
+		The PKs of the rows that the query returns are fetched to find out
+		which rows are gone, and in which order the rows come. Rows with
+		pending changes keep their changed values, and stay in the records
+		even if they are gone from the database; new rows stay, too. The
+		current sort is applied to the merged records, and the record pointer
+		stays on the same record.
+
+		A full requery() is run instead if there is no VersionField or
+		KeyField, the query or its params changed since the last requery, or
+		too many rows are missing. Returns True if the changes were merged,
+		or False if a full requery was run.
+		"""
+		vf = self.VersionField
+		kf = self.KeyField
+		records = self._records
+		newRecs = self._newRecords
+		if self._compoundKey:
+			keyOf = lambda rec: tuple([rec[k] for k in kf])
+		else:
+			keyOf = lambda rec: rec[kf]
+		lastVersion = None
+		if vf and kf and not self.UserSQL and not self.PageSize \
+				and self._lastSQL == self.CurrentSQL and params == self.lastParams:
+			versions = [rec[vf] for rec in records
+					if kons.CURSOR_TMPKEY_FIELD not in rec and rec.get(vf) is not None]
+			if versions:
+				lastVersion = max(versions)
+		if lastVersion is None:
+			self.requery(params, convertQMarks=convertQMarks)
+			return False
+
+		# Qualify the names with the table, as the save and delete statements
+		# do, so that they aren't ambiguous in queries with joins.
+		bo = self.BackendObject
+		aq = self.AutoQuoteNames
+		prefix = bo.getWhereTablePrefix(self.Table, autoQuote=aq)
+		qualify = lambda fld: "%s%s" % (prefix, bo.encloseNames(fld, aq))
+		sm = self.sqlManager
+		holdField, holdWhere, holdOrder, holdLimit = (sm._fieldClause, sm._whereClause,
+				sm._orderByClause, sm._limitClause)
+		# The PKs of the rows that a full requery would return, in its order.
+		sm._fieldClause = ", ".join([qualify(fld) for fld in
+				(kf if self._compoundKey else (kf,))])
+		try:
+			pkSQL = self.getSQL()
+		finally:
+			sm._fieldClause = holdField
+		aux = self.AuxCursor
+		aux.execute(pkSQL, params, convertQMarks=convertQMarks)
+		pks = [keyOf(rec) for rec in aux._records]
+		byKey = dict([(keyOf(rec), rec) for rec in records])
+		missing = [pk for pk in pks if pk not in byKey]
+		if len(missing) > self.maxChangedKeys or (missing and self._compoundKey):
+			self.requery(params, convertQMarks=convertQMarks)
+			return False
+
+		ph = self.ParamPlaceholder
+		# Rows at the greatest version are fetched again: a timestamp may not
+		# tell apart changes made within the same tick.
+		changedWhere = "%s >= %s" % (qualify(vf), ph)
+		changedParams = (lastVersion,)
+		if missing:
+			changedWhere = "(%s or %s in (%s))" % (changedWhere, qualify(kf),
+					", ".join([ph] * len(missing)))
+			changedParams += tuple(missing)
+		if holdWhere:
+			changedWhere = "(%s) and %s" % (holdWhere, changedWhere)
+		sm._whereClause, sm._orderByClause, sm._limitClause = changedWhere, "", None
+		try:
+			changedSQL = self.getSQL()
+		finally:
+			sm._whereClause, sm._orderByClause, sm._limitClause = holdWhere, holdOrder, holdLimit
+		try:
+			currPK = keyOf(records[self.RowNumber])
+		except IndexError:
+			currPK = None
+		try:
+			self.execute(changedSQL, tuple(params or ()) + changedParams,
+					convertQMarks=convertQMarks)
+			changed = self._records
+		finally:
+			# The fetched rows replaced the records.
+			self._records = records
+		pkSet = set(pks)
+		for rec in changed:
+			pk = keyOf(rec)
+			if pk not in pkSet:
+				# Beyond the limit of the query
+				continue
+			mem = self._mementos.get(pk)
+			if mem:
+				# Keep the pending changes.
+				old = byKey[pk]
+				for fld in mem:
+					rec[fld] = old[fld]
+			byKey[pk] = rec
+
+		merged = [byKey[pk] for pk in pks]
+		for rec in records:
+			pk = keyOf(rec)
+			if pk not in pkSet and (pk in newRecs or pk in self._mementos):
+				merged.append(rec)
+		self._records = merged
+		# Apply the current sort to the merged records.
+		self.__unsortedRows = {}
+		if self.sortColumn:
+			try:
+				self.sort(self.sortColumn, self.sortOrder, self.sortCase)
+			except dException.NoRecordsException:
+				pass
+		if currPK is not None and self.hasPK(currPK):
+			self.moveToPK(currPK)
+		else:
+			# This will handle bounds issues
+			self.RowNumber = self.RowNumber
+		self.lastRequeryTime = time.time()
+		return True
+
+
+	def _takeRequery(self, crs, sql=None, params=None, records=None):
+		"""
+		Use the results of requery() on the passed cursor, which ran this
+		cursor's query, as if this cursor had been requeried. The records are
+		replaced in a single step. Used by dBizobj.requeryAsync(), which runs
+		the query on a cursor of its own in a worker thread.
+
+		When the other cursor fetched the records for several parents at once,
+		pass the SQL and params that this cursor's own query would have used,
+		and the records that it would have returned.
+		"""
+		if sql is None:
+			sql, params, records = crs._lastSQL, crs.lastParams, crs._records
+			if self.PageSize:
+				# The other cursor ran the query for the first page.
+				sql = self.CurrentSQL
+		newQuery = (self._lastSQL != sql)
+		self._lastSQL = sql
+		self.lastParams = params
+		self._savedStructureDescription = crs._savedStructureDescription
+		self._types = crs._types
+		if newQuery:
+			self.__nonUpdateFields = crs.__nonUpdateFields
+			self._fieldDescriptors = None
+		try:
+			## The Record object must be reinstantiated to reflect the new structure:
+			del(self._cursorRecord)
+		except AttributeError:
+			pass
+		if self.PageSize:
+			self._setPage(records)
+		else:
+			self._records = records
+			# This will handle bounds issues
+			self.RowNumber = self.RowNumber
+		self.__afterRequery(False)
 
+
+	def __afterRequery(self, newQuery):
 		# clear mementos and new record flags:
 		self._mementos = {}
 		self._newRecords = {}
+		self._notifyDirtyState()
+		self._clearVirtualCache()
 		# Record the requery time for caching purposes
 		self.lastRequeryTime = time.time()
 
@@ -499,15 +1287,14 @@ class dCursorMixin(dObject):
 			# any updates.
 			self.__setNonUpdateFields()
 
-		# Clear the unsorted list, and then apply the current sort
-		self.__unsortedRows = []
+		# Clear the unsorted positions, and then apply the current sort
+		self.__unsortedRows = {}
 		if self.sortColumn:
 			try:
-				self.sort(self.sortColumn, self.sortOrder)
+				self.sort(self.sortColumn, self.sortOrder, self.sortCase)
 			except dException.NoRecordsException:
 				# No big deal
 				pass
-		return True
 
 
 	def _storeFieldTypes(self, target=None):
@@ -539,13 +1326,30 @@ class dCursorMixin(dObject):
 			CYCLE
 
 		Only the first three characters are significant; case is ignored.
+
+		To sort on several columns, pass a list for 'col'. Each item is either a
+		column name, or a (column, order) or (column, order, caseSensitive) tuple;
+		for example:
+
+			cursor.sort([("last", "ASC"), ("first", "DESC", False)])
+
+		Items that don't give an order or case sensitivity take them from 'ordr'
+		and 'caseSensitive', which can also be sequences with one entry for
+		each column. The orders must be ASC or DESC. In this case, sortColumn,
+		sortOrder and sortCase are set to tuples.
 		"""
+		if isinstance(col, (list, tuple)):
+			self.__sortMultiple(col, ordr, caseSensitive)
+			return
 		currCol = self.sortColumn
 		currOrd = self.sortOrder
+		if isinstance(currCol, tuple):
+			# Sorted on several columns; the first one counts as the current sort.
+			currCol, currOrd = currCol[0], currOrd[0]
 		if not ordr:
 			ordr = "ASC"
 		if ordr[:3].upper() == "CYC":
-			ordr = {"ASC": "DESC", "DES": None, None: "ASC"}[currOrd]
+			ordr = {"ASC": "DESC", "DESC": None}.get(currOrd, "ASC")
 			col = currCol
 
 		# Make sure that the specified column is a column in the result set
@@ -584,74 +1388,104 @@ class dCursorMixin(dObject):
 					raise dException.dException(
 							_("Invalid Sort direction specified: ") + ordr)
 
-		self.__sortRows(newCol, newOrd, caseSensitive)
+		self.__sortRows((newCol,), (newOrd,), (caseSensitive,))
 		# Save the current sort values
 		self.sortColumn = newCol
 		self.sortOrder = newOrd
 		self.sortCase = caseSensitive
 
 
-	def __sortRows(self, col, ordr, caseSensitive):
+	def __sortMultiple(self, cols, ordrs, cases):
+		"""Handle sort() calls that pass several columns."""
+		def setting(spec, pos, idx, default):
+			if len(spec) > idx:
+				return spec[idx]
+			if isinstance(default, (list, tuple)):
+				return default[pos]
+			return default
+
+		sortCols, sortOrds, sortCases = [], [], []
+		for pos, spec in enumerate(cols):
+			if isinstance(spec, basestring):
+				spec = (spec,)
+			col = spec[0]
+			if not [True for t in self.DataStructure if t[0] == col]  and col not in self.VirtualFields:
+				raise dException.dException(
+						_("Invalid column specified for sort: ") + col)
+			ordr = (setting(spec, pos, 1, ordrs) or "ASC").upper()
+			if ordr not in ("ASC", "DESC"):
+				raise dException.dException(
+						_("Invalid Sort direction specified: ") + ordr)
+			sortCols.append(col)
+			sortOrds.append(ordr)
+			sortCases.append(setting(spec, pos, 2, cases))
+
+		self.__sortRows(tuple(sortCols), tuple(sortOrds), tuple(sortCases))
+		# Save the current sort values
+		self.sortColumn = tuple(sortCols)
+		self.sortOrder = tuple(sortOrds)
+		self.sortCase = tuple(sortCases)
+
+
+	def __sortRows(self, cols, ordrs, cases):
 		"""
 		Sort the rows of the cursor.
 
-		At this point, we know we have a valid column and order. We need to
+		At this point, we know we have valid columns and orders. We need to
 		preserve the unsorted order if we haven't done that yet; then we sort
 		the data according to the request.
+
+		The sort values of each column are extracted once. The row positions
+		are then sorted on them, a column at a time from the last to the first;
+		as the sort is stable, that orders the rows on all the columns.
 		"""
 		kf = self.KeyField
 		if not kf or not self.RowCount:
 			return
 
+		records = self._records
+		if self._compoundKey:
+			keyOf = lambda rec: tuple([rec[k] for k in kf])
+		else:
+			keyOf = lambda rec: rec[kf]
 		if not self.__unsortedRows:
-			# Record the PK values
-			for row in self._records:
-				if self._compoundKey:
-					key = tuple([row[k] for k in kf])
-					self.__unsortedRows.append(key)
-				else:
-					self.__unsortedRows.append(row[kf])
+			# Record the positions of the PK values. Walk backwards so that the
+			# first occurrence of a duplicated PK wins.
+			positions = self.__unsortedRows
+			for pos in xrange(len(records) - 1, -1, -1):
+				positions[keyOf(records[pos])] = pos
 
 		# First, preserve the PK of the current row so that we can reset
 		# the RowNumber property to point to the same row in the new order.
 		try:
-			if self._compoundKey:
-				currRow = self._records[self.RowNumber]
-				currRowKey = tuple([currRow[k] for k in kf])
-			else:
-				currRowKey = self._records[self.RowNumber][kf]
+			currRowKey = keyOf(records[self.RowNumber])
 		except IndexError:
 			# Row no longer exists, such as after a Requery that returns
 			# fewer rows.
 			currRowKey = None
-		# Create the list to hold the rows for sorting
-		sortList = []
-		if not ordr:
-			# Restore the rows to their unsorted order
-			for row in self._records:
-				if self._compoundKey:
-					key = tuple([row[k] for k in kf])
-					sortList.append([self.__unsortedRows.index(key), row])
-				else:
-					sortList.append([self.__unsortedRows.index(row[kf]), row])
-		else:
-			for row, rec in enumerate(self._records):
-				sortList.append([self.getFieldVal(col, row), rec])
-		# At this point we have a list consisting of lists. Each of these member
-		# lists contain the sort value in the zeroth element, and the row as
-		# the first element.
-		# First, see if we are comparing strings
-		compString = isinstance(sortList[0][0], basestring)
-
-		if compString and not caseSensitive:
-			sortKey = caseInsensitiveSortKey
+
+		order = range(len(records))
+		if not ordrs[0]:
+			# Restore the rows to their unsorted order. Rows added since
+			# the first sort go at the end.
+			positions = self.__unsortedRows
+			keys = [positions.get(keyOf(rec), sys.maxint) for rec in records]
+			order.sort(key=keys.__getitem__)
 		else:
-			sortKey = noneSortKey
-		sortList.sort(key=sortKey, reverse=(ordr == "DESC"))
+			getFieldVal = self.getFieldVal
+			for col, ordr, caseSensitive in reversed(zip(cols, ordrs, cases)):
+				if col in records[0]:
+					vals = [rec[col] for rec in records]
+				else:
+					vals = [getFieldVal(col, row) for row in xrange(len(records))]
+				if isinstance(vals[0], basestring) and not caseSensitive:
+					keys = [(val or "").lower() for val in vals]
+				else:
+					keys = [(0, None) if val is None else (1, val) for val in vals]
+				order.sort(key=keys.__getitem__, reverse=(ordr == "DESC"))
 
-		# Extract the rows into a new list, then convert them back to the _records tuple
-		newRows = [elem[1] for elem in sortList]
-		self._records = dDataSet(newRows)
+		# Put the rows into a new record list
+		self._records = dRecordList([records[row] for row in order])
 
 		# restore the RowNumber
 		self.moveToPK(currRowKey)
@@ -723,6 +1557,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if fldList is None:
 			fldList = []
 		self.nonUpdateFields = fldList
+		self._fieldDescriptors = None
 
 
 	def getNonUpdateFields(self):
@@ -734,6 +1569,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 	def __setNonUpdateFields(self, nonUp=None):
 		"""Automatically set the non-update fields."""
+		self._fieldDescriptors = None
 		if nonUp is not None:
 			# This is being called back by the BackendObject
 			self.__nonUpdateFields = nonUp
@@ -747,7 +1583,9 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			# Create the _dataStructure attribute
 			self._getDataStructure()
 			# Delegate to the backend object to figure it out.
-			self.__nonUpdateFields = self.BackendObject.setNonUpdateFields(self)
+			bo = self.BackendObject
+			self.__nonUpdateFields = bo.getSchemaInfo("nonupdate", self._schemaKey(),
+					bo.setNonUpdateFields, self)
 
 
 	def isChanged(self, allRows=True, includeNewUnchanged=False):
@@ -777,6 +1615,23 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			return recKey in self._mementos or (includeNewUnchanged and recKey in self._newRecords)
 
 
+	def _notifyDirtyState(self, rowsChanged=False):
+		"""
+		Tell the bizobj that owns this cursor when the cursor gains its first,
+		or loses its last, changed or new record, so that the bizobj can answer
+		isAnyChanged() without scanning. Pass rowsChanged=True when records
+		were added, removed or replaced, or their PKs changed, since the child
+		cursors that count as part of this cursor depend on them.
+		"""
+		bizobj = self._bizobj
+		if bizobj is None:
+			return
+		state = (bool(self._mementos), bool(self._newRecords))
+		if rowsChanged or (state != self._dirtyState):
+			self._dirtyState = state
+			bizobj._cursorDirtyStateChanged(self)
+
+
 	def setNewFlag(self):
 		"""
 		Set the current record to be flagged as a new record.
@@ -798,6 +1653,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			self._newRecords[pk] = None
 		# Add the 'new record' flag
 		self._records[self.RowNumber][kons.CURSOR_TMPKEY_FIELD] = pk
+		self._notifyDirtyState()
 
 
 	def genTempAutoPK(self):
@@ -821,12 +1677,19 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		# are assigned to the same child, we need to use sqlManager
 		# for temporary key creation.
 		tmpPK = self.sqlManager._genTempPKVal(pkVal)
+		oldIndexKey = self._pkIndexKey(rec)
 		if isinstance(kf, tuple):
 			for key in kf:
+				self._seekIndexUpdate(self.RowNumber, key, rec[key], tmpPK)
+				self._virtualCacheUpdate(self.RowNumber, key)
 				rec[key] = tmpPK
 		else:
+			self._seekIndexUpdate(self.RowNumber, kf, rec[kf], tmpPK)
+			self._virtualCacheUpdate(self.RowNumber, kf)
 			rec[kf] = tmpPK
 		rec[kons.CURSOR_TMPKEY_FIELD] = tmpPK
+		self._pkIndexRemove(self.RowNumber, oldIndexKey)
+		self._pkIndexAdd(self.RowNumber, self._pkIndexKey(rec))
 		return tmpPK
 
 
@@ -853,12 +1716,13 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			# This is a cursor for handling many-many relations. Get the PK from the bizobj
 			return self._bizobj.getPK()
 		ret = None
-		if self.RowCount <= 0:
+		if not self._hasRecords():
 			raise dException.NoRecordsException(
 					_("No records in dataset '%s'.") % self.Table)
 		if row is None:
 			row = self.RowNumber
-		rec = self._records[row]
+		self._fetchTo(row)
+		rec = self._recordStore[row]
 		recKey = self.pkExpression(rec)
 		if (recKey in self._newRecords) and self.AutoPopulatePK:
 			# New, unsaved record
@@ -874,19 +1738,20 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 	def getFieldVal(self, fld, row=None, _rowChangeCallback=None):
 		"""Return the value of the specified field in the current or specified row."""
-		_records = self._records
+		if row is None:
+			row = self._getRowNumber()
+		elif self._streamPending:
+			self._fetchTo(row)
+		_records = self._recordStore
 		if not _records:
 			raise dException.NoRecordsException(
 					_("No records in dataset '%s'.") % self.Table)
-		if row is None:
-			row = self._getRowNumber()
 		try:
 			rec = _records[row]
 		except IndexError:
 			cnt = len(_records)
 			raise dException.RowNotFoundException(
 					_("Row #%(row)s requested, but the data set has only %(cnt)s row(s),") % locals())
-		self._correctFieldTypesIfNeeded(rec)
 		if isinstance(fld, (tuple, list)):
 			return map(functools.partial(self.getFieldVal, row=row), fld)
 		if fld in rec:
@@ -898,29 +1763,45 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			vf.setdefault("args", ())
 			vf.setdefault("kwargs", {})
 
-			requery_children = (vf.get("requery_children", False) and bool(_rowChangeCallback))
-
-			# Move to specified row if necessary, and then call the VirtualFields
-			# function, which expects to be on the correct row.
-			if not requery_children:
-				# The VirtualFields 'requery_children' key is False, or
-				# we aren't being called by a bizobj, so there aren't child bizobjs.
-				_oldrow = self.RowNumber
-				self.RowNumber = row
-				ret = vf["func"](*vf["args"], **vf["kwargs"])
-				self.RowNumber = _oldrow
+			if "depends" in vf or "column_func" in vf:
+				values = self._getVirtualCache(fld, vf)
+				try:
+					return values[row]
+				except KeyError:
+					pass
+				if "column_func" in vf:
+					self._cacheVirtualColumn(fld, vf, values)
+					return values[row]
+				ret = values[row] = self._callVirtualField(vf, row, _rowChangeCallback)
 				return ret
-			else:
-				# The VirtualFields definition's 'requery_children' key is True, so
-				# we need to request a row change and requery of any child bizobjs
-				# as necessary, before executing the virtual field function.
-				_rowChangeCallback(row)
-				return vf["func"](*vf["args"], **vf["kwargs"])
+			return self._callVirtualField(vf, row, _rowChangeCallback)
 		else:
 			raise dException.FieldNotFoundException("%s '%s' %s" % (
 					_("Field"), fld, _("does not exist in the data set")))
 
 
+	def _callVirtualField(self, vf, row, _rowChangeCallback=None):
+		"""Return the value that the function of the virtual field returns for 'row'."""
+		requery_children = (vf.get("requery_children", False) and bool(_rowChangeCallback))
+
+		# Move to specified row if necessary, and then call the VirtualFields
+		# function, which expects to be on the correct row.
+		if not requery_children:
+			# The VirtualFields 'requery_children' key is False, or
+			# we aren't being called by a bizobj, so there aren't child bizobjs.
+			_oldrow = self.RowNumber
+			self.RowNumber = row
+			ret = vf["func"](*vf["args"], **vf["kwargs"])
+			self.RowNumber = _oldrow
+			return ret
+		else:
+			# The VirtualFields definition's 'requery_children' key is True, so
+			# we need to request a row change and requery of any child bizobjs
+			# as necessary, before executing the virtual field function.
+			_rowChangeCallback(row)
+			return vf["func"](*vf["args"], **vf["kwargs"])
+
+
 	def _fldTypeFromDB(self, fld):
 		"""
 		Try to determine the field type from the database information
@@ -956,13 +1837,20 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		Set the value for multiple fields with one call by passing a dict containing
 		the field names as keys, and the new values as values.
 		"""
+		row, rec = self._getRecordForSet(row, pk)
 		for fld, val in valDict.items():
-			self.setFieldVal(fld, val, row, pk)
+			self._setRecordFieldVal(row, rec, fld, val)
 	setValuesByDict = setFieldVals  ## deprecate setValuesByDict in future
 
 
 	def setFieldVal(self, fld, val, row=None, pk=None):
 		"""Set the value of the specified field."""
+		row, rec = self._getRecordForSet(row, pk)
+		return self._setRecordFieldVal(row, rec, fld, val)
+
+
+	def _getRecordForSet(self, row, pk):
+		"""Return the (row, record) pair whose values setFieldVal() changes."""
 		if self.RowCount <= 0:
 			raise dException.NoRecordsException(
 					_("No records in dataset '%s'.") % self.Table)
@@ -980,8 +1868,46 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				cnt = len(self._records)
 				raise dException.RowNotFoundException(
 						_("Row #%(row)s requested, but the data set has only %(cnt)s row(s),") % locals())
-		valid_pk = self._hasValidKeyField()
-		keyField = self.KeyField
+		return row, rec
+
+
+	def _getFieldDescriptors(self):
+		"""
+		Return the (validPk, fields) pair used by setFieldVal(). 'validPk' is
+		the result of _hasValidKeyField(), and 'fields' is a dict that is
+		filled in by _getFieldDescriptor() as fields are set.
+
+		The pair is rebuilt after it is reset to None, which is done when the
+		DataStructure, KeyField, non-update fields or records change, and when
+		the field types or non-update field lists are replaced.
+		"""
+		desc = self._fieldDescriptors
+		if (desc is None or desc[0] is not self._types
+				or desc[1] is not self.nonUpdateFields):
+			if self.__nonUpdateFields is None:
+				self.__setNonUpdateFields()
+			desc = self._fieldDescriptors = (self._types, self.nonUpdateFields,
+					self._hasValidKeyField(), {})
+		return desc[2], desc[3]
+
+
+	def _getFieldDescriptor(self, fld, fields):
+		"""
+		Return the (type, isDateType, updatable, isKeyField) tuple for the
+		field, and add it to the passed dict of the field descriptors.
+		"""
+		try:
+			fldType = self._types[fld]
+		except KeyError:
+			fldType = self._fldTypeFromDB(fld)
+		isDateType = fldType is not None and ustr(fldType) in _dateTypeStrings
+		updatable = fld not in self.getNonUpdateFields()
+		ret = fields[fld] = (fldType, isDateType, updatable, self._isKeyField(fld))
+		return ret
+
+
+	def _setRecordFieldVal(self, row, rec, fld, val):
+		"""Set the value of the field in the passed record, which is at position 'row'."""
 		if fld not in rec:
 			if fld in self.VirtualFields:
 				# ignore
@@ -989,15 +1915,15 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			raise dException.FieldNotFoundException(
 					_("Field '%s' does not exist in the data set.") % (fld,))
 
+		valid_pk, fields = self._getFieldDescriptors()
 		try:
-			fldType = self._types[fld]
+			fldType, isDateType, updatable, isKeyField = fields[fld]
 		except KeyError:
-			fldType = self._fldTypeFromDB(fld)
-		nonUpdateFields = self.getNonUpdateFields()
+			fldType, isDateType, updatable, isKeyField = self._getFieldDescriptor(fld, fields)
+		keyField = self.KeyField
 		if fldType is not None and val is not None:
-			if fldType != type(val):
-				convTypes = (str, unicode, int, float, long, complex)
-				if issubclass(fldType, basestring) and isinstance(val, convTypes):
+			if fldType is not type(val):
+				if issubclass(fldType, basestring) and isinstance(val, _strConvTypes):
 					val = ustr(val)
 				elif issubclass(fldType, int) and isinstance(val, bool):
 					# convert bool to int (original field val was bool, but UI
@@ -1015,14 +1941,10 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 					# BLOB backend field wants buffer, but it is in a python string.
 					val = buffer(val)
 
-			if fldType != type(val):
+			if fldType is not type(val):
 				ignore = False
-				# Date and DateTime types are handled as character, even if the
-				# native field type is not. Ignore these. NOTE: we have to deal with the
-				# string representation of these classes, as there is no primitive for either
-				# 'DateTime' or 'Date'.
-				dtStrings = ("<type 'DateTime'>", "<type 'Date'>", "<type 'datetime.datetime'>","<type 'datetime.date'>")
-				if ustr(fldType) in dtStrings and isinstance(val, basestring):
+				if isDateType and isinstance(val, basestring):
+					# Date and DateTime types are handled as character. Ignore these.
 					ignore = True
 				elif issubclass(fldType, basestring) and isinstance(val, basestring):
 					ignore = True
@@ -1035,7 +1957,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				elif issubclass(fldType, basestring) and isinstance(val, buffer):
 					# Eliminate type error reported for blob fields.
 					ignore = True
-				elif fld in nonUpdateFields:
+				elif not updatable:
 					# don't worry so much if this is just a calculated field.
 					ignore = True
 				else:
@@ -1055,8 +1977,10 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if old_val == val:
 			return False
 		else:
+			if isKeyField:
+				oldIndexKey = self._pkIndexKey(rec)
 			if valid_pk:
-				if (fld == keyField) or (self._compoundKey and fld in keyField):
+				if isKeyField:
 					# Changing the key field value, need to key the mementos on the new
 					# value, not the old. Additionally, need to copy the mementos from the
 					# old key value to the new one.
@@ -1079,7 +2003,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				else:
 					keyFieldValue = rec[keyField]
 				mem = self._mementos.get(keyFieldValue, {})
-				if (fld in mem) or (fld in nonUpdateFields):
+				if (fld in mem) or not updatable:
 					# Memento is already there, or it isn't updateable.
 					pass
 				else:
@@ -1102,6 +2026,13 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 			# Finally, save the new value to the field and signify that the field was changed:
 			rec[fld] = val
+			self._recordStore._markChanged()
+			self._seekIndexUpdate(row, fld, old_val, val)
+			self._virtualCacheUpdate(row, fld)
+			if isKeyField:
+				self._pkIndexRemove(row, oldIndexKey)
+				self._pkIndexAdd(row, self._pkIndexKey(rec))
+			self._notifyDirtyState(isKeyField)
 			return True
 
 
@@ -1112,21 +2043,23 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		and the new PK is returned. None of this affects the current dataset.
 		"""
 		aux = self.AuxCursor
+		aux.UseQueryCache = self.UseQueryCache
 		if tbl is None:
 			tbl = self.Table
 		if pkCol is None:
 			pkCol = self.KeyField
 		sql = self._qMarkToParamPlaceholder("select %s from %s where %s = ?"
 				% (pkCol, tbl, field))
-		try:
-			dabo.dbActivityLog.info("lookupPKWithAdd() SQL: %s, PARAMS: %s" % (
-					sql.decode(self.Encoding).replace("\n", " "), "(%s, )" % val))
-		except StandardError:
-			# A problem with writing to the log, most likely due to encoding issues
+		if _dbLogEnabled():
 			try:
-				dabo.dbActivityLog.info("lookupPKWithAdd() SQL (failed to log PARAMS): %r" % sql)
+				dabo.dbActivityLog.info("lookupPKWithAdd() SQL: %s, PARAMS: %s" % (
+						sql.decode(self.Encoding).replace("\n", " "), "(%s, )" % val))
 			except StandardError:
-				dabo.dbActivityLog.info("lookupPKWithAdd() (failed to log SQL and PARAMS)")
+				# A problem with writing to the log, most likely due to encoding issues
+				try:
+					dabo.dbActivityLog.info("lookupPKWithAdd() SQL (failed to log PARAMS): %r" % sql)
+				except StandardError:
+					dabo.dbActivityLog.info("lookupPKWithAdd() (failed to log SQL and PARAMS)")
 		aux.execute(sql, (val,))
 		if aux.RowCount:
 			return aux.getFieldVal(pkCol)
@@ -1176,16 +2109,17 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			aux = self.AuxCursor
 			sql = self._qMarkToParamPlaceholder("delete from %s where %s = ? and %s = ?"
 					% (self._assocTable, self._assocPKColThis, self._assocPKColOther))
-			try:
-				dabo.dbActivityLog.info("mmDissociateValues() SQL: %s, PARAMS: %s" % (
-						sql.decode(self.Encoding).replace("\n", " "), str((self._assocTable,
-					self._assocPKColThis, self._assocPKColOther))))
-			except StandardError:
-				# A problem with writing to the log, most likely due to encoding issues
+			if _dbLogEnabled():
 				try:
-					dabo.dbActivityLog.info("mmDissociateValues() SQL (failed to log PARAMS): %r" % sql)
+					dabo.dbActivityLog.info("mmDissociateValues() SQL: %s, PARAMS: %s" % (
+							sql.decode(self.Encoding).replace("\n", " "), str((self._assocTable,
+						self._assocPKColThis, self._assocPKColOther))))
 				except StandardError:
-					dabo.dbActivityLog.info("mmDissociateValues() (failed to log SQL and PARAMS)")
+					# A problem with writing to the log, most likely due to encoding issues
+					try:
+						dabo.dbActivityLog.info("mmDissociateValues() SQL (failed to log PARAMS): %r" % sql)
+					except StandardError:
+						dabo.dbActivityLog.info("mmDissociateValues() (failed to log SQL and PARAMS)")
 			try:
 				aux.execute(sql, (thisPK, otherPK))
 			except dException.NoRecordsException:
@@ -1200,11 +2134,12 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		aux = self.AuxCursor
 		sql = self._qMarkToParamPlaceholder("delete from %s where %s = ?"
 				% (self._assocTable, self._assocPKColThis))
-		try:
-			dabo.dbActivityLog.info("mmDissociateAll() SQL: %s" % (
-					sql.decode(self.Encoding).replace("\n", " ")))
-		except StandardError:
-			dabo.dbActivityLog.info("mmDissociateAll() (failed to log SQL")
+		if _dbLogEnabled():
+			try:
+				dabo.dbActivityLog.info("mmDissociateAll() SQL: %s" % (
+						sql.decode(self.Encoding).replace("\n", " ")))
+			except StandardError:
+				dabo.dbActivityLog.info("mmDissociateAll() (failed to log SQL")
 		try:
 			aux.execute(sql, (self.getPK(),))
 		except dException.NoRecordsException:
@@ -1234,15 +2169,16 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		aux = self.AuxCursor
 		sql = self._qMarkToParamPlaceholder("select * from %s where %s = ? and %s = ?"
 				% (self._assocTable, self._assocPKColThis, self._assocPKColOther))
-		try:
-			dabo.dbActivityLog.info("mmAddToBoth() SQL: %s, PARAMS: %s" % (
-					sql.decode(self.Encoding).replace("\n", " "), str((thisPK, otherPK))))
-		except StandardError:
-			# A problem with writing to the log, most likely due to encoding issues
+		if _dbLogEnabled():
 			try:
-				dabo.dbActivityLog.info("mmAddToBoth() SQL (failed to log PARAMS): %r" % sql)
+				dabo.dbActivityLog.info("mmAddToBoth() SQL: %s, PARAMS: %s" % (
+						sql.decode(self.Encoding).replace("\n", " "), str((thisPK, otherPK))))
 			except StandardError:
-				dabo.dbActivityLog.info("mmAddToBoth() (failed to log SQL and PARAMS)")
+				# A problem with writing to the log, most likely due to encoding issues
+				try:
+					dabo.dbActivityLog.info("mmAddToBoth() SQL (failed to log PARAMS): %r" % sql)
+				except StandardError:
+					dabo.dbActivityLog.info("mmAddToBoth() (failed to log SQL and PARAMS)")
 		aux.execute(sql, (thisPK, otherPK))
 		if not aux.RowCount:
 			sql = self._qMarkToParamPlaceholder("insert into %s (%s, %s) values (?, ?)"
@@ -1369,18 +2305,19 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		to include, and rows is the number of rows to return.
 		"""
 		_currentRow = self.RowNumber
-		rowCount = self.RowCount
 		if rows is None:
+			rowCount = self.RowCount
 			rows = rowCount
 		else:
+			# Only fetch as far as needed when streaming.
+			rowCount = self._fetchTo(rowStart + rows - 1)
 			rows = min(rowStart + rows, rowCount)
-		if rows < 1 or rowStart > self.RowCount:
+		if rows < 1 or rowStart > rowCount:
 			return dDataSet()
 
 		getFieldVal = self.getFieldVal
-		_records = self._records
+		_records = self._recordStore
 		vFieldKeys = self.VirtualFields.keys()
-		_correctFieldTypesIfNeeded = self._correctFieldTypesIfNeeded
 
 		if not flds:
 			vflds = vFieldKeys
@@ -1391,7 +2328,6 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		ds = []
 		for row in xrange(rowStart, rows):
 			rec = _records[row]
-			_correctFieldTypesIfNeeded(rec)
 			tmprec = dict([(k, rec[k]) for k in flds if k in rec])
 			for v in vflds:
 				tmprec.update({v: getFieldVal(v, row,
@@ -1436,11 +2372,10 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				kf = (kf,)
 			for fld in kf:
 				rec[fld] = blank[fld]
-		for delfld in (kons.CURSOR_TMPKEY_FIELD, kons.CURSOR_FIELD_TYPES_CORRECTED):
-			try:
-				del rec[delfld]
-			except KeyError:
-				pass
+		try:
+			del rec[kons.CURSOR_TMPKEY_FIELD]
+		except KeyError:
+			pass
 		self.appendDataSet((rec,))
 
 
@@ -1457,18 +2392,21 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		# clear mementos and new record flags:
 		self._mementos = {}
 		self._newRecords = {}
+		self._notifyDirtyState()
 		self.lastRequeryTime = time.time()
 		# If None is passed as the data, exit after resetting the flags
 		if data is None:
 			return
 		# Store the values
-		self._records = data
 		self._types = typs
-		# Clear the unsorted list, and then apply the current sort
-		self.__unsortedRows = []
+		if data:
+			self._convertRecords(data, [fld for fld in data[0] if fld not in cursor_flags])
+		self._records = data
+		# Clear the unsorted positions, and then apply the current sort
+		self.__unsortedRows = {}
 		if self.sortColumn:
 			try:
-				self.sort(self.sortColumn, self.sortOrder)
+				self.sort(self.sortColumn, self.sortOrder, self.sortCase)
 			except dException.NoRecordsException:
 				# No big deal
 				pass
@@ -1494,6 +2432,48 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		self._records = self._records.removeFilters()
 
 
+	def iterRecords(self, rows=None, _setter=None):
+		"""
+		Return an iterator of dRowView objects for the passed row numbers, or
+		for all the records, without moving the record pointer. Values written
+		to the views go through setFieldVal(), so the mementos track them.
+
+		Don't add or remove records while iterating.
+		"""
+		records = self._records
+		if rows is None:
+			rows = xrange(len(records))
+		setter = _setter or self.setFieldVal
+		for row in rows:
+			yield dRowView(self, row, records[row], setter)
+
+
+	def apply(self, func, fields=None, rows=None, _setter=None):
+		"""
+		Call func with a dRowView of each of the passed rows, or of all the
+		records, without moving the record pointer. See iterRecords().
+
+		If 'fields' is passed, what func returns is written to the record: the
+		value of that field if it is a field name, or the values of those
+		fields, in order, if it is a sequence of names. Returns the number of
+		records in which any value was changed.
+		"""
+		if isinstance(fields, basestring):
+			fields = (fields,)
+			getVals = lambda ret: (ret,)
+		else:
+			getVals = lambda ret: ret
+		changed = 0
+		for view in self.iterRecords(rows, _setter):
+			ret = func(view)
+			if fields is not None:
+				for fld, val in zip(fields, getVals(ret)):
+					view[fld] = val
+			if view.Changed:
+				changed += 1
+		return changed
+
+
 	def replace(self, field, valOrExpr, scope=None):
 		"""
 		Replaces the value of the specified field with the given value
@@ -1516,11 +2496,15 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		self._records.Cursor = self
 		self._records.Bizobj = self._bizobj
 		self._records.replace(field, valOrExpr, scope=scope)
+		self._clearSeekIndexes()
+		self._clearVirtualCache()
+		if self._isKeyField(field):
+			self._clearPkIndex()
 
 
 	def first(self):
 		"""Move the record pointer to the first record of the data set."""
-		if self.RowCount > 0:
+		if self._hasRecords():
 			self.RowNumber = 0
 		else:
 			raise dException.NoRecordsException(
@@ -1529,7 +2513,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 	def prior(self):
 		"""Move the record pointer back one position in the recordset."""
-		if self.RowCount > 0:
+		if self._hasRecords():
 			if self.RowNumber > 0:
 				self.RowNumber -= 1
 			else:
@@ -1542,9 +2526,12 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 	def next(self):
 		"""Move the record pointer forward one position in the recordset."""
-		if self.RowCount > 0:
-			if self.RowNumber < (self.RowCount - 1):
-				self.RowNumber += 1
+		rowNum = self.RowNumber
+		# In streaming mode, this fetches the next row if it hasn't been yet.
+		available = self._fetchTo(rowNum + 1)
+		if available > 0:
+			if rowNum < (available - 1):
+				self.RowNumber = rowNum + 1
 			else:
 				raise dException.EndOfFileException(
 						_("Already at the end of the data set."))
@@ -1597,9 +2584,21 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		self._syncAuxProperties()
 
 		if allRows:
-			# This branch doesn't happen when called from dBizobj (not sure if
-			# we really need the allRows arg at all).
+			# This branch doesn't happen when called from dBizobj, unless its
+			# BatchedSave property is True.
 			rows = self.getChangedRows(includeNewUnchanged=includeNewUnchanged)
+			if self.BatchedSave:
+				try:
+					self.__saverows(sorted(rows))
+				except dException.DBQueryException, e:
+					try:
+						errMsg = ustr(e).decode(self.Encoding)
+					except UnicodeError:
+						errMsg = ustr(e)
+					dabo.dbActivityLog.info(
+							_("DBQueryException encountered in save(): %s") % errMsg)
+					raise e
+				return
 		else:
 			# This branch results in redundant isChanged() call when called from
 			# dBizobj.saveAll(), but it needs to be here because dBizobj.save()
@@ -1611,6 +2610,95 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			saverow(row)
 
 
+	def __saverows(self, rows):
+		"""
+		Save the passed rows, sending all the rows that need the same statement
+		to the backend together. Rows that can't share a statement, such as new
+		records whose PK is generated by the backend on insert, or records that
+		need their default values fetched back, are saved one at a time.
+		"""
+		bo = self.BackendObject
+		kf = self.KeyField
+		keyFields = kf if self._compoundKey else (kf,)
+		nonup = self.getNonUpdateFields()
+		fieldTypes = dict([(ds[0], ds[1]) for ds in self.DataStructure])
+
+		def paramVal(fld, val):
+			if fieldTypes.get(fld) == "L" or (isinstance(val, basestring) and "\0" in val):
+				val = self.formatBLOB(val)
+			return val
+
+		# Each group is keyed on (isInsert, columns), and holds the list of
+		# (row, recKey, params) for the rows saved with that statement.
+		groups = {}
+		groupOrder = []
+		singleRows = []
+		for row in rows:
+			rec = self._records[row]
+			recKey = self.pkExpression(rec)
+			newrec = kons.CURSOR_TMPKEY_FIELD in rec
+			if newrec:
+				if self._nullDefaults:
+					singleRows.append(row)
+					continue
+				newPKVal = None
+				if self.AutoPopulatePK and not self._compoundKey:
+					newPKVal = self.pregenPK()
+					if not newPKVal:
+						# We need getLastInsertID() after each insert.
+						singleRows.append(row)
+						continue
+					self.setFieldVal(kf, newPKVal, row)
+				diff = self._getNewRecordDiff(row)
+				cols = []
+				for fld in sorted(diff):
+					if self.AutoPopulatePK and (fld in keyFields) and not newPKVal:
+						continue
+					if fld in nonup:
+						continue
+					cols.append(fld)
+				params = [paramVal(fld, diff[fld][1]) for fld in cols]
+			else:
+				diff = self.getRecordStatus(row)
+				cols = [fld for fld in sorted(diff) if fld not in nonup]
+				params = [paramVal(fld, diff[fld][1]) for fld in cols]
+				# The original PK values, in case the PK itself was changed.
+				params.extend(self._getPkWhereParams(row))
+			if not cols:
+				# Let the single-row code handle this edge case.
+				singleRows.append(row)
+				continue
+			groupKey = (newrec, tuple(cols))
+			if groupKey not in groups:
+				groups[groupKey] = []
+				groupOrder.append(groupKey)
+			groups[groupKey].append((row, recKey, tuple(params)))
+
+		aux = self.AuxCursor
+		for groupKey in groupOrder:
+			newrec, cols = groupKey
+			members = groups[groupKey]
+			sql = self._getStatement(("update", "insert")[newrec], cols)
+			res = aux.executemany(sql, [params for row, recKey, params in members])
+			if not newrec:
+				# Some drivers return the number of rows changed, others only
+				# set the rowcount; -1 or None means that it isn't known.
+				if isinstance(res, (int, long)):
+					updated = res
+				else:
+					updated = getattr(aux, "rowcount", -1)
+				if not res or (updated is not None and 0 <= updated < len(members)):
+					# Rows deleted or changed by someone else weren't updated.
+					bo.noResultsOnSave()
+			for row, recKey, params in members:
+				self._clearMemento(row)
+				if newrec:
+					self._clearNewRecord(row=row, pkVal=recKey)
+
+		for row in singleRows:
+			self.__saverow(row)
+
+
 	def __saverow(self, row):
 		rec = self._records[row]
 		recKey = self.pkExpression(rec)
@@ -1631,13 +2719,20 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			diff = self._getNewRecordDiff(row)
 		else:
 			diff = self.getRecordStatus(row)
-		aq = self.AutoQuoteNames
 		if diff:
+			nonup = self.getNonUpdateFields()
+			fieldTypes = dict([(ds[0], ds[1]) for ds in self.DataStructure])
+			def paramVal(fld, val):
+				if fieldTypes.get(fld) == "L" or (isinstance(val, basestring) and "\0" in val):
+					val = self.formatBLOB(val)
+				#elif fieldTypes.get(fld) in ("D", "T"):
+				#	val = self.formatDateTime(val)
+				return val
+
+			cols = []
 			if newrec:
-				flds = ""
-				vals = []
 				kf = self.KeyField
-				for kk, vv in diff.items():
+				for kk in sorted(diff):
 					if self.AutoPopulatePK:
 						if self._compoundKey:
 							skipIt = (kk in kf)
@@ -1647,40 +2742,22 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 						if skipIt:
 							# we don't want to include the PK in the insert
 							continue
-					if kk in self.getNonUpdateFields():
+					if kk in nonup:
 						# Skip it.
 						continue
-					if self._nullDefaults and vv == (None, None):
+					if self._nullDefaults and diff[kk] == (None, None):
 						# Skip these, too
 						continue
-					# Append the field and its value.
-					flds += ", " + self.BackendObject.encloseNames(kk, aq)
-					# add value to expression
-					fieldType = [ds[1] for ds in self.DataStructure if ds[0] == kk][0]
-					val = vv[1]
-					if fieldType == "L" or (isinstance(val, basestring) and "\0" in val):
-						val = self.formatBLOB(val)
-					#elif fieldType in ("D", "T"):
-					#	val = self.formatDateTime(val)
-					vals.append(val)
-
-				# Trim leading comma-space from the 'flds' string
-				flds = flds[2:]
-				if not flds:
-					# Some backends (sqlite) require non-empty field clauses. We already
-					# know that we are expecting the backend to generate the PK, so send
-					# NULL as the PK Value:
-					flds = self.KeyField
-					vals = "NULL"
-				nms = self.BackendObject.encloseNames(self.Table, aq)
-				placeHolders = len(vals) * [self.ParamPlaceholder]
-				sql = "insert into %s (%s) values (%s) " % (nms, flds, ",".join(placeHolders))
-				params = tuple(vals)
+					cols.append(kk)
+				# If there are no columns, the statement inserts NULL as the PK value,
+				# since some backends (sqlite) require non-empty field clauses.
+				sql = self._getStatement("insert", cols)
+				params = tuple([paramVal(fld, diff[fld][1]) for fld in cols])
 			else:
-				pkWhere = self.makePkWhere(row)
-				updClause, params = self.makeUpdClause(diff)
-				sql = "update %s set %s where %s" % (self.BackendObject.encloseNames(self.Table, aq),
-						updClause, pkWhere)
+				cols = [fld for fld in sorted(diff) if fld not in nonup]
+				sql = self._getStatement("update", cols)
+				params = tuple([paramVal(fld, diff[fld][1]) for fld in cols]
+						+ self._getPkWhereParams(row))
 			#run the update
 			aux = self.AuxCursor
 			res = aux.execute(sql, params)
@@ -1745,6 +2822,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		except KeyError:
 			# didn't exist
 			pass
+		self._notifyDirtyState()
 
 
 	def _clearNewRecord(self, row=None, pkVal=None):
@@ -1755,6 +2833,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				del self._newRecords[pkVal]
 				if row is None:
 					# We deleted based on pk, don't delete flag for the current row.
+					self._notifyDirtyState()
 					return
 			except KeyError:
 				pass
@@ -1771,6 +2850,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			pass
 		# Remove the temp key field column, if still present.
 		rec.pop(kons.CURSOR_TMPKEY_FIELD, None)
+		self._notifyDirtyState()
 
 
 
@@ -1818,15 +2898,25 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		"""
 		if not self._blank:
 			self.__setStructure()
+		if self.CompactRecords:
+			layout = self._compactLayout
+			if layout is None:
+				layout = self._getCompactLayout([ds[0] for ds in self.DataStructure])
+			return dCompactRecord.fromDict(layout[0], layout[1], self._blank)
 		return self._blank.copy()
 
 
 	def new(self):
 		"""Add a new record to the data set."""
 		blank = self._getBlankRecord()
-		self._records = dDataSet(self._records + (blank,))
+		records = self._records
+		records.append(blank)
+		# Keep the PK and seek indexes current instead of rebuilding them.
+		self._pkIndexAdd(len(records) - 1, self._pkIndexKey(blank))
+		self._seekIndexAdd(len(records) - 1, blank)
 		# Adjust the RowCount and position
 		self.RowNumber = self.RowCount - 1
+		self._notifyDirtyState(True)
 
 
 	def cancel(self, allRows=False, ignoreNoRecords=None):
@@ -1856,20 +2946,28 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 					# append to the list of indexes to delete.
 					row, rec = self._getRecordByPk(rec_id)
 					self._clearMemento(row)
-					delrecs_idx.append(self._records._index(rec))
+					delrecs_idx.append(row)
 				delrecs_idx.sort(reverse=True)
 				for idx in delrecs_idx:
 					del recs[idx]
 				self._newRecords = {}
-				self._records = dDataSet(recs)
+				self._records = dRecordList(recs)
 				if self.RowNumber >= self.RowCount:
 					self.RowNumber = self.RowCount - 1
 
+			pkChanged = False
 			for rec_pk, mem in self._mementos.items():
 				row, rec = self._getRecordByPk(rec_pk)
 				for fld, val in mem.items():
 					self._records[row][fld] = val
+					pkChanged = pkChanged or self._isKeyField(fld)
 			self._mementos = {}
+			self._records._markChanged()
+			self._clearSeekIndexes()
+			self._clearVirtualCache()
+			if pkChanged:
+				self._clearPkIndex()
+			self._notifyDirtyState(pkChanged)
 
 		else:
 			row = self.RowNumber
@@ -1879,17 +2977,22 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				# We simply need to remove the row, and clear the memento and newrec flag.
 				self._clearMemento(row)
 				self._clearNewRecord(row)
-				recs = list(self._records)
-				del recs[recs.index(rec)]
-				self._records = dDataSet(recs)
-				if self.RowNumber >= self.RowCount:
-					self.RowNumber = self.RowCount - 1
+				self._removeRow(row)
 				return
 
 			# Not a new record: need to manually replace the old values:
+			pkChanged = False
 			for fld, val in self._mementos.get(recKey, {}).items():
 				self._records[row][fld] = val
+				self._virtualCacheUpdate(row, fld)
+				if self._isKeyField(fld):
+					self._clearPkIndex()
+					pkChanged = True
+			self._records._markChanged()
+			self._clearSeekIndexes()
 			self._clearMemento(row)
+			if pkChanged:
+				self._notifyDirtyState(True)
 
 
 	def delete(self, delRowNum=None):
@@ -1907,16 +3010,14 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			res = True
 			del self._newRecords[pk]
 		else:
-			pkWhere = self.makePkWhere()
+			params = self._getPkWhereParams(delRowNum)
 			# some backends(PostgreSQL) don't return information about number of deleted rows
 			# try to fetch it before
-			sql = "select count(*) as cnt from %s where %s" % (self.Table, pkWhere)
 			aux = self.AuxCursor
-			aux.execute(sql)
+			aux.execute(self._getStatement("count"), params)
 			res = aux.getFieldVal('cnt')
 			if res:
-				sql = "delete from %s where %s" % (self.Table, pkWhere)
-				aux.execute(sql)
+				aux.execute(self._getStatement("delete"), params)
 
 		if not res:
 			# Nothing was deleted
@@ -1929,12 +3030,21 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 
 	def _removeRow(self, row):
-		## Since record sets are tuples and thus immutable, we need to do this
-		## little dance to remove a row.
-		lRec = list(self._records)
-		del lRec[row]
-		self._records = dDataSet(lRec)
+		records = self._records
+		rec = records[row]
+		del records[row]
+		if row == len(records):
+			# Removing the last row doesn't shift any other positions, so the
+			# indexes can be kept instead of being rebuilt.
+			self._pkIndexRemove(row, self._pkIndexKey(rec))
+			self._seekIndexRemove(row, rec)
+			self._virtualCacheRemove(row)
+		else:
+			self._clearPkIndex()
+			self._clearSeekIndexes()
+			self._clearVirtualCache()
 		self.RowNumber = min(self.RowNumber, self.RowCount - 1)
+		self._notifyDirtyState(True)
 
 
 	def flush(self):
@@ -2045,14 +3155,286 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return map(self._getRowByPk, chKeys)
 
 
+	def _isKeyField(self, fld):
+		"""Return True if the passed field is, or is part of, the KeyField."""
+		kf = self.KeyField
+		if isinstance(kf, tuple):
+			return fld in kf
+		return bool(kf) and (fld == kf)
+
+
+	def _pkIndexKey(self, rec):
+		"""Return the value under which the passed record is stored in the PK index."""
+		kf = self.KeyField
+		if isinstance(kf, tuple):
+			return tuple([rec.get(k) for k in kf])
+		return rec.get(kf)
+
+
+	def _clearPkIndex(self):
+		"""Discard the PK index; it will be rebuilt on the next PK lookup."""
+		self._pkIndex = {}
+		self._pkIndexSource = None
+		self._pkIndexHasDupes = False
+
+
+	def _getPkIndex(self):
+		"""
+		Return the dict that maps each PK value to its row position. It is only
+		rebuilt when the underlying record set has been replaced, which happens
+		on requery, sort, filter, and most deletions.
+		"""
+		records = self._recordStore
+		if self._pkIndexSource is records:
+			return self._pkIndex
+		index = {}
+		if self.KeyField:
+			pkIndexKey = self._pkIndexKey
+			for row in xrange(len(records) - 1, -1, -1):
+				# Walk backwards so that, as with a linear scan, the first
+				# occurrence of a duplicated PK wins.
+				rec = records[row]
+				try:
+					index[pkIndexKey(rec)] = row
+				except TypeError:
+					# Unhashable key value; can't be looked up anyway.
+					pass
+		self._pkIndex = index
+		self._pkIndexSource = records
+		self._pkIndexHasDupes = (len(index) < len(records))
+		return index
+
+
+	def _pkIndexAdd(self, row, key):
+		"""Record in the PK index, if there is a current one, that 'key' is at 'row'."""
+		if self._pkIndexSource is not self._recordStore:
+			return
+		index = self._pkIndex
+		try:
+			current = index.get(key)
+			if current is None:
+				index[key] = row
+			else:
+				self._pkIndexHasDupes = True
+				index[key] = min(current, row)
+		except TypeError:
+			self._clearPkIndex()
+
+
+	def _pkIndexRemove(self, row, key):
+		"""Remove the 'key' entry for 'row' from the PK index, if there is a current one."""
+		if self._pkIndexSource is not self._recordStore:
+			return
+		index = self._pkIndex
+		try:
+			if index.get(key) == row:
+				if self._pkIndexHasDupes:
+					# Another row may share this value; start over.
+					self._clearPkIndex()
+				else:
+					del index[key]
+		except TypeError:
+			self._clearPkIndex()
+
+
+	def _clearSeekIndexes(self):
+		"""Discard the seek indexes; they will be rebuilt as they are needed."""
+		self._seekIndexes = {}
+		self._seekIndexSource = None
+
+
+	def _getSeekIndex(self, flds, caseInsensitive):
+		"""
+		Return the dSeekIndex of the values of the passed fields. Indexes of real
+		fields are cached until the records are replaced; indexes that involve
+		virtual fields are built on every call, since their values can't be
+		tracked.
+		"""
+		records = self._recordStore
+		if self._seekIndexSource is not records:
+			self._seekIndexes = {}
+			self._seekIndexSource = records
+		key = (tuple(flds), caseInsensitive)
+		try:
+			return self._seekIndexes[key]
+		except KeyError:
+			pass
+		rows = xrange(self.RowCount)
+		if len(flds) == 1:
+			fld = flds[0]
+			if fld in records[0]:
+				values = [(rec[fld], row) for row, rec in enumerate(records)]
+			else:
+				getFieldVal = self.getFieldVal
+				values = [(getFieldVal(fld, row=row), row) for row in rows]
+		else:
+			getFieldVal = self.getFieldVal
+			values = [(tuple([getFieldVal(fld, row=row) for fld in flds]), row)
+					for row in rows]
+		ret = dSeekIndex(caseInsensitive, values)
+		if not [fld for fld in flds if fld not in records[0]]:
+			self._seekIndexes[key] = ret
+		return ret
+
+
+	def _seekIndexValue(self, flds, rec):
+		"""Return the value that the seek index for 'flds' holds for the record."""
+		if len(flds) == 1:
+			return rec[flds[0]]
+		return tuple([rec[fld] for fld in flds])
+
+
+	def _seekIndexUpdate(self, row, fld, oldVal, newVal):
+		"""Update the seek indexes when the value of 'fld' in 'row' changes."""
+		if not self._seekIndexes or self._seekIndexSource is not self._recordStore:
+			return
+		for key, index in self._seekIndexes.items():
+			flds = key[0]
+			if fld not in flds:
+				continue
+			if len(flds) == 1:
+				index.remove(oldVal, row)
+				index.add(newVal, row)
+			else:
+				del self._seekIndexes[key]
+
+
+	def _seekIndexAdd(self, row, rec):
+		"""Add the passed record, which is at 'row', to the seek indexes."""
+		if not self._seekIndexes or self._seekIndexSource is not self._recordStore:
+			return
+		for (flds, caseInsensitive), index in self._seekIndexes.items():
+			index.add(self._seekIndexValue(flds, rec), row)
+
+
+	def _seekIndexRemove(self, row, rec):
+		"""Remove the passed record, which was at 'row', from the seek indexes."""
+		if not self._seekIndexes or self._seekIndexSource is not self._recordStore:
+			return
+		for (flds, caseInsensitive), index in self._seekIndexes.items():
+			index.remove(self._seekIndexValue(flds, rec), row)
+
+
+	def clearVirtualFieldCache(self, fld=None):
+		"""
+		Discard the cached values of the passed virtual field, or of all the
+		virtual fields if 'fld' is None. Call this when a memoised virtual
+		field depends on something other than the fields it declares, and
+		that has changed.
+		"""
+		if fld is None:
+			self._clearVirtualCache()
+		else:
+			self._dropVirtualCache(fld)
+
+
+	def _clearVirtualCache(self):
+		"""Discard the cached virtual field values; they are computed again as needed."""
+		self._virtualCache = {}
+		self._virtualDependents = {}
+		self._virtualCacheSource = None
+
+
+	def _dropVirtualCache(self, fld):
+		"""Discard the cached values of the virtual field, and its dependencies."""
+		self._virtualCache.pop(fld, None)
+		for dependents in self._virtualDependents.values():
+			dependents.discard(fld)
+
+
+	def _getVirtualCache(self, fld, vf):
+		"""
+		Return the dict of the cached values of the virtual field, keyed by
+		row. The values are cached for virtual fields whose definition has a
+		'depends' or a 'column_func' key. 'depends' lists the fields whose
+		values the virtual field is computed from; if it isn't given, a change
+		to any field of the row discards the row's value.
+		"""
+		if self._virtualCacheSource is not self._recordStore:
+			self._clearVirtualCache()
+			self._virtualCacheSource = self._recordStore
+		try:
+			definition, values = self._virtualCache[fld]
+		except KeyError:
+			definition = None
+		if definition is not vf:
+			# New, or the definition was replaced.
+			self._dropVirtualCache(fld)
+			values = {}
+			self._virtualCache[fld] = (vf, values)
+			deps = vf.get("depends")
+			if deps is None:
+				deps = (None,)
+			elif isinstance(deps, basestring):
+				deps = [dep.strip() for dep in deps.split(",")]
+			for dep in deps:
+				self._virtualDependents.setdefault(dep, set()).add(fld)
+		return values
+
+
+	def _cacheVirtualColumn(self, fld, vf, values):
+		"""
+		Compute the values of the virtual field for all of the rows that
+		aren't cached, by calling its 'column_func' once with the list of
+		their records. The function must return a sequence with the value for
+		each of the records, in the same order.
+		"""
+		store = self._recordStore
+		rows = [row for row in xrange(len(store)) if row not in values]
+		if not rows:
+			return
+		result = list(vf["column_func"]([store[row] for row in rows],
+				*vf["args"], **vf["kwargs"]))
+		if len(result) != len(rows):
+			raise dException.dException(
+					_("The column_func of virtual field '%(fld)s' returned %(got)s values "
+					"for %(cnt)s records.") % {"fld": fld, "got": len(result), "cnt": len(rows)})
+		values.update(zip(rows, result))
+
+
+	def _virtualCacheUpdate(self, row, fld):
+		"""Discard the cached virtual field values of 'row' that depend on 'fld'."""
+		if not self._virtualCache or self._virtualCacheSource is not self._recordStore:
+			return
+		cache = self._virtualCache
+		dependents = self._virtualDependents
+		pending = list(dependents.get(fld, ())) + list(dependents.get(None, ()))
+		done = set()
+		while pending:
+			vfld = pending.pop()
+			if vfld in done:
+				continue
+			done.add(vfld)
+			try:
+				cache[vfld][1].pop(row, None)
+			except KeyError:
+				pass
+			# Virtual fields may depend on other virtual fields.
+			pending.extend(dependents.get(vfld, ()))
+
+
+	def _virtualCacheRemove(self, row):
+		"""Discard the cached virtual field values of the last row, which was removed."""
+		if not self._virtualCache or self._virtualCacheSource is not self._recordStore:
+			return
+		for definition, values in self._virtualCache.values():
+			values.pop(row, None)
+
+
 	def _getRecordByPk(self, pk, raiseRowNotFound=True):
 		"""Find the record with the passed primary key; return (row, record)."""
-		kf = self.KeyField
-		if kf:
-			for idx, rec in enumerate(self._records):
-				key = self.getFieldVal(kf, row=idx)
-				if key == pk:
-					return (idx, rec)
+		if self.KeyField:
+			try:
+				row = self._getPkIndex().get(pk)
+				while row is None and self._streamPending:
+					# Not fetched yet, if it is there at all. Fetching extends the index.
+					self._fetchTo(len(self._recordStore))
+					row = self._pkIndex.get(pk)
+			except TypeError:
+				# Unhashable value, so it can't be a PK in this data set.
+				row = None
+			if row is not None:
+				return (row, self._recordStore[row])
 		if raiseRowNotFound:
 			tbl, rc = self.Table, self.RowCount
 			raise dException.RowNotFoundException(_("PK '%(pk)s' not found in table '%(tbl)s' (RowCount: %(rc)s)") % locals())
@@ -2067,8 +3449,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 	def hasPK(self, pk):
 		"""Return True if the passed pk is present in the dataset."""
-		kf = self.KeyField
-		return bool([v[kf] for v in self._records if v[kf] == pk])
+		row, rec = self._getRecordByPk(pk, raiseRowNotFound=False)
+		return row is not None
 
 
 	def moveToPK(self, pk):
@@ -2090,7 +3472,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		If the specified row does not exist, the pointer remains where it is,
 		and an exception is raised.
 		"""
-		if (rownum >= self.RowCount) or (rownum < 0):
+		if (rownum >= self._fetchTo(rownum)) or (rownum < 0):
 			rc = self.RowCount
 			tbl = self.Table
 			raise dException.dException(
@@ -2127,8 +3509,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		that is less than the passed value. If 'caseSensitive' is set to False,
 		string comparisons are done in a case-insensitive fashion.
 
-		If sort is True (the default), then we seek to the first matching value
-		without sorting first.
+		The values are searched through a sorted index, which is kept until the
+		records are replaced, so 'sort' no longer has any effect.
 
 		If incremental is True (default is False), then we only compare the first
 		characters up until the length of val.
@@ -2165,19 +3547,9 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if badflds:
 			raise dException.FieldNotFoundException(_("Non-existent field(s) '%s'") % ", ".join(badflds))
 
-		# Copy the specified field vals and their row numbers to a list, and
-		# add those lists to the sort list
-		sortList = []
-		for row in xrange(0, self.RowCount):
-			if simpleKey:
-				rowval = self.getFieldVal(fld, row=row)
-			else:
-				rowval = tuple([self.getFieldVal(f, row=row) for f in flds])
-			sortList.append([rowval, row])
-
 		if simpleKey:
 			# Determine if we are seeking string values
-			field_type = self._types.get(fld, type(sortList[0][0]))
+			field_type = self._types.get(fld, type(self.getFieldVal(fld, row=0)))
 			compString = issubclass(field_type, basestring)
 		else:
 			compString = False
@@ -2202,57 +3574,24 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				except ValueError:
 					val = float(0)
 
-		if sort:
-			if compString and not caseSensitive:
-				sortList.sort(key=caseInsensitiveSortKey)
-			else:
-				sortList.sort()
-
-		if compString and not caseSensitive:
-			# Change all of the first elements to lower case
-			def safeLower(val):
-				try:
-					return val.lower()
-				except AttributeError:
-					return val
-			searchList = [safeLower(first) for first, second in sortList]
-			try:
-				matchVal = val.lower()
-			except AttributeError:
-				# this is a string colum, but seeking a null value.
-				matchVal = val
-		else:
-			matchVal = val
-			searchList = [first for first, second in sortList]
-
+		index = self._getSeekIndex(flds, compString and not caseSensitive)
 		# See if we have an exact match before we look for 'near' values
-		try:
-			idx = searchList.index(matchVal)
-			ret = sortList[idx][1]
-		except ValueError:
+		ret = index.find(val)
+		if ret is None:
+			ret = -1
 			if near:
-				if incremental:
+				if incremental and isinstance(val, basestring):
 					# Match the next string only taking into account the first characters
-					# up to the length of matchStr (so that seeking for 'AB' will bring up
+					# up to the length of val (so that seeking for 'AB' will bring up
 					# 'AB-PC' instead of 'FW-PC'.
-
-					ret = len(sortList) - 1
-					for idx, testVal in enumerate(searchList):
-						if isinstance(testVal, basestring) and isinstance(matchVal, basestring):
-							if len(testVal) >= len(matchVal) and testVal[:len(matchVal)] == matchVal:
-								ret = sortList[idx][1]
-								break
-						elif not isinstance(matchVal, basestring) and testVal > matchVal:
-							ret = idx
-							break
+					ret = index.findPrefix(val)
+				elif incremental:
+					ret = index.findGreater(val)
 				else:
 					# Find the first row greater than the match value
-					numSmaller = len([testVal for testVal in searchList
-							if testVal < matchVal])
-					try:
-						ret = sortList[numSmaller][1]
-					except IndexError:
-						ret = len(sortList) - 1
+					ret = index.findNear(val)
+				if ret is None:
+					ret = self.RowCount - 1
 
 		if movePointer and ret > -1:
 			# Move the record pointer
@@ -2352,6 +3691,74 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return (", ".join(retSql), tuple(retParams))
 
 
+	def _getStatement(self, operation, cols=()):
+		"""
+		Return the parameterised SQL used to save or delete records in this
+		cursor's table. The 'operation' is one of 'insert', 'update', 'delete'
+		or 'count', and 'cols' is the sequence of fields to insert or update.
+		The values for those fields are the parameters, followed by the original
+		values of the key fields for the where clause (see _getPkWhereParams()).
+
+		The statements are cached by the backend object.
+		"""
+		kf = self.KeyField
+		keyFields = kf if self._compoundKey else (kf,)
+		aq = self.AutoQuoteNames
+		placeholder = self.ParamPlaceholder
+		key = (self.Table, operation, tuple(cols), keyFields, aq, placeholder)
+		return self.BackendObject.getStatement(key, self._buildStatement,
+				operation, cols, keyFields, aq, placeholder)
+
+
+	def _buildStatement(self, operation, cols, keyFields, aq, placeholder):
+		"""Build the SQL returned by _getStatement()."""
+		bo = self.BackendObject
+		tbl = self.Table
+		if keyFields[0]:
+			wherePrefix = bo.getWhereTablePrefix(tbl, autoQuote=aq)
+			pkWhere = " AND ".join(["%s%s = %s" % (wherePrefix, bo.encloseNames(fld, aq),
+					placeholder) for fld in keyFields])
+		else:
+			# Cannot update without a KeyField
+			pkWhere = "1 = 0"
+		if operation == "insert":
+			if cols:
+				flds = ", ".join([bo.encloseNames(fld, aq) for fld in cols])
+				vals = ",".join(len(cols) * [placeholder])
+			else:
+				flds, vals = self.KeyField, "NULL"
+			sql = "insert into %s (%s) values (%s) " % (bo.encloseNames(tbl, aq), flds, vals)
+		elif operation == "update":
+			updPrefix = bo.getUpdateTablePrefix(tbl, autoQuote=aq)
+			updClause = ", ".join(["%s%s = %s" % (updPrefix, bo.encloseNames(fld, aq),
+					placeholder) for fld in cols])
+			sql = "update %s set %s where %s" % (bo.encloseNames(tbl, aq), updClause, pkWhere)
+		elif operation == "delete":
+			sql = "delete from %s where %s" % (tbl, pkWhere)
+		elif operation == "count":
+			sql = "select count(*) as cnt from %s where %s" % (tbl, pkWhere)
+		else:
+			raise ValueError(_("Unknown statement operation: %s") % operation)
+		if isinstance(sql, unicode):
+			sql = sql.encode(self.Encoding)
+		return sql
+
+
+	def _getPkWhereParams(self, row):
+		"""
+		Return the list of parameters for the where clause of the statements
+		returned by _getStatement(): the original values of the key fields of
+		the passed row, in case they have been changed.
+		"""
+		if not self.KeyField:
+			return []
+		kf = self.KeyField
+		keyFields = kf if self._compoundKey else (kf,)
+		rec = self._records[row]
+		mem = self._mementos.get(self.pkExpression(rec), {})
+		return [mem.get(fld, rec[fld]) for fld in keyFields]
+
+
 	def processFields(self, txt):
 		return self.BackendObject.processFields(txt)
 
@@ -2388,13 +3795,17 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if tableName is None:
 			# Use the default
 			tableName = self.Table
-		key = "%s:::%s" % (tableName, self.CurrentSQL)
-		try:
-			return self._fieldStructure[key]
-		except KeyError:
-			flds = self.BackendObject.getFields(tableName, self.AuxCursor)
-			self._fieldStructure[key] = flds
-			return flds
+		bo = self.BackendObject
+		return bo.getSchemaInfo("fields", tableName, bo.getFields, tableName, self.AuxCursor)
+
+
+	def _schemaKey(self):
+		"""
+		Return the key under which the structure of the current query is cached
+		by the backend: the table, the SQL and the names of the fields returned.
+		"""
+		return (self.Table, self.CurrentSQL,
+				tuple([d[0] for d in (self.FieldDescription or ())]))
 
 
 	def getFieldInfoFromDescription(self):
@@ -2454,6 +3865,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		ret = None
 		if self.BackendObject:
 			ret = self.BackendObject.commitTransaction(self.AuxCursor)
+			self.__endQueryCacheTransaction()
 		return ret
 
 
@@ -2462,9 +3874,17 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		ret = None
 		if self.BackendObject:
 			ret = self.BackendObject.rollbackTransaction(self.AuxCursor)
+			self.__endQueryCacheTransaction()
 		return ret
 
 
+	def __endQueryCacheTransaction(self):
+		bo = self.BackendObject
+		queryCache = bo.QueryCache
+		if queryCache is not None:
+			queryCache.endTransaction(bo._getCursorConnection(self.AuxCursor))
+
+
 	def createTable(self, tabledef):
 		"""Create a table based on the table definition."""
 		self.BackendObject.createJustTable(tabledef, self)
@@ -2605,8 +4025,14 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 					autoQuote=self.AutoQuoteNames)
 
 
-	def setChildFilter(self, fld):
-		"""This method sets the appropriate WHERE filter for dependent child queries."""
+	def setChildFilter(self, fld, keyCount=None):
+		"""
+		This method sets the appropriate WHERE filter for dependent child queries.
+
+		If 'keyCount' is passed, the filter matches any of that many values of
+		the (single) link field, so that the children of several parents can be
+		fetched at once.
+		"""
 
 		def getTableAlias(fromClause):
 			if not fromClause.strip():
@@ -2629,8 +4055,12 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			alias = self.Table
 		if not isinstance(fld, (list, tuple)):
 			fld = (fld,)
-		filtExpr = "and".join([" %s.%s = %s " % (alias, fldExpr, self.ParamPlaceholder)
-				for fldExpr in fld])
+		if keyCount is None:
+			filtExpr = "and".join([" %s.%s = %s " % (alias, fldExpr, self.ParamPlaceholder)
+					for fldExpr in fld])
+		else:
+			filtExpr = " %s.%s in (%s) " % (alias, fld[0],
+					", ".join([self.ParamPlaceholder] * keyCount))
 		self.setChildFilterClause(filtExpr)
 
 
@@ -2784,6 +4214,33 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return ret
 
 
+	def getPrefetchSQL(self, fld, keyCount):
+		"""
+		Creates a SQL statement that fetches the child records for 'keyCount'
+		parents at once, without a limit clause. Returns the statement and the
+		number of records that the limit clause allows for each parent, or None
+		if there is no limit.
+		"""
+		holdFilter = self.sqlManager._childFilterClause
+		holdLimit = self.sqlManager._limitClause
+		self.setChildFilter(fld, keyCount)
+		self.sqlManager.setLimitClause(None)
+		ret = self.sqlManager.getSQL()
+		self.sqlManager._childFilterClause = holdFilter
+		self.sqlManager.setLimitClause(holdLimit)
+		if holdLimit is None:
+			limit = None
+		elif holdLimit == "":
+			limit = self.sqlManager._defaultLimit
+		else:
+			try:
+				limit = int(holdLimit)
+			except ValueError:
+				# Something like 'x, y' that we can't apply to each parent.
+				limit = None
+		return ret, limit
+
+
 	def executeSQL(self, *args, **kwargs):
 		self.sqlManager.execute(self.sqlManager.getSQL(), *args, **kwargs)
 	###     end - SQL Builder methods     ########
@@ -2884,12 +4341,33 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			self.__auxCursor.__backend = obj
 
 
+	def _getBatchedSave(self):
+		return self._batchedSave
+
+	def _setBatchedSave(self, val):
+		self._batchedSave = bool(val)
+
+
+	def _getCompactRecords(self):
+		return self._compactRecords
+
+	def _setCompactRecords(self, val):
+		self._compactRecords = bool(val)
+
+
 	def _getCurrentSQL(self):
 		if self.UserSQL:
 			return self.UserSQL
 		return self.AutoSQL
 
 
+	def _getFetchWindow(self):
+		return self._fetchWindow
+
+	def _setFetchWindow(self, val):
+		self._fetchWindow = max(0, int(val or 0))
+
+
 	def _getDescrip(self):
 		return self.__backend.getDescription(self)
 
@@ -2905,7 +4383,9 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 					# Nothing we can do. We are probably an AuxCursor
 					pass
 				else:
-					ds = self.BackendObject.getStructureDescription(self)
+					bo = self.BackendObject
+					ds = bo.getSchemaInfo("structure", self._schemaKey(),
+							bo.getStructureDescription, self)
 					gf_names = [gf[0] for gf in self.getFields(self.Table)]
 					for field in ds:
 						field_name, field_type, pk = field[0], field[1], field[2]
@@ -2947,6 +4427,9 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			val[idx] = (field_alias, field_type, field_pk, table_name, field_name, field_scale)
 			self._types[field_name] = dabo.db.getPythonType(field_type)
 		self._dataStructure = self.AuxCursor._dataStructure = tuple(val)
+		# The Decimal scales and field types may have changed.
+		self._converterPlan = None
+		self._fieldDescriptors = None
 
 
 	def _getEncoding(self):
@@ -2984,6 +4467,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		else:
 			self._keyField = ustr(kf)
 			self._compoundKey = False
+		self._clearPkIndex()
+		self._fieldDescriptors = None
 		self.AuxCursor._keyField = self._keyField
 		self.AuxCursor._compoundKey = self._compoundKey
 		self._keyFieldSet = self.AuxCursor._keyFieldSet = (self._hasValidKeyField)
@@ -2997,6 +4482,17 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return v
 
 
+	def _getPageNumber(self):
+		return self._pageNumber
+
+
+	def _getPageSize(self):
+		return self._pageSize
+
+	def _setPageSize(self, val):
+		self._pageSize = max(0, int(val or 0))
+
+
 	def _getParamPlaceholder(self):
 		if self._paramPlaceholder:
 			ret = self._paramPlaceholder
@@ -3021,16 +4517,34 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return ret
 
 
+	def _getRecords(self):
+		if self._streamPending:
+			# Something needs the whole data set.
+			self._fetchTo(sys.maxint)
+		return self._recordStore
+
+	def _setRecords(self, val):
+		# Replacing the records abandons any rows still waiting to be streamed.
+		self._streamPending = False
+		if not isinstance(val, dRecordList):
+			val = dRecordList(val)
+		self._recordStore = val
+		# The fields of the records may differ.
+		self._fieldDescriptors = None
+		self._notifyDirtyState(True)
+
+
 	def _getRowNumber(self):
 		try:
-			ret = min(self.__rownumber, self.RowCount - 1)
+			num = self.__rownumber
+			ret = min(num, self._fetchTo(num) - 1)
 		except AttributeError:
 			ret = -1
 		return ret
 
 
 	def _setRowNumber(self, num):
-		self.__rownumber = min(max(0, num), self.RowCount - 1)
+		self.__rownumber = min(max(0, num), self._fetchTo(num) - 1)
 
 
 	def _getTable(self):
@@ -3050,6 +4564,13 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				pass
 
 
+	def _getUseQueryCache(self):
+		return self._useQueryCache
+
+	def _setUseQueryCache(self, val):
+		self._useQueryCache = bool(val)
+
+
 	def _getUserSQL(self):
 		return self._userSQL
 
@@ -3059,12 +4580,20 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		self._userSQL = val
 
 
+	def _getVersionField(self):
+		return self._versionField
+
+	def _setVersionField(self, val):
+		self._versionField = val or ""
+
+
 	def _getVirtualFields(self):
 		return self._virtualFields
 
 	def _setVirtualFields(self, val):
 		assert isinstance(val, dict)
 		self._virtualFields = val
+		self._clearVirtualCache()
 
 
 	AutoPopulatePK = property(_getAutoPopulatePK, _setAutoPopulatePK, None,
@@ -3084,6 +4613,19 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 	BackendObject = property(_getBackendObject, _setBackendObject, None,
 			_("Returns a reference to the object defining backend-specific behavior (dBackend)"))
 
+	BatchedSave = property(_getBatchedSave, _setBatchedSave, None,
+			_("""When True, save(allRows=True) groups the changed rows by statement
+			and sends each group to the backend in one executemany() call, instead
+			of running one statement per row. Default=False  (bool)"""))
+
+	CompactRecords = property(_getCompactRecords, _setCompactRecords, None,
+			_("""When True, the records fetched by the next requery are stored as
+			dCompactRecord objects, which keep the values in a list and share one
+			field name map, instead of as one dict per record. This uses much less
+			memory for large data sets, while presenting the same API. Flags for
+			new records are kept apart from the values, and mementos are stored
+			by the cursor as usual. Default=False  (bool)"""))
+
 	CurrentSQL = property(_getCurrentSQL, None, None,
 			_("Returns the current SQL that will be run, which is one of UserSQL or AutoSQL."))
 
@@ -3108,6 +4650,13 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 	Encoding = property(_getEncoding, _setEncoding, None,
 			_("Encoding type used by the Backend  (string)"))
 
+	FetchWindow = property(_getFetchWindow, _setFetchWindow, None,
+			_("""When greater than zero, requeries return after fetching this many
+			rows, and further rows are fetched in windows of this size as RowNumber,
+			getFieldVal() or next() reach them. Anything that needs the whole data
+			set, such as RowCount, sorting or saving, fetches the remaining rows.
+			Meant for read-only and report cursors. Default=0 (fetch all rows) (int)"""))
+
 	FieldDescription = property(_getDescrip, None, None,
 			_("Tuple of field names and types, as returned by the backend  (tuple)"))
 
@@ -3125,6 +4674,17 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			_("""Name of field that is the PK. If multiple fields make up the key,
 			separate the fields with commas. (str)"""))
 
+	PageNumber = property(_getPageNumber, None, None,
+			_("In pagination mode, the number of the current page, counting from 0.  (int)"))
+
+	PageSize = property(_getPageSize, _setPageSize, None,
+			_("""When greater than zero, requery() fetches only the first page of this
+			many rows, and nextPage(), prevPage() and gotoPage() fetch the others.
+			The rows are ordered by the order-by clause followed by the PK, and the
+			pages on either side of the current one are found from the order-by
+			and PK values of its first and last rows, rather than by skipping rows
+			with OFFSET. Not available for UserSQL queries. Default=0 (no pages)  (int)"""))
+
 	ParamPlaceholder = property(_getParamPlaceholder, None, None,
 			_("""The character(s) used to indicate a parameter in an SQL statement.
 			This can be different for different backend systems. Read-only.  (str)"""))
@@ -3142,9 +4702,20 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 	Table = property(_getTable, _setTable, None,
 			_("The name of the table in the database that this cursor is updating."))
 
+	UseQueryCache = property(_getUseQueryCache, _setUseQueryCache, None,
+			_("""When True, the results of SELECT statements are taken from, and
+			stored in, the connection's query cache, if it has one; see
+			dConnection.QueryCache. Statements that change tables invalidate the
+			cache whether or not this is set. Default=False  (bool)"""))
+
 	UserSQL = property(_getUserSQL, _setUserSQL, None,
 			_("SQL statement to run. If set, the automatic SQL builder will not be used."))
 
+	VersionField = property(_getVersionField, _setVersionField, None,
+			_("""Name of a field whose value increases whenever a row is changed, such
+			as a timestamp or a row version number. Used by requeryChanges() to fetch
+			only the rows changed since the last requery.  (str)"""))
+
 	VirtualFields = property(_getVirtualFields, _setVirtualFields, None,
 			_("""A dictionary mapping virtual_field_name to a function to call.
 
@@ -3153,4 +4724,22 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 			The common use is to assign a bare function to a virtual field, but you can
 			also specify args and kwargs by assigning a dict with 'func', 'args' and
-			'kwargs' keys."""))
+			'kwargs' keys.
+
+			The values of a virtual field whose dict has a 'depends' key, listing the
+			fields that its value is computed from, are cached for each row. A row's
+			value is computed again after setFieldVal() changes one of those fields,
+			and all of the values after a requery, or when rows are removed, sorted or
+			filtered. Call clearVirtualFieldCache() when a value depends on anything
+			else.
+
+			A 'column_func' key can be given instead of, or along with, 'func'. It is
+			called with the list of the records whose values aren't cached, plus the
+			args and kwargs, and returns the list of their values; the whole column is
+			computed with one call, without moving the record pointer. Unless
+			'depends' is given too, a change to any field of a row discards its
+			value."""))
+
+	_records = property(_getRecords, _setRecords, None,
+			_("""The dRecordList holding the cursor's records. In streaming mode, reading
+			it fetches all the rows that are still pending.  (dRecordList)"""))
@@ -3,7 +3,7 @@ import sys
 import re
 import operator
 import datetime
-import hashlib
+import itertools
 
 from decimal import Decimal
 try:
@@ -26,6 +26,33 @@ pysqlite2: http://initd.org/tracker/pysqlite
 import dabo
 from dabo.dLocalize import _
 from dabo.lib.utils import ustr
+from dabo.db import dDataSetQuery
+
+
+
+# Source of the version numbers given to data sets. They are unique across all
+# data sets, so a version identifies both the data set and the state of its data.
+_versionCounter = itertools.count(1)
+
+# Functions compiled from the expressions passed to replace() and
+# filterByExpression(), keyed on the expression and the field names.
+_maxCachedExpressions = 200
+_expressionCache = {}
+_fieldPatterns = {}
+
+
+def _fieldPattern(fields):
+	"""Returns the regular expression that matches any of the field names."""
+	try:
+		return _fieldPatterns[fields]
+	except KeyError:
+		if len(_fieldPatterns) >= _maxCachedExpressions:
+			_fieldPatterns.clear()
+		# Longer names first, so that a name is never matched by its prefix.
+		names = sorted(fields, key=len, reverse=True)
+		ret = _fieldPatterns[fields] = re.compile(r"\b(?:%s)\b"
+				% "|".join([re.escape(fld) for fld in names]))
+		return ret
 
 
 
@@ -51,17 +78,16 @@ class dDataSet(tuple):
 		self._typeStructure = {}
 		# We may need to encode fields that are not legal names.
 		self.fieldAliases = {}
-		# Keep a hash value to tell if we need to re-populate
-		self._dataHash = ""
+		# Changes whenever the data is changed; see _markChanged().
+		self._version = _versionCounter.next()
+		# Maps the alias of each table in our SQLite database to the
+		# (version, fields) of the data set it was populated from.
+		self._tableVersions = {}
 
-		sqlite.register_adapter(Decimal, self._adapt_decimal)
 		# When filtering datasets, we need a reference to the dataset
 		# this dataset was derived from.
 		self._sourceDataSet = None
 
-		# Register the converters
-		sqlite.register_converter("decimal", self._convert_decimal)
-
 		self._typeDict = {int: "integer", long: "integer", str: "text",
 				unicode: "text", float: "real", datetime.date: "date",
 				datetime.datetime: "timestamp", Decimal: "decimal"}
@@ -97,6 +123,20 @@ class dDataSet(tuple):
 		return Decimal(strVal)
 
 
+	def _markChanged(self):
+		"""
+		Record that the data in this data set has changed, so that the SQLite
+		table used by execute() is re-populated. Code that changes the records
+		directly, rather than through replace(), must call this. Filtered data
+		sets share their records with the data set they came from, so that is
+		marked as changed, too.
+		"""
+		ds = self
+		while ds is not None:
+			ds._version = _versionCounter.next()
+			ds = ds._sourceDataSet
+
+
 	def _index(self, rec):
 		"""Returns the index of the record object, or None."""
 		for idx, item in enumerate(self):
@@ -113,27 +153,23 @@ class dDataSet(tuple):
 
 		Scope is a boolean expression.
 		"""
+		if not self:
+			return
+		recs = self
 		if scope is not None:
-			scope = self._fldReplace(scope, "rec")
-
-		literal = True
-		if isinstance(valOrExpr, basestring):
-			if valOrExpr.strip()[0] == "=":
-				literal = False
-				valOrExpr = valOrExpr.replace("=", "", 1)
-			valOrExpr = self._fldReplace(valOrExpr, "rec")
-		if literal:
-			upDict = {field: valOrExpr}
-			if scope is None:
-				[rec.update(upDict) for rec in self]
-			else:
-				[rec.update(upDict) for rec in self
-						if eval(scope)]
-		else:
+			scopeFunc = self._compileExpression(scope)
+			recs = [rec for rec in self if scopeFunc(rec)]
+
+		if isinstance(valOrExpr, basestring) and valOrExpr.strip()[0] == "=":
+			valFunc = self._compileExpression(valOrExpr.replace("=", "", 1))
 			# Need to go record-by-record so that the expression evaluates correctly
-			for rec in self:
-				if eval(scope):
-					rec[field] = eval(valOrExpr)
+			for rec in recs:
+				rec[field] = valFunc(rec)
+		else:
+			upDict = {field: valOrExpr}
+			for rec in recs:
+				rec.update(upDict)
+		self._markChanged()
 
 
 	def sort(self, col, ascdesc=None, caseSensitive=None):
@@ -210,9 +246,8 @@ class dDataSet(tuple):
 		if not self:
 			# No rows, so nothing to filter
 			return self
-		stmnt = """ [rec for rec in self if %s] """ % self._fldReplace(expr, "rec")
-		recs = eval(stmnt)
-		ret = self.__class__(recs)
+		func = self._compileExpression(expr)
+		ret = self.__class__([rec for rec in self if func(rec)])
 		ret._sourceDataSet = self
 		return ret
 
@@ -247,14 +282,26 @@ class dDataSet(tuple):
 			self._fldReplace("price > 50", "foo")
 				=> returns "foo['price'] > 50"
 		"""
-		patTemplate = r"\b%s\b"
-		ret = expr
 		if dictName is None:
 			dictName = "rec"
-		for kk in self[0]:
-			pat = patTemplate % kk
-			replacement = "%s['%s']" % (dictName, kk)
-			ret = re.sub(pat, replacement, ret)
+		return _fieldPattern(tuple(self[0])).sub(
+				lambda mtch: "%s['%s']" % (dictName, mtch.group(0)), expr)
+
+
+	def _compileExpression(self, expr):
+		"""Returns a function that evaluates the expression for the record
+		passed to it. The functions are cached, so each expression is only
+		rewritten and compiled once for a given set of fields.
+		"""
+		key = (expr, tuple(self[0]))
+		try:
+			return _expressionCache[key]
+		except KeyError:
+			pass
+		if len(_expressionCache) >= _maxCachedExpressions:
+			_expressionCache.clear()
+		code = "lambda rec: (%s)" % self._fldReplace(expr, "rec")
+		ret = _expressionCache[key] = eval(compile(code, "<dDataSet expression>", "eval"))
 		return ret
 
 
@@ -282,10 +329,7 @@ class dDataSet(tuple):
 				self.fieldAliases[safekey] = key
 			else:
 				safekey = key
-			try:
-				typ = dabo.db.getPythonType(self._typeStructure[key][0])
-			except KeyError:
-				typ = type(rec[key])
+			typ = self._columnType(rec, key)
 			try:
 				retList.append("%s %s" % (safekey, ds._typeDict[typ]))
 			except KeyError:
@@ -293,6 +337,14 @@ class dDataSet(tuple):
 		return "create table %s (%s)" % (alias, ", ".join(retList))
 
 
+	def _columnType(self, rec, key):
+		"""Return the Python type that the column for the field is declared as."""
+		try:
+			return dabo.db.getPythonType(self._typeStructure[key][0])
+		except KeyError:
+			return type(rec[key])
+
+
 	def _populate(self, ds, alias=None):
 		"""This is the method that converts a Python dataset
 		into a SQLite table with the name specified by 'alias'.
@@ -305,26 +357,35 @@ class dDataSet(tuple):
 			dabo.log.info(_("Cannot populate without data for alias '%s'")
 					% alias)
 			return None
-		hs = hashlib.md5(ustr(ds)).hexdigest()
-		if hs == ds._dataHash:
+		fields = tuple(ds[0].keys())
+		try:
+			version, tableFields = self._tableVersions[alias]
+		except KeyError:
+			version = tableFields = None
+		if version == ds._version:
 			# Data's already there and hasn't changed; no need to re-load it
 			return
-		ds._dataHash = hs
-		if ds._populated:
+		if tableFields == fields:
 			# Clear out the old records
 			self._cursor.execute("delete from %s" % alias)
 		else:
+			if tableFields is not None:
+				self._cursor.execute("drop table %s" % alias)
 			# Create the table
 			self._cursor.execute(self._makeCreateTable(ds, alias))
+		self._tableVersions[alias] = (ds._version, fields)
 
 		# Fields may contain illegal names. This will correct them
-		flds = [fld.replace("dabo-", "dabo_") for fld in ds[0]]
+		flds = [fld.replace("dabo-", "dabo_") for fld in fields]
 		fldParams = [":%s" % fld for fld in flds]
 		insStmnt = "insert into %s (%s) values (%s)" % (alias,
 				", ".join(flds), ", ".join(fldParams))
 
 		def recGenerator(ds):
 			for rec in ds:
+				if not isinstance(rec, dict):
+					# Compact records; sqlite only binds named parameters from dicts.
+					rec = dict(rec.items())
 				yield rec
 
 		self._cursor.executemany(insStmnt, recGenerator(ds))
@@ -347,7 +408,30 @@ class dDataSet(tuple):
 		additional DataSet objects in a dictionary, where the value is the
 		DataSet, and the key is the alias used to reference that DataSet
 		in your join statement.
+
+		Simple selects against a single data set are run directly on the
+		records by dDataSetQuery, without copying the data into SQLite. The
+		results then hold the original values. Everything else, including
+		joins and statements that change the data, is run by SQLite.
 		"""
+		if params and not isinstance(params, tuple):
+			params = (params,)
+		if cursorDict is None and self:
+			try:
+				query = dDataSetQuery.getQuery(sqlExpr)
+				rec = self[0]
+				types = dict([(key, self._columnType(rec, key)) for key in rec.keys()])
+				return dDataSet(query.execute(self, params, types))
+			except dDataSetQuery.QueryNotSupported:
+				pass
+			except TypeError as e:
+				# Values that Python can't compare or combine; SQLite can.
+				dabo.log.info(_("Native query failed, using SQLite: %s") % e)
+		return self._executeSQLite(sqlExpr, params, cursorDict)
+
+
+	def _executeSQLite(self, sqlExpr, params=(), cursorDict=None):
+		"""Run the statement against SQLite copies of the data sets."""
 		def dict_factory(cursor, row):
 			dd = {}
 			for idx, col in enumerate(cursor.description):
@@ -388,8 +472,6 @@ class dDataSet(tuple):
 				self._populate(ds, alias)
 
 		# We have a table now with the necessary data. Run the query!
-		if params and not isinstance(params, tuple):
-			params = (params,)
 		self._cursor.execute(sqlExpr, params)
 
 # 		et = time.clock()
@@ -400,6 +482,9 @@ class dDataSet(tuple):
 		# modified data set.
 		if not sqlExpr.lower().strip().startswith("select "):
 			self._cursor.execute("select * from dataset")
+			# The table no longer matches our records, so it has to be re-loaded
+			# the next time.
+			self._tableVersions["dataset"] = (None, self._tableVersions["dataset"][1])
 		tmpres = self._cursor.fetchall()
 
 # 		ft = time.clock()
@@ -477,6 +562,12 @@ class dDataSet(tuple):
 			_("""An optional helper dictionary matching field names to dabo data types."""))
 
 
+# Register the Decimal adapter and converter. Cursors of the SQLite backend
+# rely on them, too.
+sqlite.register_adapter(Decimal, dDataSet._adapt_decimal)
+sqlite.register_converter("decimal", dDataSet._convert_decimal)
+
+
 
 # class DataSetOld(tuple):
 # 	""" This class assumes that its contents are not ordinary tuples, but
@@ -0,0 +1,989 @@
+# -*- coding: utf-8 -*-
+"""
+Native query engine for dDataSet.
+
+dDataSet.execute() used to copy the whole data set into an in-memory SQLite
+table for every query, and then build new dicts from the results. This module
+runs the common single-data-set statements directly against the records:
+
+	select [distinct] <*, columns, expressions, aggregates> from dataset
+		[where ...] [group by ... [having ...]] [order by ...] [limit ... [offset ...]]
+
+Expressions may use columns, literals, '?' parameters, arithmetic, '||',
+comparisons, and, or, not, is [not] null, [not] in (...), [not] like,
+[not] between, the aggregates count, sum, total, avg, min and max, and the
+functions lower, upper, length, abs, trim, ifnull and coalesce. NULLs follow
+the SQL rules, and sorting orders values the way SQLite does.
+
+Values are compared the way SQLite compares them in the data set's table:
+literals and parameters compared with a column are converted to the column's
+affinity (so that "age > '35'" compares numbers), and Decimals are used as the
+integers or floats SQLite stores them as, which is also what the aggregates
+and arithmetic return for them.
+
+Anything else raises QueryNotSupported, and dDataSet hands the statement to
+SQLite instead.
+"""
+import re
+import operator
+from decimal import Decimal
+
+from dabo.dLocalize import _
+from dabo.lib.utils import ustr
+
+
+
+class QueryNotSupported(Exception):
+	"""Raised for statements that the native engine can't run."""
+	pass
+
+
+
+_keywords = frozenset(("SELECT", "DISTINCT", "ALL", "FROM", "WHERE", "GROUP",
+		"BY", "HAVING", "ORDER", "ASC", "DESC", "LIMIT", "OFFSET", "AS", "AND",
+		"OR", "NOT", "IS", "NULL", "IN", "LIKE", "BETWEEN", "COLLATE", "ESCAPE",
+		"GLOB", "JOIN", "ON", "UNION", "CASE", "EXISTS", "INTERSECT", "EXCEPT"))
+
+_tokenPat = re.compile(r"""
+		(?P<space>\s+)
+		| (?P<num>(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?)
+		| (?P<str>'(?:[^']|'')*')
+		| (?P<qid>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+		| (?P<id>[A-Za-z_][A-Za-z0-9_$]*)
+		| (?P<op><=|>=|<>|!=|==|\|\||[-+*/%=<>(),.?;])
+		""", re.X)
+
+_aggregates = frozenset(("count", "sum", "total", "avg", "min", "max"))
+
+# The largest number of parsed statements that are kept.
+_maxCachedQueries = 200
+_queryCache = {}
+
+
+def getQuery(sql):
+	"""Return the parsed dDataSetQuery for the sql, which is cached."""
+	try:
+		ret = _queryCache[sql]
+	except KeyError:
+		if len(_queryCache) >= _maxCachedQueries:
+			_queryCache.clear()
+		try:
+			ret = dDataSetQuery(sql)
+		except QueryNotSupported:
+			ret = None
+		_queryCache[sql] = ret
+	if ret is None:
+		raise QueryNotSupported(sql)
+	return ret
+
+
+def _tokenize(sql):
+	ret = []
+	pos = 0
+	end = len(sql)
+	while pos < end:
+		mtch = _tokenPat.match(sql, pos)
+		if not mtch:
+			raise QueryNotSupported(sql)
+		kind = mtch.lastgroup
+		text = mtch.group(kind)
+		if kind == "num":
+			if "." in text or "e" in text.lower():
+				ret.append(("num", float(text), pos, mtch.end()))
+			else:
+				ret.append(("num", int(text), pos, mtch.end()))
+		elif kind == "str":
+			ret.append(("str", text[1:-1].replace("''", "'"), pos, mtch.end()))
+		elif kind == "qid":
+			ret.append(("id", text[1:-1].replace('""', '"'), pos, mtch.end()))
+		elif kind == "id":
+			if text.upper() in _keywords:
+				ret.append(("kw", text.upper(), pos, mtch.end()))
+			else:
+				ret.append(("id", text, pos, mtch.end()))
+		elif kind == "op":
+			ret.append(("op", text, pos, mtch.end()))
+		pos = mtch.end()
+	return ret
+
+
+# The leading number of a text value, as SQLite reads it.
+_numberPat = re.compile(r"\s*[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+_numberTypes = frozenset((int, long, float, bool, Decimal))
+
+# Values are only compared natively within the same storage class; comparing
+# values of different classes is left to SQLite.
+_storageClasses = {int: "number", long: "number", float: "number",
+		bool: "number", Decimal: "number", str: "text", unicode: "text"}
+
+
+def _truth(val):
+	"""SQL truth value: None for NULL, otherwise True or False."""
+	if val is None:
+		return None
+	if isinstance(val, basestring):
+		mtch = _numberPat.match(val)
+		if mtch is None:
+			return False
+		return bool(float(mtch.group()))
+	return bool(val)
+
+
+def _sqliteNumber(val):
+	"""Return the integer or float that SQLite stores for the Decimal."""
+	if val == val.to_integral_value():
+		return int(val)
+	return float(val)
+
+
+def _affinity(typ):
+	"""Return the affinity of a column whose values are of the passed type."""
+	if typ in (int, long, float, Decimal):
+		return "number"
+	if typ in (str, unicode):
+		return "text"
+	return None
+
+
+def _applyAffinity(val, affinity):
+	"""
+	Convert a literal or parameter that is compared with a column of the
+	passed affinity, as SQLite does.
+	"""
+	if isinstance(val, Decimal):
+		# Parameters are bound as text by dDataSet's adapter.
+		val = ustr(val)
+	if affinity == "number" and isinstance(val, basestring):
+		mtch = _numberPat.match(val)
+		if mtch is not None and not val[mtch.end():].strip():
+			num = mtch.group().strip()
+			if "." in num or "e" in num.lower():
+				return float(num)
+			return int(num)
+	elif affinity == "text" and type(val) in _numberTypes:
+		if isinstance(val, float):
+			# SQLite's text for floats differs from Python's.
+			raise QueryNotSupported(val)
+		return ustr(int(val))
+	return val
+
+
+def _comparison(func):
+	"""Wrap the comparison operator so that it only compares values SQLite would."""
+	def compare(lval, rval):
+		ltype, rtype = type(lval), type(rval)
+		if ltype is not rtype and _storageClasses.get(ltype, ltype) != \
+				_storageClasses.get(rtype, rtype):
+			raise QueryNotSupported(_("Values of mixed types: %r, %r") % (lval, rval))
+		if ltype is Decimal:
+			lval = _sqliteNumber(lval)
+		if rtype is Decimal:
+			rval = _sqliteNumber(rval)
+		return func(lval, rval)
+	return compare
+
+
+def _arithmetic(func):
+	"""Wrap the arithmetic operator so that it only works on numbers."""
+	def calc(lval, rval):
+		ltype, rtype = type(lval), type(rval)
+		if ltype not in _numberTypes or rtype not in _numberTypes:
+			raise QueryNotSupported(_("Arithmetic on non-numbers: %r, %r") % (lval, rval))
+		if ltype is Decimal:
+			lval = _sqliteNumber(lval)
+		if rtype is Decimal:
+			rval = _sqliteNumber(rval)
+		return func(lval, rval)
+	return calc
+
+
+def _concat(lval, rval):
+	if isinstance(lval, (float, Decimal)) or isinstance(rval, (float, Decimal)):
+		# SQLite's text for these differs from Python's.
+		raise QueryNotSupported(_("Concatenating a float"))
+	return ustr(lval) + ustr(rval)
+
+
+def _sortKey(val, nocase=False):
+	"""Sort key that orders values the way SQLite does: NULLs, then numbers, then text."""
+	if val is None:
+		return (0, 0)
+	if isinstance(val, (int, long, float)):
+		return (1, val)
+	if isinstance(val, Decimal):
+		# Comparing Decimals is slow. Compare them as floats first, so that
+		# the Decimals are only compared when the floats are equal.
+		return (1, float(val), val)
+	if isinstance(val, basestring):
+		if nocase:
+			return (2, val.lower())
+		return (2, val)
+	if isinstance(val, buffer):
+		return (4, str(val))
+	return (3, val)
+
+
+def _likeRegex(pattern):
+	"""Convert a LIKE pattern to a compiled regular expression."""
+	ret = []
+	for char in pattern:
+		if char == "%":
+			ret.append(".*")
+		elif char == "_":
+			ret.append(".")
+		else:
+			ret.append(re.escape(char))
+	return re.compile("".join(ret) + r"\Z", re.I | re.S | re.U)
+
+
+def _divide(a, b):
+	if not b:
+		return None
+	if isinstance(a, (int, long)) and isinstance(b, (int, long)):
+		# Integer division truncates towards zero.
+		ret = abs(a) // abs(b)
+		if (a < 0) != (b < 0):
+			ret = -ret
+		return ret
+	return a / b
+
+
+def _modulo(a, b):
+	a, b = int(a), int(b)
+	if not b:
+		return None
+	# The result has the sign of the dividend.
+	ret = abs(a) % abs(b)
+	if a < 0:
+		ret = -ret
+	return ret
+
+
+# The plain operators, used on values whose types are known to match.
+_rawComparisons = {
+		"=": operator.eq,
+		"==": operator.eq,
+		"!=": operator.ne,
+		"<>": operator.ne,
+		"<": operator.lt,
+		"<=": operator.le,
+		">": operator.gt,
+		">=": operator.ge,
+		}
+
+_binaryOps = {
+		"+": _arithmetic(operator.add),
+		"-": _arithmetic(operator.sub),
+		"*": _arithmetic(operator.mul),
+		"/": _arithmetic(_divide),
+		"%": _arithmetic(_modulo),
+		"||": _concat,
+		}
+for _op, _func in _rawComparisons.items():
+	_binaryOps[_op] = _comparison(_func)
+del _op, _func
+
+_comparisonOps = frozenset(_rawComparisons)
+
+
+def _strFunc(func):
+	def ret(val):
+		if isinstance(val, basestring):
+			return func(val)
+		return val
+	return ret
+
+_scalarFuncs = {
+		"lower": (1, _strFunc(lambda val: val.lower())),
+		"upper": (1, _strFunc(lambda val: val.upper())),
+		"trim": (1, _strFunc(lambda val: val.strip())),
+		"length": (1, lambda val: len(val if isinstance(val, basestring) else ustr(val))),
+		"abs": (1, lambda val: abs(_sqliteNumber(val) if type(val) is Decimal else val)),
+		}
+
+
+
+class dDataSetQuery(object):
+	"""
+	A statement parsed by the native engine. Parsing happens once; execute()
+	compiles the expressions for the data set and parameters it is given, and
+	runs the query.
+	"""
+	def __init__(self, sql):
+		self.sql = sql
+		self._tokens = _tokenize(sql)
+		self._pos = 0
+		self.paramCount = 0
+		self._parse()
+		del self._tokens
+
+
+	## Parsing ##
+	def _peek(self):
+		try:
+			return self._tokens[self._pos]
+		except IndexError:
+			return (None, None, len(self.sql), len(self.sql))
+
+
+	def _next(self):
+		tok = self._peek()
+		if tok[0] is None:
+			raise QueryNotSupported(self.sql)
+		self._pos += 1
+		return tok
+
+
+	def _acceptKeyword(self, *words):
+		tok = self._peek()
+		if tok[0] == "kw" and tok[1] in words:
+			self._pos += 1
+			return tok[1]
+		return None
+
+
+	def _expectKeyword(self, word):
+		if not self._acceptKeyword(word):
+			raise QueryNotSupported(self.sql)
+
+
+	def _acceptOp(self, *ops):
+		tok = self._peek()
+		if tok[0] == "op" and tok[1] in ops:
+			self._pos += 1
+			return tok[1]
+		return None
+
+
+	def _expectOp(self, op):
+		if not self._acceptOp(op):
+			raise QueryNotSupported(self.sql)
+
+
+	def _parse(self):
+		self._expectKeyword("SELECT")
+		self.distinct = bool(self._acceptKeyword("DISTINCT"))
+		if not self.distinct:
+			self._acceptKeyword("ALL")
+		self.items = self._parseSelectList()
+		self._expectKeyword("FROM")
+		tok = self._next()
+		if tok[0] != "id" or tok[1].lower() != "dataset":
+			raise QueryNotSupported(self.sql)
+		self.where = self.having = self.limit = self.offset = None
+		self.groupBy = []
+		self.orderBy = []
+		if self._acceptKeyword("WHERE"):
+			self.where = self._parseExpr()
+		if self._acceptKeyword("GROUP"):
+			self._expectKeyword("BY")
+			self.groupBy = self._parseExprList()
+			if self._acceptKeyword("HAVING"):
+				self.having = self._parseExpr()
+		if self._acceptKeyword("ORDER"):
+			self._expectKeyword("BY")
+			self.orderBy = self._parseOrderList()
+		if self._acceptKeyword("LIMIT"):
+			self.limit = self._parseExpr()
+			if self._acceptKeyword("OFFSET"):
+				self.offset = self._parseExpr()
+			elif self._acceptOp(","):
+				self.offset = self.limit
+				self.limit = self._parseExpr()
+		self._acceptOp(";")
+		if self._peek()[0] is not None:
+			raise QueryNotSupported(self.sql)
+		self.grouped = bool(self.groupBy) or (self.having is not None) \
+				or any(self._hasAggregate(item[1]) for item in self.items if item[0] == "expr") \
+				or any(self._hasAggregate(term[0]) for term in self.orderBy)
+
+
+	def _parseSelectList(self):
+		ret = []
+		while True:
+			tok = self._peek()
+			if self._acceptOp("*"):
+				ret.append(("star",))
+			elif tok[0] == "id" and tok[1].lower() == "dataset" \
+					and self._tokens[self._pos + 1:self._pos + 3] \
+					and [t[1] for t in self._tokens[self._pos + 1:self._pos + 3]] == [".", "*"]:
+				self._pos += 3
+				ret.append(("star",))
+			else:
+				start = tok[2]
+				expr = self._parseExpr()
+				end = self._tokens[self._pos - 1][3]
+				alias = None
+				if self._acceptKeyword("AS"):
+					tok = self._next()
+					if tok[0] not in ("id", "str"):
+						raise QueryNotSupported(self.sql)
+					alias = tok[1]
+				elif self._peek()[0] == "id":
+					alias = self._next()[1]
+				ret.append(("expr", expr, alias, self.sql[start:end]))
+			if not self._acceptOp(","):
+				return ret
+
+
+	def _parseExprList(self):
+		ret = [self._parseExpr()]
+		while self._acceptOp(","):
+			ret.append(self._parseExpr())
+		return ret
+
+
+	def _parseOrderList(self):
+		ret = []
+		while True:
+			expr = self._parseExpr()
+			nocase = False
+			if self._acceptKeyword("COLLATE"):
+				tok = self._next()
+				collation = ("%s" % tok[1]).upper()
+				if collation == "NOCASE":
+					nocase = True
+				elif collation != "BINARY":
+					raise QueryNotSupported(self.sql)
+			desc = (self._acceptKeyword("ASC", "DESC") == "DESC")
+			ret.append((expr, desc, nocase))
+			if not self._acceptOp(","):
+				return ret
+
+
+	def _parseExpr(self):
+		ret = self._parseAnd()
+		while self._acceptKeyword("OR"):
+			ret = ("or", ret, self._parseAnd())
+		return ret
+
+
+	def _parseAnd(self):
+		ret = self._parseNot()
+		while self._acceptKeyword("AND"):
+			ret = ("and", ret, self._parseNot())
+		return ret
+
+
+	def _parseNot(self):
+		if self._acceptKeyword("NOT"):
+			return ("not", self._parseNot())
+		return self._parseComparison()
+
+
+	def _parseComparison(self):
+		ret = self._parseAdditive()
+		op = self._acceptOp("=", "==", "!=", "<>", "<", "<=", ">", ">=")
+		if op:
+			return ("binop", op, ret, self._parseAdditive())
+		if self._acceptKeyword("IS"):
+			negate = bool(self._acceptKeyword("NOT"))
+			self._expectKeyword("NULL")
+			return ("isnull", ret, negate)
+		negate = bool(self._acceptKeyword("NOT"))
+		if self._acceptKeyword("IN"):
+			self._expectOp("(")
+			vals = self._parseExprList()
+			self._expectOp(")")
+			return ("in", ret, vals, negate)
+		if self._acceptKeyword("LIKE"):
+			pattern = self._parseAdditive()
+			if self._acceptKeyword("ESCAPE"):
+				raise QueryNotSupported(self.sql)
+			return ("like", ret, pattern, negate)
+		if self._acceptKeyword("BETWEEN"):
+			low = self._parseAdditive()
+			self._expectKeyword("AND")
+			high = self._parseAdditive()
+			return ("between", ret, low, high, negate)
+		if negate:
+			raise QueryNotSupported(self.sql)
+		return ret
+
+
+	def _parseAdditive(self):
+		ret = self._parseMultiplicative()
+		while True:
+			op = self._acceptOp("+", "-", "||")
+			if not op:
+				return ret
+			ret = ("binop", op, ret, self._parseMultiplicative())
+
+
+	def _parseMultiplicative(self):
+		ret = self._parseUnary()
+		while True:
+			op = self._acceptOp("*", "/", "%")
+			if not op:
+				return ret
+			ret = ("binop", op, ret, self._parseUnary())
+
+
+	def _parseUnary(self):
+		op = self._acceptOp("-", "+")
+		if op == "-":
+			return ("neg", self._parseUnary())
+		elif op == "+":
+			return self._parseUnary()
+		return self._parsePrimary()
+
+
+	def _parsePrimary(self):
+		tok = self._next()
+		kind, val = tok[0], tok[1]
+		if kind in ("num", "str"):
+			return ("lit", val)
+		if kind == "kw" and val == "NULL":
+			return ("lit", None)
+		if kind == "op" and val == "?":
+			self.paramCount += 1
+			return ("param", self.paramCount - 1)
+		if kind == "op" and val == "(":
+			ret = self._parseExpr()
+			self._expectOp(")")
+			return ret
+		if kind != "id":
+			raise QueryNotSupported(self.sql)
+		if self._acceptOp("."):
+			if val.lower() != "dataset":
+				raise QueryNotSupported(self.sql)
+			tok = self._next()
+			if tok[0] != "id":
+				raise QueryNotSupported(self.sql)
+			return ("col", tok[1])
+		if self._acceptOp("("):
+			name = val.lower()
+			distinct = bool(self._acceptKeyword("DISTINCT"))
+			if self._acceptOp("*"):
+				args = None
+			elif self._acceptOp(")"):
+				return ("func", name, [], distinct)
+			else:
+				args = self._parseExprList()
+			self._expectOp(")")
+			return ("func", name, args, distinct)
+		return ("col", val)
+
+
+	def _hasAggregate(self, node):
+		if not isinstance(node, tuple):
+			return False
+		if node[0] == "func" and node[1] in _aggregates:
+			return True
+		for child in node[1:]:
+			if isinstance(child, tuple) and self._hasAggregate(child):
+				return True
+			if isinstance(child, list):
+				if any(self._hasAggregate(sub) for sub in child):
+					return True
+		return False
+
+
+	## Compiling ##
+	def _compile(self, node, grouped, fieldMap, params, affinities):
+		"""
+		Turn the parsed expression into a function. In row mode the function
+		takes a record; in grouped mode it takes the list of records in a group.
+		"""
+		compile = lambda sub: self._compile(sub, grouped, fieldMap, params, affinities)
+		kind = node[0]
+		if kind == "lit":
+			val = node[1]
+			return lambda ctx: val
+		if kind == "param":
+			val = params[node[1]]
+			if isinstance(val, Decimal):
+				# Bound as text by dDataSet's adapter.
+				val = ustr(val)
+			return lambda ctx: val
+		if kind == "col":
+			try:
+				key = fieldMap[node[1].lower()]
+			except KeyError:
+				# Let SQLite report the error
+				raise QueryNotSupported(self.sql)
+			if grouped:
+				return lambda rows: rows[0].get(key) if rows else None
+			return lambda rec: rec.get(key)
+		if kind == "binop":
+			func = _binaryOps[node[1]]
+			if node[1] in _comparisonOps:
+				left, right = self._compileOperands(node[2], [node[3]], compile,
+						fieldMap, params, affinities)
+				right = right[0]
+			else:
+				left, right = compile(node[2]), compile(node[3])
+			if node[3][0] in ("lit", "param") and not grouped:
+				# Common case: compare a column with a constant.
+				rval = right(None)
+				if rval is None:
+					return lambda ctx: None
+				if node[1] in _comparisonOps and type(rval) is not Decimal:
+					# Values of the constant's type can be compared directly.
+					rawFunc, rvalType = _rawComparisons[node[1]], type(rval)
+					def binop(ctx):
+						lval = left(ctx)
+						if lval is None:
+							return None
+						if type(lval) is rvalType:
+							return rawFunc(lval, rval)
+						return func(lval, rval)
+					return binop
+				def binop(ctx):
+					lval = left(ctx)
+					if lval is None:
+						return None
+					return func(lval, rval)
+				return binop
+			def binop(ctx):
+				lval = left(ctx)
+				if lval is None:
+					return None
+				rval = right(ctx)
+				if rval is None:
+					return None
+				return func(lval, rval)
+			return binop
+		if kind == "neg":
+			operand = compile(node[1])
+			def neg(ctx):
+				val = operand(ctx)
+				if val is None:
+					return None
+				return _binaryOps["-"](0, val)
+			return neg
+		if kind == "and":
+			left, right = compile(node[1]), compile(node[2])
+			def and_(ctx):
+				lval = _truth(left(ctx))
+				if lval is False:
+					return False
+				rval = _truth(right(ctx))
+				if rval is False:
+					return False
+				if lval is None or rval is None:
+					return None
+				return True
+			return and_
+		if kind == "or":
+			left, right = compile(node[1]), compile(node[2])
+			def or_(ctx):
+				lval = _truth(left(ctx))
+				if lval is True:
+					return True
+				rval = _truth(right(ctx))
+				if rval is True:
+					return True
+				if lval is None or rval is None:
+					return None
+				return False
+			return or_
+		if kind == "not":
+			operand = compile(node[1])
+			def not_(ctx):
+				val = _truth(operand(ctx))
+				if val is None:
+					return None
+				return not val
+			return not_
+		if kind == "isnull":
+			operand, negate = compile(node[1]), node[2]
+			return lambda ctx: (operand(ctx) is None) != negate
+		if kind == "in":
+			negate = node[3]
+			operand, vals = self._compileOperands(node[1], node[2], compile,
+					fieldMap, params, affinities)
+			equal = _binaryOps["="]
+			def in_(ctx):
+				val = operand(ctx)
+				if val is None:
+					return None
+				sawNull = False
+				for valFunc in vals:
+					candidate = valFunc(ctx)
+					if candidate is None:
+						sawNull = True
+					elif equal(candidate, val):
+						return not negate
+				if sawNull:
+					return None
+				return negate
+			return in_
+		if kind == "like":
+			operand, pattern, negate = compile(node[1]), compile(node[2]), node[3]
+			regexes = {}
+			def like(ctx):
+				val = operand(ctx)
+				pat = pattern(ctx)
+				if val is None or pat is None:
+					return None
+				try:
+					regex = regexes[pat]
+				except KeyError:
+					regex = regexes[pat] = _likeRegex(ustr(pat))
+				return bool(regex.match(ustr(val))) != negate
+			return like
+		if kind == "between":
+			negate = node[4]
+			operand, (low, high) = self._compileOperands(node[1], node[2:4], compile,
+					fieldMap, params, affinities)
+			lessEqual = _binaryOps["<="]
+			def between(ctx):
+				val, lval, hval = operand(ctx), low(ctx), high(ctx)
+				if val is None or lval is None or hval is None:
+					return None
+				return (lessEqual(lval, val) and lessEqual(val, hval)) != negate
+			return between
+		if kind == "func":
+			return self._compileFunction(node, grouped, fieldMap, params, affinities)
+		raise QueryNotSupported(self.sql)
+
+
+	def _compileOperands(self, node, others, compile, fieldMap, params, affinities):
+		"""
+		Compile the operand of a comparison and the values it is compared with.
+		Literals and parameters on either side take the affinity of a column on
+		the other side, as in SQLite.
+		"""
+		def constant(sub, affinity):
+			val = compile(sub)(None)
+			val = _applyAffinity(val, affinity)
+			return lambda ctx: val
+		def affinityOf(sub):
+			if sub[0] == "col":
+				return affinities.get(fieldMap.get(sub[1].lower()))
+			return None
+		def isConstant(sub):
+			return sub[0] in ("lit", "param") and sub[1:] != (None,)
+		affinity = affinityOf(node)
+		funcs = []
+		for other in others:
+			if affinity and isConstant(other):
+				funcs.append(constant(other, affinity))
+			else:
+				funcs.append(compile(other))
+		operand = compile(node)
+		if isConstant(node) and len(others) == 1:
+			otherAffinity = affinityOf(others[0])
+			if otherAffinity:
+				operand = constant(node, otherAffinity)
+		return operand, funcs
+
+
+	def _compileFunction(self, node, grouped, fieldMap, params, affinities):
+		name, args, distinct = node[1], node[2], node[3]
+		if name in _aggregates:
+			if not grouped:
+				raise QueryNotSupported(self.sql)
+			if args is None:
+				if name != "count":
+					raise QueryNotSupported(self.sql)
+				return lambda rows: len(rows)
+			if len(args) != 1:
+				raise QueryNotSupported(self.sql)
+			# The argument is evaluated for each record in the group.
+			arg = self._compile(args[0], False, fieldMap, params, affinities)
+			def values(rows, numeric=False):
+				ret = [val for val in (arg(rec) for rec in rows) if val is not None]
+				if distinct:
+					ret = list(set(ret))
+				types = set(map(type, ret))
+				if numeric and not types <= _numberTypes:
+					raise QueryNotSupported(_("Aggregating non-numbers"))
+				if Decimal in types:
+					# SQLite's aggregates work on the numbers it stores for Decimals.
+					ret = [_sqliteNumber(val) if type(val) is Decimal else val
+							for val in ret]
+				return ret
+			numbers = lambda rows: values(rows, True)
+			if name == "count":
+				return lambda rows: len(values(rows))
+			if name == "min":
+				return lambda rows: min(values(rows) or [None])
+			if name == "max":
+				return lambda rows: max(values(rows) or [None])
+			if name == "total":
+				return lambda rows: float(sum(numbers(rows), 0.0))
+			if name == "sum":
+				def sum_(rows):
+					vals = numbers(rows)
+					if not vals:
+						return None
+					return sum(vals)
+				return sum_
+			def avg(rows):
+				vals = numbers(rows)
+				if not vals:
+					return None
+				return float(sum(vals)) / len(vals)
+			return avg
+
+		if distinct or args is None:
+			raise QueryNotSupported(self.sql)
+		argFuncs = [self._compile(arg, grouped, fieldMap, params, affinities)
+				for arg in args]
+		if name in ("ifnull", "coalesce"):
+			if (name == "ifnull" and len(argFuncs) != 2) or len(argFuncs) < 2:
+				raise QueryNotSupported(self.sql)
+			def coalesce(ctx):
+				for argFunc in argFuncs:
+					val = argFunc(ctx)
+					if type(val) is Decimal:
+						return _sqliteNumber(val)
+					if val is not None:
+						return val
+				return None
+			return coalesce
+		try:
+			argCount, func = _scalarFuncs[name]
+		except KeyError:
+			raise QueryNotSupported(self.sql)
+		if len(argFuncs) != argCount:
+			raise QueryNotSupported(self.sql)
+		argFunc = argFuncs[0]
+		def scalar(ctx):
+			val = argFunc(ctx)
+			if val is None:
+				return None
+			return func(val)
+		return scalar
+
+
+	## Running ##
+	def execute(self, records, params=(), types=None):
+		"""
+		Run the query against the passed sequence of records, and return the
+		list of result records. The optional types dict maps the fields to the
+		types that their SQLite columns are declared as; by default these are
+		the types of the values in the first record.
+		"""
+		if len(params) != self.paramCount:
+			raise QueryNotSupported(self.sql)
+		if not records:
+			raise QueryNotSupported(self.sql)
+		fields = list(records[0].keys())
+		if types is None:
+			types = dict([(fld, type(records[0][fld])) for fld in fields])
+		affinities = dict([(fld, _affinity(types.get(fld))) for fld in fields])
+		# Internal 'dabo-' fields are named 'dabo_' in queries and results, as
+		# they are in the SQLite table.
+		names = dict([(fld, fld.replace("dabo-", "dabo_")) for fld in fields])
+		fieldMap = dict([(names[fld].lower(), fld) for fld in fields])
+		compile = lambda node, grouped: self._compile(node, grouped, fieldMap, params,
+				affinities)
+
+		where = self.where
+		if where is None:
+			rows = list(records)
+		elif where[0] == "binop" and where[1] in _comparisonOps and where[2][0] == "col" \
+				and where[3][0] in ("lit", "param") and where[2][1].lower() in fieldMap:
+			# The most common filter, 'column <op> value', without a function call per record.
+			key = fieldMap[where[2][1].lower()]
+			val = _applyAffinity(compile(where[3], False)(None), affinities[key])
+			if val is None:
+				# Comparing with NULL is never true.
+				rows = []
+			else:
+				if type(val) is Decimal:
+					val = _sqliteNumber(val)
+				# Values of the same type as the constant are compared directly;
+				# the others need the checks and conversions of the full operator.
+				valType = type(val)
+				rawOp, op = _rawComparisons[where[1]], _binaryOps[where[1]]
+				rows = [rec for rec in records for recVal in (rec.get(key),)
+						if recVal is not None and (rawOp(recVal, val)
+						if type(recVal) is valType else op(recVal, val))]
+		else:
+			pred = compile(where, False)
+			rows = [rec for rec in records if _truth(pred(rec)) is True]
+
+		grouped = self.grouped
+		if grouped:
+			if self.groupBy:
+				keyFuncs = [compile(node, False) for node in self.groupBy]
+				groups = {}
+				for rec in rows:
+					key = tuple([func(rec) for func in keyFuncs])
+					try:
+						groups[key].append(rec)
+					except KeyError:
+						groups[key] = [rec]
+				# Like SQLite, return the groups in the order of their keys.
+				keys = sorted(groups, key=lambda key: tuple([_sortKey(val) for val in key]))
+				sources = [groups[key] for key in keys]
+			else:
+				sources = [rows]
+			if self.having is not None:
+				having = compile(self.having, True)
+				sources = [grp for grp in sources if _truth(having(grp)) is True]
+		else:
+			sources = rows
+
+		# Work out the output columns. Each is paired with the function that
+		# gets its value from a record, or from a group's records.
+		if grouped:
+			starGet = lambda fld: lambda src: src[0].get(fld) if src else None
+		else:
+			starGet = lambda fld: lambda src: src.get(fld)
+		columns = []
+		for item in self.items:
+			if item[0] == "star":
+				for fld in fields:
+					columns.append((names[fld], starGet(fld)))
+			else:
+				expr, alias, text = item[1], item[2], item[3]
+				if alias is None:
+					if expr[0] == "col" and expr[1].lower() in fieldMap:
+						alias = names[fieldMap[expr[1].lower()]]
+					else:
+						alias = text
+				columns.append((alias, compile(expr, grouped)))
+
+		def buildRecord(src):
+			ret = {}
+			for key, func in columns:
+				ret[key] = func(src)
+			return ret
+
+		# Only the records that are returned need to be built, unless they
+		# are needed to find the distinct ones.
+		if self.distinct:
+			seen = set()
+			results = []
+			for src in sources:
+				out = buildRecord(src)
+				sig = tuple([out[key] for key, func in columns])
+				if sig not in seen:
+					seen.add(sig)
+					results.append((out, src))
+		else:
+			results = [(None, src) for src in sources]
+
+		if self.orderBy:
+			aliases = dict([(("%s" % key).lower(), func) for key, func in reversed(columns)])
+			for expr, desc, nocase in reversed(self.orderBy):
+				if expr[0] == "lit" and isinstance(expr[1], (int, long)):
+					# Position in the result columns
+					if not 0 < expr[1] <= len(columns):
+						raise QueryNotSupported(self.sql)
+					func = columns[expr[1] - 1][1]
+				elif expr[0] == "col" and expr[1].lower() in aliases:
+					func = aliases[expr[1].lower()]
+				else:
+					func = compile(expr, grouped)
+				results.sort(key=lambda pair: _sortKey(func(pair[1]), nocase), reverse=desc)
+
+		if self.limit is not None:
+			limit = compile(self.limit, False)({})
+			offset = 0
+			if self.offset is not None:
+				offset = compile(self.offset, False)({})
+			if not isinstance(limit, (int, long)) or not isinstance(offset, (int, long)):
+				raise QueryNotSupported(self.sql)
+			offset = max(offset, 0)
+			if limit < 0:
+				results = results[offset:]
+			else:
+				results = results[offset:offset + limit]
+		return [buildRecord(src) if out is None else out for out, src in results]
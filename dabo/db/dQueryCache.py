@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+import re
+import threading
+import time
+from collections import OrderedDict
+from dabo.dLocalize import _
+
+
+# Tables that a statement reads: the items of FROM clauses, and joined tables.
+_fromPattern = re.compile(r"\bfrom\s+(.+?)(?=\s+(?:where|group|order|having|limit|union|"
+		r"left|right|inner|outer|cross|natural|full|join|on|for|window)\b|\)|;|$)",
+		re.IGNORECASE | re.DOTALL)
+_joinPattern = re.compile(r"\bjoin\s+([\w\"`\[\].]+)", re.IGNORECASE)
+# Table that a statement changes
+_writePattern = re.compile(r"^\s*(?:insert\s+(?:or\s+\w+\s+)?into|replace\s+into|update"
+		r"(?:\s+or\s+\w+)?|delete\s+from|truncate(?:\s+table)?|(?:create|alter|drop)"
+		r"(?:\s+temp(?:orary)?)?\s+table(?:\s+if\s+(?:not\s+)?exists)?)\s+([\w\"`\[\].]+)",
+		re.IGNORECASE)
+_selectPattern = re.compile(r"^\s*select\b", re.IGNORECASE)
+# Statements that only control transactions, and those that end them
+_transactionPattern = re.compile(r"^\s*(?:begin|start\s+transaction|commit|end|rollback|"
+		r"savepoint|release)\b", re.IGNORECASE)
+_endTransactionPattern = re.compile(r"^\s*(?:commit|end|rollback(?!\s+(?:transaction\s+)?to\b))",
+		re.IGNORECASE)
+_forUpdatePattern = re.compile(r"\bfor\s+update\b", re.IGNORECASE)
+
+
+
+def _tableName(name):
+	"""Return the bare, lower-case name of a possibly qualified and quoted table."""
+	return name.split(".")[-1].strip("\"`[]").lower()
+
+
+
+class dQueryCache(object):
+	"""
+	Cache of the records returned by SELECT statements, shared by the cursors
+	on a connection that have UseQueryCache set.
+
+	Results are keyed on the SQL, the params, and a 'variant' that tells
+	apart cursors that build different records from the same rows. At most
+	MaxSize results are kept; the least recently used one is dropped to make
+	room for a new one. A result is dropped when it is older than TTL seconds,
+	or when a Dabo cursor on the connection runs a statement that changes one
+	of the tables that the SELECT reads.
+
+	Changes made within a transaction can only be seen from the connection
+	that made them, so until that transaction ends, the results of queries
+	on the changed tables aren't cached, and the tables are invalidated once
+	more when it ends. Changes made in autocommit mode, which the backend
+	reports through inTransaction(), can be cached again right away. Changes made outside of Dabo aren't seen; use TTL, or
+	call invalidate(), for tables that are changed that way.
+	"""
+	def __init__(self, maxSize=100, ttl=None):
+		self.MaxSize = maxSize
+		self.TTL = ttl
+		self._lock = threading.RLock()
+		# Cached results, as (expires, tables, records, description) tuples,
+		# from the least to the most recently used.
+		self._entries = OrderedDict()
+		# The keys of the cached results that read each table
+		self._tableKeys = {}
+		# Tables changed in transactions that haven't ended yet, keyed by the
+		# connection that made the changes.
+		self._pendingTables = {}
+		self.resetStats()
+
+
+	def getTables(self, sql):
+		"""
+		Return the set of tables that the passed SELECT statement reads, or
+		None if it can't be cached.
+		"""
+		if not _selectPattern.match(sql) or _forUpdatePattern.search(sql):
+			return None
+		tables = set()
+		for clause in _fromPattern.findall(sql):
+			for item in clause.split(","):
+				item = item.strip()
+				if item and not item.startswith("("):
+					tables.add(_tableName(item.split()[0]))
+		for name in _joinPattern.findall(sql):
+			tables.add(_tableName(name))
+		tables.discard("")
+		return tables or None
+
+
+	def get(self, sql, params=None, variant=None):
+		"""
+		Return copies of the cached (records, description) for the statement,
+		or None if they aren't cached.
+		"""
+		if not _selectPattern.match(sql):
+			return None
+		key = self._makeKey(sql, params, variant)
+		self._lock.acquire()
+		try:
+			entry = self._entries.pop(key, None) if key is not None else None
+			if entry is not None and entry[0] is not None and entry[0] <= time.time():
+				self._forget(key, entry)
+				self._expirations += 1
+				entry = None
+			if entry is None:
+				self._misses += 1
+				return None
+			# Mark it as the most recently used one.
+			self._entries[key] = entry
+			self._hits += 1
+		finally:
+			self._lock.release()
+		return [rec.copy() for rec in entry[2]], entry[3]
+
+
+	def put(self, sql, params, records, description, variant=None):
+		"""
+		Cache copies of the records fetched by the statement. Returns True if
+		they were cached.
+		"""
+		key = self._makeKey(sql, params, variant)
+		if key is None or not self.MaxSize:
+			return False
+		tables = self.getTables(sql)
+		if tables is None:
+			return False
+		records = [rec.copy() for rec in records]
+		ttl = self.TTL
+		expires = (time.time() + ttl) if ttl is not None else None
+		self._lock.acquire()
+		try:
+			for pending in self._pendingTables.values():
+				if not pending.isdisjoint(tables):
+					# The results may include uncommitted changes.
+					return False
+			old = self._entries.pop(key, None)
+			if old is not None:
+				self._forget(key, old)
+			self._entries[key] = (expires, tables, records, description)
+			for table in tables:
+				self._tableKeys.setdefault(table, set()).add(key)
+			while len(self._entries) > self.MaxSize:
+				oldKey, oldEntry = self._entries.popitem(last=False)
+				self._forget(oldKey, oldEntry)
+				self._evictions += 1
+		finally:
+			self._lock.release()
+		return True
+
+
+	def invalidate(self, tables=None):
+		"""
+		Drop the cached results that read any of the passed tables, or all of
+		them if 'tables' is None.
+		"""
+		self._lock.acquire()
+		try:
+			if tables is None:
+				self._invalidations += len(self._entries)
+				self._entries.clear()
+				self._tableKeys.clear()
+				return
+			for table in tables:
+				for key in self._tableKeys.pop(_tableName(table), ()):
+					entry = self._entries.pop(key, None)
+					if entry is not None:
+						self._forget(key, entry)
+						self._invalidations += 1
+		finally:
+			self._lock.release()
+
+
+	def statementExecuted(self, sql, connection=None, inTransaction=True):
+		"""
+		Called by cursors after they run a statement other than a SELECT.
+		Drops the results that read the table that it changes, or all of the
+		results if that table can't be found in the statement. If the statement
+		ran in a transaction on the passed connection, the table is invalidated
+		again when the transaction ends, and results that read it aren't cached
+		until then. Statements that end the transaction call endTransaction().
+		"""
+		if _transactionPattern.match(sql):
+			if connection is not None and _endTransactionPattern.match(sql):
+				self.endTransaction(connection)
+			return
+		mtch = _writePattern.match(sql)
+		if not mtch:
+			self.invalidate()
+			return
+		table = _tableName(mtch.group(1))
+		self.invalidate((table,))
+		if connection is not None and inTransaction:
+			self._lock.acquire()
+			try:
+				self._pendingTables.setdefault(connection, set()).add(table)
+			finally:
+				self._lock.release()
+
+
+	def endTransaction(self, connection):
+		"""
+		Called when the connection commits or rolls back. Drops the results
+		that read the tables changed in the transaction.
+		"""
+		self._lock.acquire()
+		try:
+			tables = self._pendingTables.pop(connection, None)
+		finally:
+			self._lock.release()
+		if tables:
+			self.invalidate(tables)
+
+
+	def getStats(self):
+		"""Return a dict with the cache's counters and its current size."""
+		return {"hits": self._hits, "misses": self._misses, "evictions": self._evictions,
+				"expirations": self._expirations, "invalidations": self._invalidations,
+				"size": len(self._entries)}
+
+
+	def resetStats(self):
+		"""Set the counters returned by getStats() to 0."""
+		self._hits = self._misses = self._evictions = 0
+		self._expirations = self._invalidations = 0
+
+
+	def _makeKey(self, sql, params, variant):
+		"""Return the key for the results of the statement, or None if params can't be hashed."""
+		if isinstance(params, dict):
+			params = tuple(sorted(params.items()))
+		elif params:
+			params = tuple(params)
+		else:
+			params = ()
+		key = (sql, params, variant)
+		try:
+			hash(key)
+		except TypeError:
+			return None
+		return key
+
+
+	def _forget(self, key, entry):
+		"""Remove the key from the table index. Must be called with the lock held."""
+		for table in entry[1]:
+			keys = self._tableKeys.get(table)
+			if keys is not None:
+				keys.discard(key)
+				if not keys:
+					del self._tableKeys[table]
+
+
+	def _getHits(self):
+		return self._hits
+
+
+	def _getMisses(self):
+		return self._misses
+
+
+	def _getSize(self):
+		return len(self._entries)
+
+
+	Hits = property(_getHits, None, None,
+			_("Number of times a statement's results were found in the cache. (read-only) (int)"))
+
+	Misses = property(_getMisses, None, None,
+			_("Number of times a statement's results weren't in the cache. (read-only) (int)"))
+
+	Size = property(_getSize, None, None,
+			_("Number of results in the cache. (read-only) (int)"))
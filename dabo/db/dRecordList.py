@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from dabo.db.dDataSet import dDataSet
+
+
+
+class dRecordList(list):
+	"""
+	Mutable container for the records of a cursor.
+
+	dDataSet is a tuple, so adding or removing a record meant building a new
+	one, which made adding or deleting N records cost O(N**2). This is a list,
+	so records can be appended and removed in place.
+
+	The dDataSet API (filter(), replace(), execute(), UnfilteredDataSet, and
+	so on) is still available: attributes that aren't found on the list are
+	looked up on a dDataSet holding the same records. That dDataSet is only
+	created when it is needed, and is kept until records are added or removed.
+	If the records came from a dDataSet, it is used directly, so that filters
+	applied to it can still be removed.
+	"""
+	def __init__(self, records=()):
+		super(dRecordList, self).__init__(records)
+		if isinstance(records, dDataSet):
+			self._dataSet = records
+			self._sourceDataSet = records._sourceDataSet
+		else:
+			self._dataSet = None
+			self._sourceDataSet = None
+
+
+	def __getattr__(self, att):
+		if att.startswith("__") or att in ("_dataSet", "_sourceDataSet"):
+			raise AttributeError(att)
+		return getattr(self.asDataSet(), att)
+
+
+	def __setattr__(self, att, val):
+		if att in ("Bizobj", "Cursor", "Encoding", "TypeStructure"):
+			setattr(self.asDataSet(), att, val)
+		else:
+			super(dRecordList, self).__setattr__(att, val)
+
+
+	def asDataSet(self):
+		"""Returns a dDataSet containing the current records."""
+		ds = self._dataSet
+		if ds is None:
+			ds = self._dataSet = dDataSet(self)
+			ds._sourceDataSet = self._sourceDataSet
+		return ds
+
+
+	def _markChanged(self):
+		"""
+		Record that the values in the records have changed. See
+		dDataSet._markChanged().
+		"""
+		ds = self._dataSet
+		if ds is None:
+			ds = self._sourceDataSet
+		if ds is not None:
+			ds._markChanged()
+
+
+	def _resized(self):
+		# The dDataSet no longer holds the same records.
+		self._dataSet = None
+
+
+	def append(self, rec):
+		super(dRecordList, self).append(rec)
+		self._resized()
+
+
+	def extend(self, recs):
+		super(dRecordList, self).extend(recs)
+		self._resized()
+
+
+	def insert(self, pos, rec):
+		super(dRecordList, self).insert(pos, rec)
+		self._resized()
+
+
+	def pop(self, *args):
+		ret = super(dRecordList, self).pop(*args)
+		self._resized()
+		return ret
+
+
+	def remove(self, rec):
+		super(dRecordList, self).remove(rec)
+		self._resized()
+
+
+	def __delitem__(self, key):
+		super(dRecordList, self).__delitem__(key)
+		self._resized()
+
+
+	def __delslice__(self, i, j):
+		super(dRecordList, self).__delslice__(i, j)
+		self._resized()
+
+
+	def __setitem__(self, key, val):
+		super(dRecordList, self).__setitem__(key, val)
+		self._resized()
+
+
+	def __setslice__(self, i, j, val):
+		super(dRecordList, self).__setslice__(i, j, val)
+		self._resized()
+
+
+	def __iadd__(self, recs):
+		self.extend(recs)
+		return self
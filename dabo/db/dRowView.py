@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from dabo.dLocalize import _
+from dabo.dException import FieldNotFoundException
+
+
+
+class dRowView(object):
+	"""
+	Lightweight view of one record of a cursor, handed out by the
+	iterRecords() and apply() methods of dCursorMixin and dBizobj, which
+	work through the records without moving the record pointer.
+
+	Field values are read and written as items (view["price"]) or as
+	attributes (view.price). Reads of real fields come straight from the
+	record; virtual fields are computed by the cursor. Writes go through
+	setFieldVal(), so they are tracked by the mementos like any other change.
+
+	A view refers to its record by position, so it is only good until the
+	records are requeried, sorted, filtered, added or deleted.
+	"""
+	__slots__ = ("_cursor", "_row", "_rec", "_setter", "_changed")
+
+	def __init__(self, cursor, row, rec, setter):
+		# 'setter' is called as setter(fld, val, row), and returns True if the
+		# value was changed.
+		_set = object.__setattr__
+		_set(self, "_cursor", cursor)
+		_set(self, "_row", row)
+		_set(self, "_rec", rec)
+		_set(self, "_setter", setter)
+		_set(self, "_changed", False)
+
+
+	def __getitem__(self, fld):
+		rec = self._rec
+		if fld in rec:
+			return rec[fld]
+		try:
+			return self._cursor.getFieldVal(fld, self._row)
+		except FieldNotFoundException:
+			raise KeyError(fld)
+
+
+	def __setitem__(self, fld, val):
+		try:
+			self._set(fld, val)
+		except FieldNotFoundException:
+			raise KeyError(fld)
+
+
+	def __getattr__(self, fld):
+		if fld.startswith("__"):
+			# Not a field; don't confuse copy, pickle and the like.
+			raise AttributeError(fld)
+		rec = self._rec
+		if fld in rec:
+			return rec[fld]
+		return self._cursor.getFieldVal(fld, self._row)
+
+
+	def __setattr__(self, fld, val):
+		self._set(fld, val)
+
+
+	def __contains__(self, fld):
+		return (fld in self._rec) or (fld in self._cursor.VirtualFields)
+
+
+	def __repr__(self):
+		return "<dRowView of row %s: %r>" % (self._row, self._rec)
+
+
+	def get(self, fld, default=None):
+		"""Return the value of the field, or 'default' if there is no such field."""
+		try:
+			return self[fld]
+		except KeyError:
+			return default
+
+
+	def _set(self, fld, val):
+		if self._setter(fld, val, self._row):
+			object.__setattr__(self, "_changed", True)
+
+
+	def _getChanged(self):
+		return self._changed
+
+
+	def _getRowNumber(self):
+		return self._row
+
+
+	Changed = property(_getChanged, None, None,
+			_("True if a value was changed through this view. (read-only) (bool)"))
+
+	RowNumber = property(_getRowNumber, None, None,
+			_("Position of the record in the data set. (read-only) (int)"))
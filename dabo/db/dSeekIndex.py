@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import bisect
+import sys
+
+
+
+class dSeekIndex(object):
+	"""
+	Sorted index of the values of one or more fields of a cursor, used by
+	dCursorMixin.seek() and locate().
+
+	The index is a sorted list of (key, row) pairs, so lookups are binary
+	searches. Keys sort NULLs first; when 'caseInsensitive' is True, string
+	values are compared in lower case. Rows with equal keys are kept in row
+	order, so a lookup finds the first matching row.
+	"""
+	def __init__(self, caseInsensitive, values=()):
+		# 'values' is a sequence of (value, row) pairs.
+		self._caseInsensitive = caseInsensitive
+		makeKey = self.makeKey
+		self._entries = sorted([(makeKey(val), row) for val, row in values])
+
+
+	def makeKey(self, val):
+		"""Return the key that 'val' is sorted and compared by."""
+		if val is None:
+			return (0,)
+		if self._caseInsensitive and isinstance(val, basestring):
+			return (1, val.lower())
+		return (1, val)
+
+
+	def add(self, val, row):
+		"""Add 'val' for the passed row."""
+		bisect.insort(self._entries, (self.makeKey(val), row))
+
+
+	def remove(self, val, row):
+		"""Remove the entry for 'val' at the passed row, if there is one."""
+		entry = (self.makeKey(val), row)
+		entries = self._entries
+		pos = bisect.bisect_left(entries, entry)
+		if pos < len(entries) and entries[pos] == entry:
+			del entries[pos]
+
+
+	def find(self, val):
+		"""Return the first row whose value matches 'val', or None."""
+		key = self.makeKey(val)
+		entries = self._entries
+		pos = bisect.bisect_left(entries, (key,))
+		if pos < len(entries) and entries[pos][0] == key:
+			return entries[pos][1]
+		return None
+
+
+	def findNear(self, val):
+		"""Return the row with the smallest value not less than 'val', or None."""
+		entries = self._entries
+		pos = bisect.bisect_left(entries, (self.makeKey(val),))
+		if pos < len(entries):
+			return entries[pos][1]
+		return None
+
+
+	def findGreater(self, val):
+		"""Return the row with the smallest value greater than 'val', or None."""
+		entries = self._entries
+		pos = bisect.bisect_right(entries, (self.makeKey(val), sys.maxint))
+		if pos < len(entries):
+			return entries[pos][1]
+		return None
+
+
+	def findPrefix(self, val):
+		"""Return the row with the smallest string value that starts with 'val', or None."""
+		key = self.makeKey(val)
+		entries = self._entries
+		pos = bisect.bisect_left(entries, (key,))
+		if pos < len(entries):
+			found = entries[pos][0]
+			if found[0] == 1 and isinstance(found[1], basestring) and found[1].startswith(key[1]):
+				return entries[pos][1]
+		return None
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import csv
+import random
+import re
+import threading
+from cStringIO import StringIO
+
+
+_stringPattern = re.compile(r"'(?:[^']|'')*'")
+_numberPattern = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_placeholderPattern = re.compile(r"%s|%\(\w+\)s|(?<![\w:]):\w+")
+_inListPattern = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_whitespacePattern = re.compile(r"\s+")
+
+# Columns of the rows returned by getStats() and toCSV()
+_columns = ("count", "total", "min", "max", "mean", "p50", "p90", "p99", "rows")
+
+
+
+class dStatementTimings(object):
+	"""
+	Collects the time taken by the statements that cursors run, grouped by
+	the shape of the statement: its SQL with literals and parameter
+	placeholders replaced with '?', IN lists shortened, and white space
+	normalised, so that statements that differ only in their values are
+	counted together.
+
+	For each shape, it keeps the number of times it was run, the total,
+	smallest and largest time, the number of rows returned (or changed,
+	for statements other than SELECTs), and a sample of up to SampleSize
+	of the times, from which the percentiles are computed.
+	"""
+	# Most statements whose shapes are remembered, to save normalising them again.
+	shapeCacheSize = 1000
+
+	def __init__(self, sampleSize=256):
+		self.SampleSize = sampleSize
+		self._lock = threading.Lock()
+		self._shapes = {}
+		self.reset()
+
+
+	def getShape(self, sql):
+		"""Return the normalised shape of the passed statement."""
+		try:
+			return self._shapes[sql]
+		except KeyError:
+			pass
+		shape = _stringPattern.sub("?", sql)
+		shape = _numberPattern.sub("?", shape)
+		shape = _placeholderPattern.sub("?", shape)
+		shape = _inListPattern.sub("(?, ...)", shape)
+		shape = _whitespacePattern.sub(" ", shape).strip()
+		if len(self._shapes) >= self.shapeCacheSize:
+			self._shapes.clear()
+		self._shapes[sql] = shape
+		return shape
+
+
+	def record(self, sql, seconds, rows=0):
+		"""Add a run of the statement that took 'seconds' and returned 'rows' rows."""
+		shape = self.getShape(sql)
+		if rows < 0:
+			# The backend doesn't know.
+			rows = 0
+		self._lock.acquire()
+		try:
+			stats = self._stats.get(shape)
+			if stats is None:
+				# count, total, min, max, rows, sample
+				stats = self._stats[shape] = [0, 0.0, seconds, seconds, 0, []]
+			stats[0] += 1
+			stats[1] += seconds
+			if seconds < stats[2]:
+				stats[2] = seconds
+			if seconds > stats[3]:
+				stats[3] = seconds
+			stats[4] += rows
+			sample = stats[5]
+			if len(sample) < self.SampleSize:
+				sample.append(seconds)
+			else:
+				# Keep a uniform sample of all the runs.
+				pos = random.randrange(stats[0])
+				if pos < len(sample):
+					sample[pos] = seconds
+		finally:
+			self._lock.release()
+
+
+	def getStats(self):
+		"""
+		Return a dict keyed by statement shape. Each value is a dict with the
+		'count', 'total', 'min', 'max', 'mean', 'p50', 'p90' and 'p99' times
+		in seconds, and the number of 'rows'.
+		"""
+		self._lock.acquire()
+		try:
+			items = [(shape, stats[:5] + [sorted(stats[5])])
+					for shape, stats in self._stats.items()]
+		finally:
+			self._lock.release()
+		ret = {}
+		for shape, (count, total, low, high, rows, sample) in items:
+			ret[shape] = {"count": count, "total": total, "min": low, "max": high,
+					"mean": total / count, "p50": self._percentile(sample, 50),
+					"p90": self._percentile(sample, 90), "p99": self._percentile(sample, 99),
+					"rows": rows}
+		return ret
+
+
+	def toCSV(self):
+		"""
+		Return the stats as CSV text, with a header row, and a row for each
+		statement shape, slowest total time first.
+		"""
+		stats = self.getStats()
+		out = StringIO()
+		writer = csv.writer(out)
+		writer.writerow(("statement",) + _columns)
+		for shape in sorted(stats, key=lambda shp: -stats[shp]["total"]):
+			if isinstance(shape, unicode):
+				outShape = shape.encode("utf-8")
+			else:
+				outShape = shape
+			writer.writerow([outShape] + [stats[shape][col] for col in _columns])
+		return out.getvalue()
+
+
+	def reset(self):
+		"""Discard the collected stats."""
+		self._lock.acquire()
+		try:
+			self._stats = {}
+		finally:
+			self._lock.release()
+
+
+	@staticmethod
+	def _percentile(sample, pct):
+		"""Return the value below which 'pct' percent of the sorted sample falls."""
+		if not sample:
+			return None
+		pos = int(round((len(sample) - 1) * pct / 100.0))
+		return sample[pos]
@@ -55,9 +55,9 @@ class Firebird(dBackend):
 		password = str(connectInfo.revealPW())
 		database = ustr(connectInfo.Database)
 
-		self._connection = self.dbapi.connect(host=host, user=user,
+		self._connection = conn = self.dbapi.connect(host=host, user=user,
 				password=password, database=database, **kwargs)
-		return self._connection
+		return conn
 
 
 	def getDictCursorClass(self):
@@ -216,8 +216,9 @@ class Firebird(dBackend):
 	def beginTransaction(self, cursor):
 		"""Begin a SQL transaction."""
 		ret = False
-		if not self._connection._has_transaction():
-			self._connection.begin()
+		conn = self._getCursorConnection(cursor)
+		if not conn._has_transaction():
+			conn.begin()
 			dabo.dbActivityLog.info("SQL: begin")
 			ret = True
 		return ret
@@ -228,7 +229,7 @@ class Firebird(dBackend):
 		Firebird requires an explicit commit in order to have changes
 		to the database written to disk.
 		"""
-		self._connection.commit()
+		self._getCursorConnection(cursor).commit()
 		dabo.dbActivityLog.info("SQL: commit")
 
 
@@ -237,6 +238,14 @@ class Firebird(dBackend):
 		return "first"
 
 
+	def getLimitPosition(self):
+		return "top"
+
+
+	def getLimitOffset(self, limit, offset):
+		return "%s skip %s" % (limit, offset)
+
+
 	def formSQL(self, fieldClause, fromClause, joinClause,
 				whereClause, groupByClause, orderByClause, limitClause):
 		"""Firebird wants the limit clause before the field clause."""
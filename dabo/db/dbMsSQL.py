@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import datetime
 from dabo.dLocalize import _
+import dabo.dException as dException
 from dBackend import dBackend
 from dabo.lib.utils import ustr
 
@@ -39,9 +40,9 @@ class MSSQL(dBackend):
 		if "charset" not in kwargs and self.dbapi.__version__ >= "2.0.0":
 			kwargs["charset"] = self.Encoding
 
-		self._connection = self.dbapi.connect(host=host, user=user, password=password,
-				database=database, **kwargs)
-		return self._connection
+		self._connection = conn = self.dbapi.connect(host=host, user=user,
+				password=password, database=database, **kwargs)
+		return conn
 
 
 	def getDictCursorClass(self):
@@ -261,6 +262,15 @@ select kc.COLUMN_NAME from INFORMATION_SCHEMA.KEY_COLUMN_USAGE as kc
 		return "TOP"
 
 
+	def getLimitPosition(self):
+		return "top"
+
+
+	def getLimitOffset(self, limit, offset):
+		raise dException.FeatureNotSupportedException(
+				_("TOP clauses can't skip rows"))
+
+
 	def formSQL(self, fieldClause, fromClause, joinClause,
 				whereClause, groupByClause, orderByClause, limitClause):
 		"""MS SQL wants the limit clause before the field clause."""
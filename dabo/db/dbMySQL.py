@@ -72,7 +72,7 @@ class MySQL(dBackend):
 			charset = charset.lower().replace("-", "")
 
 		try:
-			self._connection = dbapi.connect(host=connectInfo.Host,
+			conn = dbapi.connect(host=connectInfo.Host,
 					user = connectInfo.User, passwd = connectInfo.revealPW(),
 					db=connectInfo.Database, port=port, charset=charset, **kwargs)
 		except Exception, e:
@@ -84,7 +84,8 @@ class MySQL(dBackend):
 				raise dException.DBNoAccessException(errMsg)
 			else:
 				raise dException.DatabaseException(errMsg)
-		return self._connection
+		self._connection = conn
+		return conn
 
 
 	def getDictCursorClass(self):
@@ -7,11 +7,14 @@
 
 import datetime
 from dabo.dLocalize import _
+import dabo.dException as dException
 from dBackend import dBackend
 from dabo.lib.utils import ustr
 
 
 class Oracle(dBackend):
+	nullsSortFirst = False
+
 	def __init__(self):
 		import cx_Oracle as dbapi
 		dBackend.__init__(self)
@@ -28,10 +31,10 @@ class Oracle(dBackend):
 			port = 1521
 
 		dsn = dbapi.makedsn(connectInfo.Host, port, connectInfo.Database)
-		self._connection = dbapi.connect(user = connectInfo.User,
+		self._connection = conn = dbapi.connect(user = connectInfo.User,
 				password = connectInfo.revealPW(),
 				dsn = dsn)
-		return self._connection
+		return conn
 
 
 	def getDictCursorClass(self):
@@ -132,6 +135,11 @@ class Oracle(dBackend):
 		return "rownum <="
 
 
+	def getLimitOffset(self, limit, offset):
+		raise dException.FeatureNotSupportedException(
+				_("rownum limits can't skip rows"))
+
+
 	def formSQL(self, fieldClause, fromClause, joinClause,
 				whereClause, groupByClause, orderByClause, limitClause):
 		""" Oracle wants the limit clause as where clause. """
@@ -151,8 +159,9 @@ class Oracle(dBackend):
 		""" Begin a SQL transaction."""
 		ret = False
 		# used for testing
-		if not self._connection._has_transaction():
-			self._connection.begin()
+		conn = self._getCursorConnection(cursor)
+		if not conn._has_transaction():
+			conn.begin()
 			dabo.dbActivityLog.info("SQL: begin")
 			ret = True
 		return ret
@@ -11,6 +11,7 @@ from dabo.lib.utils import ustr
 
 class Postgres(dBackend):
 	"""Class providing PostgreSQL connectivity. Uses psycopg."""
+	nullsSortFirst = False
 
 
 	_encodings = {
@@ -71,14 +72,19 @@ class Postgres(dBackend):
 		DSN = "host=%s port=%d dbname=%s user=%s password=%s" % (
 			connectInfo.Host, connectInfo.Port or 5432, connectInfo.Database,
 				self.conn_user, connectInfo.revealPW())
-		self._connection = dbapi.connect(DSN)
-		self.setClientEncoding()
-		return self._connection
+		conn = dbapi.connect(DSN)
+		# Set up the new connection itself; with pooling, another thread may
+		# be opening a connection at the same time.
+		self.setClientEncoding(conn=conn)
+		self._connection = conn
+		return conn
 
 
-	def setClientEncoding(self, encoding=None):
+	def setClientEncoding(self, encoding=None, conn=None):
 		if not encoding:
 			encoding = self.Encoding
+		if conn is None:
+			conn = self._connection
 		try:
 			encoding = codecs.lookup(encoding).name
 		except (AttributeError, LookupError):
@@ -87,9 +93,9 @@ class Postgres(dBackend):
 			encoding = self._encodings[encoding]
 		except KeyError:
 			dabo.dbActivityLog.info("unknown encoding %r" % encoding)
-		if self._connection.encoding != encoding:
+		if conn.encoding != encoding:
 			try:
-				self._connection.set_client_encoding(encoding)
+				conn.set_client_encoding(encoding)
 			except Exception:
 				dabo.dbActivityLog.info("cannot set database client encoding")
 		return encoding
@@ -100,6 +106,12 @@ class Postgres(dBackend):
 		return True
 
 
+	def inTransaction(self, cursor):
+		from psycopg2 import extensions
+		status = self._getCursorConnection(cursor).get_transaction_status()
+		return status != extensions.TRANSACTION_STATUS_IDLE
+
+
 	def getDictCursorClass(self):
 		# the new psycopg 2.0 supports DictCursor
 		import psycopg2.extras as cursors
@@ -270,7 +282,8 @@ class Postgres(dBackend):
 		sql.append("AND NOT a.attisdropped AND a.attnum > 0"
 				" AND pg_get_expr(d.adbin, d.adrelid) LIKE 'nextval%'")
 
-		tempCursor = self._connection.cursor()
+		# currval() is per session, so ask on the cursor's connection.
+		tempCursor = self._getCursorConnection(cursor).cursor()
 		try:
 			tempCursor.execute(' '.join(sql))
 			rs = tempCursor.fetchone()
@@ -67,23 +67,33 @@ class SQLite(dBackend):
 			pth = pth.decode(dabo.fileSystemEncoding).encode("utf-8")
 
 		# Need to specify "isolation_level=None" to have transactions working correctly.
-		self._connection = self.dbapi.connect(pth, factory=DictConnection, isolation_level=None)
+		# Pooled connections are passed from thread to thread, one at a time.
+		# Set up the new connection itself; with pooling, another thread may
+		# be opening a connection at the same time.
+		conn = self.dbapi.connect(pth, factory=DictConnection, isolation_level=None,
+				check_same_thread=not connectInfo.MaxPoolSize)
 
 		# Non-utf8-encoded bytestrings could be in the database, and Dabo will try various encodings
 		# to deal with it. So tell sqlite not to decode with utf-8, but to just return the bytes:
-		self._connection.text_factory = str
+		conn.text_factory = str
 
-		self._connection.connectInfo = connectInfo
+		conn.connectInfo = connectInfo
 		if not hasattr(self, "_encoding"):
-			self._encoding = self._connection.execute("PRAGMA encoding"). \
+			self._encoding = conn.execute("PRAGMA encoding"). \
 					fetchone()["encoding"].lower()
-		return self._connection
+		self._connection = conn
+		return conn
 
 
 	def getDictCursorClass(self):
 		return self._dictCursorClass
 
 
+	def sharesDatabase(self, connectInfo):
+		# Each connection to ':memory:' gets a database of its own.
+		return connectInfo.Database != ":memory:"
+
+
 	def formatForQuery(self, val, fieldType=None):
 		if isinstance(val, bool):
 			return ustr(int(val))
@@ -104,6 +114,7 @@ class SQLite(dBackend):
 		'begin' all the time, simply do nothing.
 		"""
 		cursor.execute("BEGIN")
+		self._getCursorConnection(cursor).transactionOpen = True
 		dabo.dbActivityLog.info("SQL: begin")
 		return True
 
@@ -111,6 +122,7 @@ class SQLite(dBackend):
 	def commitTransaction(self, cursor):
 		"""Commit a SQL transaction."""
 		opError = self.dbapi.OperationalError
+		self._getCursorConnection(cursor).transactionOpen = False
 		try:
 			cursor.execute("COMMIT", errorClass=opError)
 			dabo.dbActivityLog.info("SQL: commit")
@@ -129,14 +141,25 @@ class SQLite(dBackend):
 
 	def rollbackTransaction(self, cursor):
 		"""Rollback a SQL transaction."""
+		self._getCursorConnection(cursor).transactionOpen = False
 		cursor.execute("ROLLBACK")
 		dabo.dbActivityLog.info("SQL: rollback")
 		return True
 
 
+	def inTransaction(self, cursor):
+		"""
+		Connections run in autocommit mode, so there is only a transaction
+		after beginTransaction().
+		"""
+		return getattr(self._getCursorConnection(cursor), "transactionOpen", False)
+
+
 	def flush(self, crs):
 		dabo.dbActivityLog.info("SQL: flush")
-		self._connection.commit()
+		conn = self._getCursorConnection(crs)
+		conn.transactionOpen = False
+		conn.commit()
 
 
 	def formatBLOB(self, val):
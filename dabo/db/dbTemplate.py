@@ -48,11 +48,11 @@ class NEWDATABASE(dBackend):
 			port = -1
 
 		#### TODO: Customize to make correct connect string
-		self._connection = dbapi.connect(host=connectInfo.Host,
+		self._connection = conn = dbapi.connect(host=connectInfo.Host,
 				user=connectInfo.User, passwd=connectInfo.revealPW(),
 				db=connectInfo.Database, port=port, **kwargs)
 
-		return self._connection
+		return conn
 
 
 	def getDictCursorClass(self):
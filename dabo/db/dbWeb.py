@@ -18,8 +18,8 @@ class Web(SQLite):
 
 	def getConnection(self, connectInfo, **kwargs):
 		connectInfo.Database = ":memory:"
-		self._connection = super(Web, self).getConnection(connectInfo, **kwargs)
-		return self._connection
+		self._connection = conn = super(Web, self).getConnection(connectInfo, **kwargs)
+		return conn
 
 
 	def getTables(self, cursor, includeSystemTables=False):
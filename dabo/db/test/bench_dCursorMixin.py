@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Timings for dCursorMixin operations on large in-memory SQLite data sets.
+
+This isn't a unit test, and isn't picked up by tools/run_all_tests.py.
+Run it directly:
+
+	python dabo/db/test/bench_dCursorMixin.py
+"""
+import random
+import sys
+import time
+import dabo.db
+
+
+ROW_COUNTS = (10000, 100000)
+
+
+def makeCursor(rowCount, compact=False):
+	con = dabo.db.dConnection(DbType="SQLite", Database=":memory:")
+	cur = con.getDaboCursor()
+	cur.executescript("""
+create table benchtable (
+    pk INTEGER PRIMARY KEY AUTOINCREMENT,
+    cfield CHAR,
+    ifield INT,
+    nfield DECIMAL (8,2),
+    mfield TEXT,
+    bfield INT,
+    gfield INT,
+    ffield FLOAT
+);
+""")
+	cur.executemany("insert into benchtable (cfield, ifield, nfield, mfield, bfield, gfield, ffield) "
+			"values (?, ?, ?, ?, ?, ?, ?)",
+			[("Name %s" % i, i, i / 100.0, "Memo", i % 2, i * 2, i / 3.0) for i in xrange(rowCount)])
+	cur.UserSQL = "select * from benchtable"
+	cur.KeyField = "pk"
+	cur.Table = "benchtable"
+	cur.CompactRecords = compact
+	cur.requery()
+	return cur
+
+
+def timeit(func, *args, **kwargs):
+	start = time.time()
+	func(*args, **kwargs)
+	return time.time() - start
+
+
+def bench_moveToPK(cur, lookups=1000):
+	pks = [random.randint(1, cur.RowCount) for i in xrange(lookups)]
+	def run():
+		for pk in pks:
+			cur.moveToPK(pk)
+	# The first lookup after a requery builds the index.
+	first = timeit(cur.moveToPK, 1)
+	return first, timeit(run)
+
+
+def bench_seek(cur, seeks=100):
+	"""seek() for random values, with a value changed between some of them."""
+	vals = ["Name %s" % random.randint(0, cur.RowCount) for i in xrange(seeks)]
+	def run():
+		for num, val in enumerate(vals):
+			cur.seek(val, "cfield", near=True)
+			if not num % 10:
+				cur.setFieldVal("cfield", val, row=num)
+	return timeit(run)
+
+
+def bench_sort(cur):
+	"""Sort as grid header clicks do: ascending, descending, then back to unsorted."""
+	def run():
+		cur.sort("cfield", "ASC")
+		cur.sort("cfield", "DESC")
+		cur.sort("cfield", "CYCLE")
+	multi = lambda: cur.sort([("bfield", "ASC"), ("cfield", "DESC", False)])
+	return timeit(run), timeit(multi)
+
+
+def bench_setFieldVal(cur, calls=1000000):
+	"""setFieldVal() on an int and on a text field, spread over the rows."""
+	rowCount = cur.RowCount
+	def run(fld, vals):
+		setFieldVal = cur.setFieldVal
+		for num in xrange(calls):
+			setFieldVal(fld, vals[num % 2], num % rowCount)
+	ret = (timeit(run, "ifield", (-1, -2)), timeit(run, "cfield", ("one", "two")))
+	cur.cancel(allRows=True)
+	return ret
+
+
+def bench_getChangedRows(cur, changes=500):
+	for row in random.sample(xrange(cur.RowCount), changes):
+		cur.setFieldVal("cfield", "changed", row=row)
+	return timeit(cur.getChangedRows)
+
+
+def bench_requeryAndRead(cur):
+	"""Requery, then read every field of every row, as a grid or report would."""
+	flds = [fld[0] for fld in cur.FieldDescription]
+	def run():
+		cur.requery()
+		getFieldVal = cur.getFieldVal
+		for row in xrange(cur.RowCount):
+			for fld in flds:
+				getFieldVal(fld, row)
+	return timeit(run)
+
+
+def bench_dataSetQueries(cur, queries=10):
+	"""Run repeated queries against the cursor's data set."""
+	ds = cur.getDataSet()
+	def run():
+		for i in xrange(queries):
+			ds.execute("select * from dataset where ifield < %s" % (i * 100))
+	# The first query populates the SQLite table.
+	first = timeit(ds.execute, "select * from dataset where 1 = 0")
+	return first, timeit(run)
+
+
+def bench_dataSetEngines(cur):
+	"""
+	Compare the native dDataSet query engine with SQLite, both when the SQLite
+	table has to be loaded because the data changed, and when it is already loaded.
+	"""
+	ds = cur.getDataSet()
+	queries = ("select * from dataset where ifield < 5000",
+			"select cfield, ifield from dataset order by ifield desc limit 100",
+			"select bfield, count(*), sum(ifield), max(cfield) from dataset group by bfield")
+	def runSQLite(sql):
+		ds._markChanged()
+		ds._executeSQLite(sql)
+	ret = []
+	for sql in queries:
+		native = timeit(ds.execute, sql)
+		changed = timeit(runSQLite, sql)
+		ret.append((sql, native, changed, timeit(ds._executeSQLite, sql)))
+	return ret
+
+
+def bench_appendAndRemove(cur, count=5000):
+	"""Append rows with appendDataSet(), then remove them from the middle of the data set."""
+	recs = [{"cfield": "new %s" % i, "ifield": i} for i in xrange(count)]
+	def remove():
+		middle = cur.RowCount // 2
+		for i in xrange(count):
+			cur._removeRow(middle)
+	return timeit(cur.appendDataSet, recs), timeit(remove)
+
+
+def recordMemory(cur):
+	"""
+	Bytes used by the record containers. Field values are the same objects
+	in both layouts, so they are not counted.
+	"""
+	total = 0
+	for rec in cur._records:
+		total += sys.getsizeof(rec)
+		if isinstance(rec, dabo.db.dCompactRecord):
+			total += sys.getsizeof(rec._values)
+			if rec._extra is not None:
+				total += sys.getsizeof(rec._extra)
+	return total
+
+
+def bench_memory(rowCount):
+	for compact in (False, True):
+		cur = makeCursor(rowCount, compact=compact)
+		# Touch every row, as a cursor in use would.
+		for row in xrange(cur.RowCount):
+			cur.getFieldVal("cfield", row)
+		layout = ("dict", "compact")[compact]
+		print "%7d rows: %-7s records use %.1f MB" % (rowCount, layout,
+				recordMemory(cur) / 1048576.0)
+
+
+def main():
+	for rowCount in ROW_COUNTS:
+		bench_memory(rowCount)
+		cur = makeCursor(rowCount)
+		first, lookups = bench_moveToPK(cur)
+		print "%7d rows: moveToPK first call %.4fs, 1000 lookups %.4fs" % (
+				rowCount, first, lookups)
+		print "%7d rows: 100 seeks %.4fs" % (rowCount, bench_seek(cur))
+		header, multi = bench_sort(cur)
+		print "%7d rows: sort ASC, DESC and unsorted %.4fs, sort on 2 columns %.4fs" % (
+				rowCount, header, multi)
+		print "%7d rows: requery and read all fields %.4fs" % (
+				rowCount, bench_requeryAndRead(cur))
+		first, queries = bench_dataSetQueries(cur)
+		print "%7d rows: dDataSet first query %.4fs, 10 more queries %.4fs" % (
+				rowCount, first, queries)
+		for sql, native, changed, loaded in bench_dataSetEngines(cur):
+			print "%7d rows: native %.4fs, SQLite %.4fs (%.4fs when loaded): %s" % (
+					rowCount, native, changed, loaded, sql)
+		append, remove = bench_appendAndRemove(cur)
+		print "%7d rows: appendDataSet of 5000 rows %.4fs, removing them %.4fs" % (
+				rowCount, append, remove)
+		intField, textField = bench_setFieldVal(cur)
+		print "%7d rows: 1M setFieldVal calls on an int field %.4fs, on a text field %.4fs" % (
+				rowCount, intField, textField)
+		print "%7d rows: getChangedRows with 500 changed rows %.4fs" % (
+				rowCount, bench_getChangedRows(cur))
+
+
+if __name__ == "__main__":
+	main()
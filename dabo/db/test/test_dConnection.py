@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
+import os
+import tempfile
+import threading
 import unittest
 import dabo.db
+import dabo.dException as dException
 
 
 class Test_dConnectInfo(unittest.TestCase):
@@ -25,6 +29,209 @@ class Test_dConnectInfo(unittest.TestCase):
 			co = dabo.db.dConnection(DbType="SQLite", Db=":memory:")
 		self.assertRaises(Exception, anotherBogusParm)
 
+
+class Test_pooledConnection(unittest.TestCase):
+	def setUp(self):
+		fd, self.dbFile = tempfile.mkstemp(suffix=".db")
+		os.close(fd)
+		self.ci = dabo.db.dConnectInfo(connInfo={"DbType": "SQLite",
+				"Database": self.dbFile, "maxpoolsize": "2", "PoolTimeout": "0.1"})
+		self.conn = dabo.db.dConnection(self.ci)
+
+	def tearDown(self):
+		self.conn.close()
+		os.remove(self.dbFile)
+
+	def inThread(self, func):
+		ret = []
+		thd = threading.Thread(target=lambda: ret.append(func()))
+		thd.start()
+		thd.join()
+		return ret[0]
+
+	def test_settings(self):
+		self.assertEqual(self.ci.MaxPoolSize, 2)
+		self.assertEqual(self.ci.MinPoolSize, 0)
+		self.assertEqual(self.ci.PoolTimeout, 0.1)
+		self.assertEqual(dabo.db.dConnectInfo(DbType="SQLite").MaxPoolSize, None)
+
+	def test_threadAffinity(self):
+		conn = self.conn
+		pool = conn.Pool
+		cxn = conn.getConnection()
+		self.assertTrue(conn.getConnection() is cxn)
+		# Another thread gets a connection of its own, and cursors use it.
+		def work():
+			crs = conn.getDaboCursor()
+			crs.execute("create table test (id int)")
+			crs.execute("insert into test values (1)")
+			ret = crs.connection
+			conn.releaseConnection()
+			return ret
+		other = self.inThread(work)
+		self.assertFalse(other is cxn)
+		# The new connection is set up, and the backend keeps the first one.
+		self.assertTrue(other.text_factory is str)
+		self.assertTrue(conn.getBackendObject()._connection is cxn)
+		self.assertEqual((pool.Size, pool.IdleCount), (2, 1))
+		crs = conn.getDaboCursor()
+		self.assertTrue(crs.connection is cxn)
+		crs.execute("select * from test")
+		self.assertEqual(crs.getDataSet(), ({"id": 1},))
+		# The next thread reuses the connection that was checked in.
+		self.assertTrue(self.inThread(conn.getConnection) is other)
+
+	def test_exhausted(self):
+		conn = self.conn
+		pool = conn.Pool
+		conn.getConnection()
+		held = threading.Event()
+		done = threading.Event()
+		def hold():
+			conn.getConnection()
+			held.set()
+			done.wait()
+			conn.releaseConnection()
+		thd = threading.Thread(target=hold)
+		thd.start()
+		held.wait()
+		def checkout():
+			try:
+				return pool.checkout()
+			except dException.ConnectionPoolExhaustedException:
+				return None
+		self.assertEqual(self.inThread(checkout), None)
+		# Without blocking, there is no wait for a connection.
+		self.assertEqual(self.inThread(lambda: pool.checkout(block=False)), None)
+		done.set()
+		thd.join()
+		self.assertFalse(self.inThread(checkout) is None)
+
+	def test_nestedCheckout(self):
+		pool = self.conn.Pool
+		cxn = pool.checkout()
+		self.assertTrue(pool.checkout() is cxn)
+		self.assertFalse(pool.checkin())
+		self.assertTrue(pool.checkin())
+		self.assertFalse(pool.checkin())
+		self.assertEqual(pool.IdleCount, 1)
+
+	def test_memoryDatabase(self):
+		# Each connection to an in-memory database would get a new database.
+		self.assertRaises(dException.DatabaseException, dabo.db.dConnection,
+				DbType="SQLite", Database=":memory:", MaxPoolSize=2)
+
+	def test_healthCheck(self):
+		pool = self.conn.Pool
+		cxn = pool.checkout()
+		pool.checkin()
+		cxn.close()
+		# Idle connections are only checked after CheckInterval seconds.
+		pool.CheckInterval = 0
+		newCxn = pool.checkout()
+		self.assertFalse(newCxn is cxn)
+		self.assertEqual(pool.Size, 1)
+		newCxn.execute("select 1")
+
+class Test_queryCache(unittest.TestCase):
+	def setUp(self):
+		self.conn = dabo.db.dConnection(DbType="SQLite", Database=":memory:", QueryCacheSize=2)
+		self.cache = self.conn.QueryCache
+		crs = self.crs = self.conn.getDaboCursor()
+		crs.execute("create table code (pk INTEGER PRIMARY KEY, name CHAR)")
+		crs.execute("insert into code (name) values ('one')")
+		crs.execute("insert into code (name) values ('two')")
+		crs.commitTransaction()
+		crs.UseQueryCache = True
+		self.cache.resetStats()
+
+	def tearDown(self):
+		self.conn.close()
+
+	def names(self, sql="select * from code order by pk"):
+		self.crs.execute(sql)
+		return [rec["name"] for rec in self.crs._records]
+
+	def test_hits(self):
+		cache = self.cache
+		self.assertEqual(self.names(), ["one", "two"])
+		self.crs._records[0]["name"] = "changed"
+		# The cached records are copies.
+		self.assertEqual(self.names(), ["one", "two"])
+		self.assertEqual((cache.Hits, cache.Misses), (1, 1))
+		self.assertEqual(self.crs.FieldDescription[1][0], "name")
+		# Cursors without UseQueryCache don't use it.
+		other = self.conn.getDaboCursor()
+		other.execute("select * from code order by pk")
+		self.assertEqual(cache.getStats()["hits"], 1)
+
+	def test_invalidation(self):
+		cache = self.cache
+		self.names()
+		self.names("select code.name from code join code as c2 on c2.pk = code.pk")
+		other = self.conn.getDaboCursor()
+		other.beginTransaction()
+		other.execute("update code set name = 'uno' where pk = 1")
+		self.assertEqual(cache.Size, 0)
+		self.assertEqual(cache.getStats()["invalidations"], 2)
+		# Until the change is committed, results that may include it aren't cached.
+		self.assertEqual(self.names(), ["uno", "two"])
+		self.assertEqual(cache.Size, 0)
+		other.commitTransaction()
+		self.names()
+		self.assertEqual(self.names(), ["uno", "two"])
+		self.assertEqual(cache.Hits, 1)
+
+	def test_autocommit(self):
+		cache = self.cache
+		# Changes made outside of a transaction are committed at once, so the
+		# results that include them can be cached right away.
+		crs = self.conn.getDaboCursor()
+		crs.execute("create table lookup (name CHAR)")
+		crs.execute("insert into lookup values ('x')")
+		crs.execute("update code set name = 'uno' where pk = 1")
+		for num in range(2):
+			self.assertEqual(self.names("select * from lookup"), ["x"])
+			self.assertEqual(self.names(), ["uno", "two"])
+		self.assertEqual((cache.Hits, cache.Size), (2, 2))
+		self.assertEqual(cache._pendingTables, {})
+		# Changes made in a transaction are pending until it ends.
+		crs.beginTransaction()
+		crs.execute("delete from lookup")
+		self.assertEqual(self.names("select * from lookup"), [])
+		self.assertEqual(cache.Size, 1)
+		crs.commitTransaction()
+		self.assertEqual(cache._pendingTables, {})
+		self.assertEqual(self.names("select * from lookup"), [])
+		self.assertEqual(cache.Size, 2)
+		# Statements that end a transaction end the pending changes, too.
+		cache.statementExecuted("delete from lookup", crs.connection)
+		cache.statementExecuted("rollback to savepoint x", crs.connection, True)
+		self.assertEqual(cache._pendingTables, {crs.connection: set(["lookup"])})
+		cache.statementExecuted("commit", crs.connection, False)
+		self.assertEqual(cache._pendingTables, {})
+
+	def test_limits(self):
+		cache = self.cache
+		for sql in ("select * from code", "select name from code", "select pk from code"):
+			self.crs.execute(sql)
+		self.assertEqual(cache.Size, 2)
+		self.assertEqual(cache.getStats()["evictions"], 1)
+		cache.TTL = 0
+		self.crs.execute("select * from code where pk = ?", (1,))
+		self.crs.execute("select * from code where pk = ?", (1,))
+		self.assertEqual(cache.Hits, 0)
+		self.assertEqual(cache.getStats()["expirations"], 1)
+
+	def test_getTables(self):
+		cache = self.cache
+		self.assertEqual(cache.getTables("select a.x from main.a, c left join \"B\" "
+				"on a.y = B.y where a.z in (select z from d)"), set(["a", "b", "c", "d"]))
+		self.assertEqual(cache.getTables("select * from a for update"), None)
+		self.assertEqual(cache.getTables("select 1"), None)
+
+
 if __name__ == "__main__":
-	suite = unittest.TestLoader().loadTestsFromTestCase(Test_dConnectInfo)
+	testClasses = (Test_dConnectInfo, Test_pooledConnection, Test_queryCache)
+	suite = unittest.TestSuite([unittest.TestLoader().loadTestsFromTestCase(cls) for cls in testClasses])
 	unittest.TextTestRunner(verbosity=2).run(suite)
@@ -210,6 +210,291 @@ insert into %s (cfield, ifield, nfield) values (NULL, NULL, NULL)
 		self.assertEqual(cur.Record.cfield, newVal)
 		self.assertRaises(dabo.dException.FieldNotFoundException, cur.oldVal, "bogusField")
 
+	def test_moveToPK(self):
+		cur = self.cur
+		cur.moveToPK(3)
+		self.assertEqual(cur.RowNumber, 2)
+		self.assertEqual(cur.hasPK(2), True)
+		self.assertEqual(cur.hasPK(99), False)
+		# Unknown PK goes to the first record:
+		cur.moveToPK(99)
+		self.assertEqual(cur.RowNumber, 0)
+
+		# The index must follow sorting and PK changes:
+		cur.sort("cfield")
+		cur.moveToPK(3)
+		self.assertEqual(cur.Record.cfield, "Carl Karsten")
+		self.assertEqual(cur.RowNumber, 0)
+		cur.Record.pk = 33
+		self.assertEqual(cur.hasPK(3), False)
+		cur.moveToPK(1)
+		cur.moveToPK(33)
+		self.assertEqual(cur.RowNumber, 0)
+		self.assertEqual(cur.getChangedRows(), [0])
+
+		# ...as well as new and deleted records:
+		cur.new()
+		cur.genTempAutoPK()
+		cur.setNewFlag()
+		tmpPK = cur.Record.pk
+		cur.first()
+		cur.moveToPK(tmpPK)
+		self.assertEqual(cur.RowNumber, 3)
+		cur.moveToPK(1)
+		cur.delete()
+		self.assertEqual(cur.hasPK(1), False)
+		cur.moveToPK(tmpPK)
+		self.assertEqual(cur.RowNumber, 2)
+
+	def test_moveToPK_compoundKey(self):
+		cur = self.cur
+		cur.KeyField = "pk, ifield"
+		cur.moveToPK((2, 42))
+		self.assertEqual(cur.RowNumber, 1)
+		self.assertEqual(cur.hasPK((3, 10223)), True)
+		self.assertEqual(cur.hasPK((3, 42)), False)
+		cur.Record.ifield = 43
+		self.assertEqual(cur.hasPK((2, 42)), False)
+		cur.first()
+		cur.moveToPK((2, 43))
+		self.assertEqual(cur.RowNumber, 1)
+
+	def test_save_batched(self):
+		cur = self.cur
+		cur.BatchedSave = True
+		cur.setFieldVal("cfield", "one", row=0)
+		cur.setFieldVal("cfield", "three", row=2)
+		cur.setFieldVal("ifield", 99, row=1)
+		cur.setFieldVal("pk", 22, row=1)
+		cur.save(allRows=True)
+		self.assertEqual(cur._mementos, {})
+		self.assertEqual(cur.isChanged(), False)
+		cur.requery()
+		self.assertEqual([(rec["pk"], rec["cfield"], rec["ifield"]) for rec in cur.getDataSet()],
+				[(1, "one", 23), (3, "three", 10223), (22, "Edward Leafe", 99)])
+
+		# A row that is gone from the table isn't hidden by the others.
+		bo = cur.BackendObject
+		def noResultsOnSave():
+			raise dabo.dException.dException("No records updated")
+		bo.noResultsOnSave = noResultsOnSave
+		try:
+			cur.AuxCursor.execute("delete from %s where pk = 3" % self.temp_table_name)
+			cur.setFieldVal("cfield", "uno", row=0)
+			cur.setFieldVal("cfield", "tres", row=1)
+			self.assertRaises(dabo.dException.dException, cur.save, allRows=True)
+			self.assertEqual(sorted(cur._mementos), [1, 3])
+		finally:
+			del bo.noResultsOnSave
+
+	def test_statementCache(self):
+		cur = self.cur
+		bo = cur.BackendObject
+		bo.clearStatementCache()
+		for row in range(3):
+			cur.moveToRowNum(row)
+			cur.setFieldVal("cfield", "changed %s" % row)
+			cur.save()
+		# The update statement is built once, then reused.
+		self.assertEqual((bo.StatementCacheMisses, bo.StatementCacheHits), (1, 2))
+		cur.new()
+		cur.genTempAutoPK()
+		cur.setNewFlag()
+		cur.setFieldVal("cfield", "new")
+		cur.save()
+		self.assertEqual(bo.StatementCacheMisses, 2)
+		cur.moveToRowNum(1)
+		cur.delete()
+		cur.requery()
+		self.assertEqual([rec["cfield"] for rec in cur.getDataSet()],
+				["changed 0", "changed 2", "new"])
+		self.assertEqual(bo.StatementCacheSize, 4)
+		bo.clearStatementCache()
+		self.assertEqual((bo.StatementCacheMisses, bo.StatementCacheHits), (0, 0))
+		self.assertEqual(bo.StatementCacheSize, 0)
+
+		# The least recently used statements are dropped to stay within the limit.
+		bo.StatementCacheMaxSize = 2
+		try:
+			for num, fld in enumerate(("cfield", "ifield", "cfield", "nfield")):
+				cur.setFieldVal(fld, num + 10)
+				cur.save()
+			self.assertEqual(bo.StatementCacheSize, 2)
+			self.assertEqual((bo.StatementCacheMisses, bo.StatementCacheHits), (3, 1))
+			cur.setFieldVal("cfield", "again")
+			cur.save()
+			self.assertEqual(bo.StatementCacheHits, 2)
+			bo.StatementCacheMaxSize = 1
+			self.assertEqual(bo.StatementCacheSize, 1)
+		finally:
+			bo.StatementCacheMaxSize = bo.statementCacheMaxSize
+
+	def test_statementTimings(self):
+		cur = self.cur
+		bo = cur.BackendObject
+		self.assertEqual(bo.StatementTimings, None)
+		bo.CollectStatementTimings = True
+		try:
+			for pk in (1, 2, 3):
+				cur.execute("select * from %s where pk = %s" % (self.temp_table_name, pk))
+			cur.execute("select * from %s where cfield in ('a', 'b')" % self.temp_table_name)
+			cur.execute("select * from %s where cfield in ('c', 'd', 'e')" % self.temp_table_name)
+			stats = bo.StatementTimings.getStats()
+			byPk = stats["select * from %s where pk = ?" % self.temp_table_name]
+			self.assertEqual((byPk["count"], byPk["rows"]), (3, 3))
+			self.assertTrue(byPk["min"] <= byPk["p50"] <= byPk["max"])
+			self.assertEqual(stats["select * from %s where cfield in (?, ...)"
+					% self.temp_table_name]["count"], 2)
+			lines = bo.StatementTimings.toCSV().splitlines()
+			self.assertEqual(lines[0], "statement,count,total,min,max,mean,p50,p90,p99,rows")
+			self.assertEqual(len(lines), 3)
+		finally:
+			bo.CollectStatementTimings = False
+		self.assertEqual(bo.StatementTimings, None)
+
+	def test_CompactRecords(self):
+		cur = self.cur
+		cur.CompactRecords = True
+		cur.requery()
+		self.assertTrue(isinstance(cur._records[0], dabo.db.dCompactRecord))
+		self.assertEqual(cur.Record.cfield, "Paul Keith McNett")
+		self.assertIsInstance(cur.Record.nfield, Decimal)
+		cur.Record.cfield = "Denise McNett"
+		self.assertEqual(cur._mementos, {1: {"cfield": "Paul Keith McNett"}})
+		self.assertEqual(cur.getDataSet(flds=("pk", "cfield"))[0],
+				{"pk": 1, "cfield": "Denise McNett"})
+		cur.sort("cfield")
+		self.assertEqual(cur.getFieldVal("cfield", 0), "Carl Karsten")
+		self.assertEqual(cur.Record.cfield, "Denise McNett")
+		cur.new()
+		cur.genTempAutoPK()
+		cur.setNewFlag()
+		self.assertTrue(isinstance(cur._records[-1], dabo.db.dCompactRecord))
+		self.assertEqual(cur.IsAdding, True)
+		cur.Record.cfield = "Alison Anton"
+		cur.save(allRows=True)
+		self.assertEqual(cur.IsAdding, False)
+		self.assertEqual(cur.isChanged(), False)
+		cur.requery()
+		self.assertEqual(cur.RowCount, 4)
+		self.assertEqual(sorted([rec["cfield"] for rec in cur.getDataSet()]),
+				["Alison Anton", "Carl Karsten", "Denise McNett", "Edward Leafe"])
+
+	def test_FetchWindow(self):
+		cur = self.cur
+		cur.FetchWindow = 2
+		cur.requery()
+		# Only the first window has been fetched:
+		self.assertEqual(len(cur._recordStore), 2)
+		self.assertEqual(cur.Record.cfield, "Paul Keith McNett")
+		cur.next()
+		self.assertEqual(len(cur._recordStore), 2)
+		cur.next()
+		self.assertEqual(cur.Record.cfield, "Carl Karsten")
+		self.assertRaises(dabo.dException.EndOfFileException, cur.next)
+		self.assertEqual(cur._streamPending, False)
+		self.assertEqual(cur.RowCount, 3)
+
+		# RowCount fetches the pending rows:
+		cur.first()
+		cur.requery()
+		self.assertEqual(len(cur._recordStore), 2)
+		self.assertEqual(cur.RowCount, 3)
+		self.assertEqual(cur.getFieldVal("cfield", 2), "Carl Karsten")
+		# So does looking for a PK that hasn't been fetched:
+		cur.first()
+		cur.requery()
+		self.assertEqual(len(cur._recordStore), 2)
+		cur.moveToPK(3)
+		self.assertEqual(cur.RowNumber, 2)
+		self.assertEqual(cur._streamPending, False)
+
+	def test_recordList(self):
+		cur = self.cur
+		records = cur._records
+		self.assertTrue(isinstance(records, dabo.db.dRecordList))
+		cur.moveToPK(3)
+		# Adding and removing records changes the list in place, and keeps the PK index.
+		cur.new()
+		cur.genTempAutoPK()
+		cur.setNewFlag()
+		self.assertTrue(cur._records is records)
+		self.assertTrue(cur._pkIndexSource is records)
+		self.assertEqual(cur.RowCount, 4)
+		cur.cancel()
+		self.assertTrue(cur._records is records)
+		self.assertEqual(cur.RowCount, 3)
+		self.assertEqual(cur.RowNumber, 2)
+		cur._removeRow(0)
+		self.assertEqual([rec["pk"] for rec in cur._records], [2, 3])
+		cur.moveToPK(3)
+		self.assertEqual(cur.RowNumber, 1)
+		# The dDataSet API is still available, and filters can be removed.
+		cur.filter("ifield", 100, "<")
+		self.assertEqual([rec["pk"] for rec in cur._records], [2])
+		cur.new()
+		self.assertEqual(cur.RowCount, 2)
+		cur.removeFilter()
+		self.assertEqual([rec["pk"] for rec in cur._records], [2, 3])
+
+	def test_seekIndex(self):
+		cur = self.cur
+		self.assertEqual(cur.seek("Edward Leafe", "cfield"), 1)
+		self.assertEqual(cur.seek("edward leafe", "cfield"), -1)
+		self.assertEqual(cur.seek("edward leafe", "cfield", caseSensitive=False), 1)
+		self.assertEqual(cur.seek("D", "cfield", near=True), 1)
+		self.assertEqual(cur.seek("e", "cfield", caseSensitive=False, near=True,
+				incremental=True), 1)
+		self.assertEqual(cur.seek(100, "ifield", near=True), 2)
+		self.assertEqual(cur.seek(99999, "ifield", near=True), 2)
+		self.assertEqual(cur.locate((42, "Edward Leafe"), ("ifield", "cfield")), True)
+		# The index is built once, and kept current as values change.
+		index = cur._getSeekIndex(["cfield"], False)
+		cur.setFieldVal("cfield", "Zed", row=0)
+		self.assertEqual(cur.seek("Zed", "cfield"), 0)
+		self.assertEqual(cur.seek("Paul Keith McNett", "cfield"), -1)
+		cur.new()
+		cur.setFieldVal("cfield", "Abe")
+		self.assertEqual(cur.seek("Abe", "cfield"), 3)
+		self.assertTrue(cur._getSeekIndex(["cfield"], False) is index)
+		cur._removeRow(3)
+		self.assertEqual(cur.seek("Abe", "cfield"), -1)
+		# Replacing the records discards it.
+		cur.requery()
+		self.assertFalse(cur._getSeekIndex(["cfield"], False) is index)
+		self.assertEqual(cur.seek("Paul Keith McNett", "cfield"), 0)
+
+	def test_sortMultiple(self):
+		cur = self.cur
+		for row, (cfield, ifield) in enumerate((("b", 1), ("a", 1), ("C", 2))):
+			cur.setFieldVal("cfield", cfield, row=row)
+			cur.setFieldVal("ifield", ifield, row=row)
+		pks = lambda: [rec["pk"] for rec in cur._records]
+		cur.RowNumber = 1
+		cur.sort([("ifield", "ASC"), ("cfield", "DESC")])
+		self.assertEqual(pks(), [1, 2, 3])
+		self.assertEqual(cur.sortColumn, ("ifield", "cfield"))
+		self.assertEqual(cur.sortOrder, ("ASC", "DESC"))
+		cur.sort([("ifield", "DESC"), "cfield"])
+		self.assertEqual(pks(), [3, 2, 1])
+		# The current record is kept:
+		self.assertEqual(cur.Record.pk, 2)
+		cur.sort(["cfield"], caseSensitive=False)
+		self.assertEqual(pks(), [2, 1, 3])
+		cur.sort(["cfield"])
+		self.assertEqual(pks(), [3, 2, 1])
+		self.assertRaises(dabo.dException.dException, cur.sort, [("cfield", "UP")])
+		# Cycling from DESC restores the original order:
+		cur.sort([("ifield", "DESC"), "cfield"])
+		cur.sort(None, "cycle")
+		self.assertEqual(cur.sortOrder, "")
+		self.assertEqual(pks(), [1, 2, 3])
+		# The sort is applied again after a requery:
+		cur.sort([("ifield", "DESC"), ("cfield", "ASC", False)])
+		cur.save(allRows=True)
+		cur.requery()
+		self.assertEqual(pks(), [3, 2, 1])
+
 	## - End method unit tests -
 
 	def testMementos(self):
@@ -304,6 +589,97 @@ insert into %s (cfield, ifield, nfield) values (NULL, NULL, NULL)
 		self.assertEqual(dabo.convertFloatToDecimal, False)
 		self.assertIsInstance(rec.ffield, float)
 
+	def test_converterPlan(self):
+		"""
+		Field types are corrected once, when the rows are fetched, using a plan
+		that is only rebuilt when the structure changes.
+		"""
+		cur = self.cur
+		plan = cur._converterPlan
+		self.assertNotEqual(plan, None)
+		for rec in cur._records:
+			self.assertIsInstance(rec["nfield"], Decimal)
+			self.assertIsInstance(rec["ffield"], Decimal)
+			self.assertEqual([k for k in rec if k.startswith("dabo-")], [])
+		self.assertEqual(str(cur._records[0]["nfield"]), "23.23")
+		cur.requery()
+		self.assertTrue(cur._converterPlan is plan)
+
+	def test_fieldDescriptors(self):
+		"""The field details cached by setFieldVal() follow the changes to the cursor."""
+		cur = self.cur
+		cur.setFieldVal("ifield", True)
+		self.assertEqual(cur.Record.ifield, 1)
+		self.assertEqual(cur._fieldDescriptors[3]["ifield"], (int, False, True, False))
+		self.assertTrue(cur.isChanged(allRows=False))
+		cur.setFieldVals({"ifield": 23, "cfield": 7})
+		self.assertEqual(cur.Record.cfield, u"7")
+		self.assertEqual(cur._mementos[cur.Record.pk], {"cfield": u"Paul Keith McNett"})
+		cur.cancel()
+
+		# Non-update fields don't get mementos.
+		cur.setNonUpdateFields(["cfield"])
+		self.assertEqual(cur._fieldDescriptors, None)
+		cur.setFieldVal("cfield", "Somebody Else")
+		self.assertFalse(cur.isChanged(allRows=False))
+		cur.setNonUpdateFields()
+		cur.setFieldVal("cfield", "Somebody Else Again")
+		self.assertTrue(cur.isChanged(allRows=False))
+		cur.cancel()
+
+		# Without a valid KeyField, no mementos are saved.
+		cur.KeyField = "missing"
+		self.assertEqual(cur._fieldDescriptors, None)
+		cur.setFieldVal("ifield", 99)
+		self.assertFalse(cur.isChanged(allRows=False))
+		cur.KeyField = "pk"
+		cur.requery()
+		cur.setFieldVal("ifield", 99)
+		self.assertTrue(cur.isChanged(allRows=False))
+		cur.cancel()
+
+		# Changing the types in place requires resetting the cache.
+		cur.setFieldVal("ifield", 98)
+		cur._types["ifield"] = unicode
+		cur._fieldDescriptors = None
+		cur.setFieldVal("ifield", 97)
+		self.assertEqual(cur.Record.ifield, u"97")
+
+	def test_schemaCache(self):
+		"""Schema information is cached per connection until cleared or expired."""
+		cur = self.cur
+		bo = cur.BackendObject
+		calls = []
+		getFields = bo.getFields
+		def countingGetFields(*args, **kwargs):
+			calls.append(args[0])
+			return getFields(*args, **kwargs)
+		bo.getFields = countingGetFields
+		bo.clearSchemaCache()
+		flds = cur.getFields()
+		self.assertEqual(len(calls), 1)
+		# Another cursor on the same connection shares the cache:
+		cur2 = cur._getAuxCursor()
+		self.assertEqual(cur2.getFields(self.temp_table_name), flds)
+		self.assertEqual(len(calls), 1)
+		bo.clearSchemaCache(self.temp_table_name)
+		cur.getFields()
+		self.assertEqual(len(calls), 2)
+		# DDL run through a cursor clears it:
+		cur.execute("create table %s_2 (pk INTEGER PRIMARY KEY)" % self.temp_table_name)
+		cur.getFields()
+		self.assertEqual(len(calls), 3)
+		# An expired entry is fetched again:
+		bo.SchemaCacheTTL = 60
+		for key, (stamp, info) in bo._schemaCache.items():
+			bo._schemaCache[key] = (stamp - 120, info)
+		cur.getFields()
+		self.assertEqual(len(calls), 4)
+		bo.SchemaCacheTTL = 0
+		cur.getFields()
+		cur.getFields()
+		self.assertEqual(len(calls), 6)
+
 	def test_convert_float_to_decimal(self):
 		"""
 		Make sure precision is kept.
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import unittest
+from decimal import Decimal
+import dabo.db
+from dabo.db import dDataSet
+
+
+
+class Test_dDataSet(unittest.TestCase):
+	def setUp(self):
+		self.ds = dDataSet(({"name": "Paul", "age": 40},
+				{"name": "Ed", "age": 50},
+				{"name": "Carl", "age": 30}))
+
+	def tearDown(self):
+		self.ds = None
+
+	def names(self, ds):
+		return [rec["name"] for rec in ds]
+
+	def test_execute(self):
+		ds = self.ds
+		self.assertEqual(self.names(ds.execute("select * from dataset order by age")),
+				["Carl", "Paul", "Ed"])
+		self.assertEqual(self.names(ds.sort("name")), ["Carl", "Ed", "Paul"])
+
+	def test_populateOnlyWhenChanged(self):
+		# Queries that the native engine can't run use SQLite.
+		ds = self.ds
+		ds._executeSQLite("select * from dataset")
+		# Repeated queries reuse the populated table:
+		version = ds._tableVersions["dataset"]
+		ds._executeSQLite("select * from dataset where age > 35")
+		self.assertTrue(ds._tableVersions["dataset"] is version)
+		# Changes made through replace() are picked up:
+		ds.replace("age", 10, scope="name == 'Ed'")
+		self.assertEqual(self.names(ds._executeSQLite("select * from dataset order by age")),
+				["Ed", "Carl", "Paul"])
+		# So are direct changes, once they are marked:
+		ds[0]["age"] = 5
+		ds._markChanged()
+		self.assertEqual(self.names(ds._executeSQLite("select * from dataset order by age")),
+				["Paul", "Ed", "Carl"])
+
+	def test_changesToFilteredRecords(self):
+		ds = self.ds
+		ds._executeSQLite("select * from dataset")
+		filtered = ds.filter("age", 35, ">")
+		filtered.replace("age", 20, scope="name == 'Paul'")
+		# The source shares the changed record, so it must be re-populated, too.
+		self.assertEqual(self.names(ds._executeSQLite("select * from dataset order by age")),
+				["Paul", "Carl", "Ed"])
+
+	def test_expressions(self):
+		ds = self.ds
+		self.assertEqual(self.names(ds.filterByExpression("age > 35 and name != 'Ed'")), ["Paul"])
+		ds.replace("age", "=age + 1", scope="name.startswith('C')")
+		self.assertEqual([rec["age"] for rec in ds], [40, 50, 31])
+		ds.replace("age", "=age * 2")
+		self.assertEqual([rec["age"] for rec in ds], [80, 100, 62])
+		ds.replace("name", "Al", scope="age > 90")
+		self.assertEqual(self.names(ds), ["Paul", "Al", "Carl"])
+		# Each expression is compiled once per set of fields.
+		self.assertTrue(ds._compileExpression("age * 2") is ds._compileExpression("age * 2"))
+		self.assertEqual(ds._fldReplace("age > 50 and name_x == name"),
+				"rec['age'] > 50 and name_x == rec['name']")
+
+	def test_nonSelectStatement(self):
+		ds = self.ds
+		res = ds.execute("delete from dataset where age < 35")
+		self.assertEqual(self.names(res), ["Paul", "Ed"])
+		# The records themselves are unchanged, so the next query sees them all.
+		self.assertEqual(len(ds.execute("select * from dataset")), 3)
+
+	def test_joins(self):
+		ds = self.ds
+		other = dDataSet(({"name": "Paul", "city": "Hollister"},
+				{"name": "Ed", "city": "Rochester"}))
+		sql = "select dataset.name, city from dataset join other on dataset.name = other.name order by city"
+		self.assertEqual([rec["city"] for rec in ds.execute(sql, cursorDict={"other": other})],
+				["Hollister", "Rochester"])
+		other[0]["city"] = "Zion"
+		other._markChanged()
+		self.assertEqual([rec["city"] for rec in ds.execute(sql, cursorDict={"other": other})],
+				["Rochester", "Zion"])
+
+	def test_nativeQueries(self):
+		ds = dDataSet(({"name": "a", "age": 3}, {"name": "B", "age": None},
+				{"name": "c", "age": 2}, {"name": "b", "age": 2}, {"name": None, "age": -7}))
+		for sql, params in (("select * from dataset", ()),
+				("select name, Age*2 from dataset where age > ? order by name", (1,)),
+				("select age, count(*), min(name) as mn from dataset group by age", ()),
+				("select distinct age from dataset", ()),
+				("select name from dataset where name like 'B%' order by name desc", ()),
+				("select age/2, age%3, -age from dataset order by 1 desc", ()),
+				("select sum(age), total(age), avg(age), count(distinct age) from dataset", ()),
+				("select sum(age) from dataset where 1 = 0", ()),
+				("select * from dataset where age in (2, null) order by name collate nocase limit 1 offset 1", ()),
+				("select name from dataset where not (age = 2)", ()),
+				("select dataset.NAME from dataset where age between 1 and 3 order by age desc, name", ()),
+				("select upper(name) u, coalesce(age, 0) from dataset order by u", ()),
+				("select age, count(*) c from dataset group by age having count(*) > 1", ()),
+				("select name || '-' || age as x from dataset order by x", ())):
+			# The native engine must return what SQLite does.
+			native = dabo.db.dDataSetQuery.getQuery(sql).execute(ds, params)
+			self.assertEqual(native, list(ds._executeSQLite(sql, params)), sql)
+			self.assertEqual(list(ds.execute(sql, params)), native)
+
+		# Mixed types are compared the way SQLite does, or are left to SQLite.
+		ds = dDataSet(({"name": "Paul", "age": 40, "amt": Decimal("1.5")},
+				{"name": "Ed", "age": 50, "amt": Decimal("3")},
+				{"name": "Carl", "age": 30, "amt": Decimal("2.25")}))
+		for sql, params, isNative in (
+				("select name from dataset where age > '35'", (), True),
+				("select name from dataset where age = ?", ("40",), True),
+				("select name from dataset where '35' < age", (), True),
+				("select name from dataset where age in ('40', 30)", (), True),
+				("select name from dataset where age between '35' and 45", (), True),
+				("select name from dataset where name > 5", (), True),
+				("select name from dataset where amt = ?", (Decimal("2.25"),), True),
+				("select avg(amt), total(amt), sum(amt), min(amt), max(amt) from dataset", (), True),
+				("select amt * 2, -amt, abs(amt) from dataset", (), True),
+				("select name from dataset where age > name", (), False),
+				("select name * 2 from dataset", (), False),
+				("select sum(name) from dataset", (), False)):
+			expected = list(ds._executeSQLite(sql, params))
+			self.assertEqual(list(ds.execute(sql, params)), expected, sql)
+			query = dabo.db.dDataSetQuery.getQuery(sql)
+			if isNative:
+				self.assertEqual(query.execute(ds, params), expected, sql)
+			else:
+				self.assertRaises(dabo.db.dDataSetQuery.QueryNotSupported,
+						query.execute, ds, params)
+		self.assertEqual(type(ds.execute("select avg(amt) from dataset")[0]["avg(amt)"]), float)
+
+	def test_nativeFallback(self):
+		ds = self.ds
+		def runNative(sql):
+			return dabo.db.dDataSetQuery.getQuery(sql).execute(ds)
+		for sql in ("select name from dataset where substr(name, 1, 1) = 'P'",
+				"select * from dataset where unknown = 1",
+				"update dataset set age = 1"):
+			self.assertRaises(dabo.db.dDataSetQuery.QueryNotSupported, runNative, sql)
+		self.assertEqual(self.names(ds.execute(
+				"select name from dataset where substr(name, 1, 1) = 'P'")), ["Paul"])
+		# Queries against an empty data set return nothing.
+		self.assertEqual(dDataSet().execute("select * from dataset"), None)
+
+
+if __name__ == "__main__":
+	suite = unittest.TestLoader().loadTestsFromTestCase(Test_dDataSet)
+	unittest.TextTestRunner(verbosity=2).run(suite)
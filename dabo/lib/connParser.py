@@ -26,6 +26,11 @@ class connHandler(xml.sax.ContentHandler):
 				"password" : "",
 				"port" : "",
 				"KeepAliveInterval": "",
+				"MinPoolSize": "",
+				"MaxPoolSize": "",
+				"PoolTimeout": "",
+				"QueryCacheSize": "",
+				"QueryCacheTTL": "",
 				}
 		self.currDict = self.blankConn.copy()
 		self.element = None
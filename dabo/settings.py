@@ -249,6 +249,11 @@ localizeDabo = True
 # values to Decimal automatically?
 convertFloatToDecimal = True
 
+# How many seconds do backends cache table schema information (field lists,
+# structure descriptions)? None caches it until it's explicitly cleared, and
+# 0 turns off the cache.
+schemaCacheTTL = None
+
 ### Settings - end
 
 